@@ -1,15 +1,9 @@
+from functools import partial
+
 import streamlit as st
-from datetime import datetime
 
 from utils import local_css
-from painel import render_painel
-from streak import render_streak
-from dialogs import dialog_study_record
-from auth import render_auth_gate, logout
-from day_studies import render_day_studies
-from weekly_goal import render_weekly_goal
-from weekly_study import render_weekly_study
-from db import get_study_records_by_user, delete_study_record
+from auth import render_auth_gate, logout, get_current_user_created_date
 
 
 st.set_page_config(
@@ -26,6 +20,22 @@ local_css()
 if not render_auth_gate():
     st.stop()
 
+# Componentes da home só depois do login: a tela de login não carrega os gráficos
+# (plotly). Nos reruns seguintes os módulos já estão em sys.modules.
+from painel import render_painel  # noqa: E402
+from streak import render_streak  # noqa: E402
+from dialogs import dialog_study_record  # noqa: E402
+from day_studies import render_day_studies, resolve_selected_day  # noqa: E402
+from weekly_goal import render_weekly_goal  # noqa: E402
+from weekly_study import render_weekly_study, resolve_week_start  # noqa: E402
+from records import render_records, records_page_args  # noqa: E402
+from db import get_dashboard_snapshot, get_disciplinas_drilldown, get_study_records_page  # noqa: E402
+from prefetch import prefetch  # noqa: E402
+from profiler import start_profile  # noqa: E402
+
+# ?profile=1 ou PROFILE_RENDER=1: tempo, banco e elementos por componente (ver profiler.py)
+profile = start_profile()
+
 # ----------------- CONTEÚDO PRIVADO -----------------
 user = st.session_state.get("user")
 
@@ -51,8 +61,29 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# ===== Dados da home: leituras independentes em paralelo, antes de desenhar =====
+# (snapshot = uma ida ao banco para os cards; registros e detalhamento à parte)
+created_date = get_current_user_created_date()
+records_args = records_page_args(user["id"])
+with profile.section("prefetch"):
+    data = prefetch({
+        "snapshot": partial(
+            get_dashboard_snapshot,
+            user["id"],
+            selected_day=resolve_selected_day(created_date),
+            week_start=resolve_week_start(created_date),
+        ),
+        "records": partial(get_study_records_page, **records_args),
+        "drilldown": (
+            partial(get_disciplinas_drilldown, user["id"])
+            if st.session_state.get("painel-detalhar") else None
+        ),
+    })
+snapshot = data["snapshot"]
+
 # ===== Linha 01 (100%): CONSTÂNCIA NOS ESTUDOS =====
-render_streak()
+with profile.section("render_streak"):
+    render_streak(snapshot)
 
 # ===== Grade principal (2 "linhas" conceituais) =====
 # Esquerda (larga) = PAINEL (ocupa "linhas" 1 e 2)
@@ -62,64 +93,27 @@ col_left, col_mid, col_right = st.columns([2.1, 1.9, 1])
 
 with col_left:
     # PAINEL ocupa toda a altura da coluna esquerda
-    render_painel()
+    with profile.section("render_painel"):
+        render_painel(snapshot, drilldown=data["drilldown"])
 
 with col_mid:
     # Linha "de cima" da coluna do meio
-    render_weekly_goal()
+    with profile.section("render_weekly_goal"):
+        render_weekly_goal(snapshot)
     # Linha "de baixo" da coluna do meio
-    render_weekly_study()
+    with profile.section("render_weekly_study"):
+        render_weekly_study(snapshot)
 
 with col_right:
     # Ocupa a coluna direita inteira
-    render_day_studies()
+    with profile.section("render_day_studies"):
+        render_day_studies(snapshot)
 
 # ===== Registros de estudo =====
 st.markdown("---")
 st.subheader("Meus Registros de Estudo")
 
-if user:
-    records = get_study_records_by_user(user["id"])
-    if not records:
-        st.info("Nenhum registro encontrado.")
-    else:
-        for r in records:
-            # formata data
-            try:
-                dt_br = datetime.strptime(r["study_date"], "%Y-%m-%d").strftime("%d/%m/%Y")
-            except Exception:
-                dt_br = r["study_date"]
-            header = f"{dt_br} - {r.get('category','')}: {r.get('subject','')}"
-
-            # Cabeçalho com expander + botão lixeira alinhado à direita
-            head_left, head_right = st.columns([29, 1])
-            with head_left:
-                exp = st.expander(header)
-            with head_right:
-                if st.button("🗑️", key=f"delete-{r['id']}"):
-                    ok = delete_study_record(r["id"], user["id"])
-                    if ok:
-                        st.toast("Registro excluído com sucesso.")
-                        st.rerun()
-                    else:
-                        st.error("Não foi possível excluir este registro.")
-
-            # Conteúdo dentro do expander
-            with exp:
-                dur_h = r["duration_sec"] // 3600
-                dur_m = (r["duration_sec"] % 3600) // 60
-                st.write(f"**Duração:** {dur_h}h {dur_m}min")
-
-                if (r.get("topic") or "").strip():
-                    st.write(f"**Conteúdo:** {r['topic']}")
-
-                if (r.get("hits") or 0) > 0 or (r.get("mistakes") or 0) > 0:
-                    st.write(f"**Questões:** {r.get('hits') or 0} acertos / {r.get('mistakes') or 0} erros")
-
-                if r.get("page_start") or r.get("page_end"):
-                    st.write(f"**Páginas:** {r.get('page_start') or '-'} até {r.get('page_end') or '-'}")
-
-                if (r.get("comment") or "").strip():
-                    st.write(f"**Comentário:** {r['comment']}")
-
-                st.caption(f"Salvo em {r['created_at']}")
+with profile.section("render_records"):
+    render_records(snapshot, prefetched={"args": records_args, "page": data["records"]})
+
+profile.finish(user["id"])
@@ -1,8 +1,9 @@
 # auth.py
+import datetime as dt
 import streamlit as st
 import bcrypt
 from typing import Optional, Dict, Any
-from db import init_db, get_user_by_email, create_user
+from db import ensure_schema, get_user_by_email, create_user, get_user_created_date
 
 # -------------- Helpers de segurança --------------
 
@@ -21,13 +22,29 @@ def get_current_user() -> Optional[Dict[str, Any]]:
     return st.session_state.get("user")
 
 def set_current_user(user: Dict[str, Any]) -> None:
+    created_at = user.get("created_at")
     st.session_state["user"] = {
         "id": user["id"],
         "first_name": user["first_name"],
         "last_name": user["last_name"],
         "email": user["email"],
+        # 'YYYY-MM-DD' — evita reconsultar o banco a cada rerun
+        "created_date": str(created_at)[:10] if created_at else None,
     }
 
+def get_current_user_created_date() -> Optional[dt.date]:
+    """Data de criação da conta do usuário logado (guardada na sessão)."""
+    user = get_current_user()
+    if not user:
+        return None
+    if not user.get("created_date"):
+        # sessões abertas antes de guardarmos a data: busca uma única vez
+        user["created_date"] = get_user_created_date(user["id"])
+    try:
+        return dt.datetime.strptime(user["created_date"], "%Y-%m-%d").date()
+    except Exception:
+        return None
+
 def logout():
     st.session_state.pop("user", None)
     st.toast("Você saiu da conta.")
@@ -101,7 +118,7 @@ def render_auth_gate() -> bool:
     Renderiza a tela de login/cadastro se não houver usuário logado.
     Retorna True se o usuário está autenticado; False caso contrário.
     """
-    init_db()  # garante a tabela
+    ensure_schema()  # DDL só na primeira vez do processo; depois é no-op
 
     user = get_current_user()
     if user:
@@ -0,0 +1,354 @@
+# bench.py — benchmark das funções do db.py com dados sintéticos
+#
+#   python bench.py seed --users 20 --records 5000          # popula o banco do DATABASE_URL
+#   python bench.py run                                     # 100, 1k, 10k e 100k registros/usuário
+#   python bench.py run --sizes 100,1000 --repeat 10
+#   python bench.py run --url postgresql+psycopg://localhost/estudos_bench
+#
+# O banco é o do DATABASE_URL (ou --url), como no app: rode uma vez com o SQLite e
+# outra com um PostgreSQL local; os resultados são acrescentados a bench_output.txt
+# no mesmo formato (uma linha por banco × tamanho × função) para comparar lado a lado.
+#
+# Os dados seguem distribuições plausíveis de quem estuda para concurso: poucas
+# disciplinas concentram a maior parte do tempo, questões só em algumas categorias,
+# mais estudo em dia útil e duração com cauda longa. Gerador determinístico (--seed).
+#
+# O cache de leituras (query_cache) é desligado: cada chamada vai ao banco.
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_output.txt")
+
+# (disciplina, peso, conteúdos típicos)
+SUBJECTS = [
+    ("Direito Constitucional", 16, ["Direitos fundamentais", "Controle de constitucionalidade", "Organização do Estado"]),
+    ("Direito Administrativo", 15, ["Licitações e contratos", "Atos administrativos", "Servidores públicos"]),
+    ("Língua Portuguesa", 13, ["Crase", "Concordância verbal", "Regência", "Interpretação de texto"]),
+    ("Raciocínio Lógico", 9, ["Proposições", "Análise combinatória", "Probabilidade"]),
+    ("Direito Penal", 8, ["Teoria do crime", "Crimes contra a administração", "Penas"]),
+    ("Direito Processual Penal", 6, ["Inquérito policial", "Prisões", "Provas"]),
+    ("Direito Civil", 6, ["Contratos", "Responsabilidade civil", "Obrigações"]),
+    ("Informática", 6, ["Redes", "Segurança da informação", "Planilhas"]),
+    ("Direito Tributário", 5, ["Tributos", "Crédito tributário", "Competência tributária"]),
+    ("Contabilidade", 4, ["Balanço patrimonial", "DRE", "Lançamentos"]),
+    ("Matemática Financeira", 4, ["Juros compostos", "Descontos", "Amortização"]),
+    ("Legislação Específica", 3, ["Regimento interno", "Estatuto"]),
+    ("Administração Pública", 3, ["Governança", "Gestão de pessoas"]),
+    ("Ética no Serviço Público", 2, ["Código de ética", "Improbidade"]),
+]
+# (categoria, peso); questões só em Questões (e às vezes Revisão)
+CATEGORY_WEIGHTS = [("Teoria", 35), ("Questões", 30), ("Revisão", 15), ("Leitura de Lei", 12), ("Jurisprudência", 8)]
+WEEKDAY_WEIGHTS = [1.0, 1.0, 0.95, 0.95, 0.85, 0.6, 0.45]  # segunda → domingo
+WRITE_TAG = "bench-write"  # comentário dos registros criados pelas escritas medidas (apagados no fim)
+
+
+# ------------------------------------------------------------------------------
+# Gerador
+# ------------------------------------------------------------------------------
+
+def _span_days(n_records: int) -> int:
+    """Histórico de ~4 registros por dia, entre 1 mês e 10 anos."""
+    return max(30, min(3650, n_records // 4))
+
+
+def generate_records(fake, rng: random.Random, n: int, start: dt.date, end: dt.date) -> List[Dict[str, Any]]:
+    """`n` registros entre `start` e `end` no formato de db.bulk_create_study_records."""
+    subjects = [s for s, _w, _t in SUBJECTS]
+    subject_w = [w for _s, w, _t in SUBJECTS]
+    topics = {s: t for s, _w, t in SUBJECTS}
+    categories = [c for c, _w in CATEGORY_WEIGHTS]
+    category_w = [w for _c, w in CATEGORY_WEIGHTS]
+
+    days = (end - start).days + 1
+    all_days = [start + dt.timedelta(days=i) for i in range(days)]
+    day_w = [WEEKDAY_WEIGHTS[d.weekday()] for d in all_days]
+
+    out = []
+    for study_date, subject, category in zip(
+        rng.choices(all_days, weights=day_w, k=n),
+        rng.choices(subjects, weights=subject_w, k=n),
+        rng.choices(categories, weights=category_w, k=n),
+    ):
+        minutes = min(240, max(5, int(rng.lognormvariate(math.log(40), 0.6))))
+        hits = mistakes = None
+        if category == "Questões" or (category == "Revisão" and rng.random() < 0.3):
+            total = rng.randint(10, 60)
+            hits = int(total * rng.betavariate(7, 3))
+            mistakes = total - hits
+        page_start = page_end = None
+        if category in ("Teoria", "Leitura de Lei") and rng.random() < 0.4:
+            page_start = rng.randint(1, 600)
+            page_end = page_start + rng.randint(2, 40)
+        out.append({
+            "study_date": study_date.isoformat(),
+            "category": category,
+            "subject": subject,
+            "topic": rng.choice(topics[subject]) if rng.random() < 0.85 else fake.sentence(nb_words=3).rstrip("."),
+            "duration_sec": minutes * 60,
+            "hits": hits,
+            "mistakes": mistakes,
+            "page_start": page_start,
+            "page_end": page_end,
+            "comment": fake.sentence(nb_words=8) if rng.random() < 0.3 else None,
+        })
+    return out
+
+
+def seed_user(db, fake, rng: random.Random, email: str, n_records: int, password_hash: bytes = b"bench") -> int:
+    """Cria um usuário com `n_records` registros; o cadastro fica no primeiro dia do histórico."""
+    from sqlalchemy import text
+
+    end = dt.date.today()
+    start = end - dt.timedelta(days=_span_days(n_records) - 1)
+    uid = db.create_user(fake.first_name(), fake.last_name(), email, password_hash)
+    with db.engine.begin() as conn:
+        conn.execute(text("UPDATE users SET created_at = :t WHERE id = :uid"),
+                     {"t": f"{start.isoformat()} 08:00:00", "uid": uid})
+    db.bulk_create_study_records(uid, generate_records(fake, rng, n_records, start, end), batch_size=5000)
+    db.insert_subject_colors(uid, {s: "#888888" for s, _w, _t in SUBJECTS[:5]})
+    db.upsert_weekly_goal(uid, rng.randint(10, 40), rng.randint(100, 600))
+    return uid
+
+
+def bench_user(db, fake, rng: random.Random, size: int) -> int:
+    """
+    Usuário fixo por tamanho (bench-<size>@bench.local), criado só na primeira vez.
+    Reaproveitado só se ainda tiver exatamente `size` registros (sobras de uma rodada
+    interrompida são limpas antes de conferir).
+    """
+    email = f"bench-{size}@bench.local"
+    user = db.get_user_by_email(email)
+    if user:
+        uid = int(user["id"])
+        n = _record_count(db, uid)
+        if n != size:
+            undo_writes(db, uid)
+            n = _record_count(db, uid)
+        if n != size:
+            sys.exit(f"{email} tem {n} registros, esperado {size}: use outro banco ou apague o usuário")
+        return uid
+    t = time.perf_counter()
+    uid = seed_user(db, fake, rng, email, size)
+    print(f"  semeado {email}: {size} registros em {time.perf_counter() - t:.1f}s", flush=True)
+    return uid
+
+
+# ------------------------------------------------------------------------------
+# Medição
+# ------------------------------------------------------------------------------
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    fn()  # aquecimento (conexão do pool, statement compilado)
+    out = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t) * 1000)
+    return out
+
+
+def _reads(db, uid: int, email: str) -> Dict[str, Callable[[], Any]]:
+    today = dt.date.today()
+    week_start = (today - dt.timedelta(days=6)).isoformat()
+    return {
+        "get_user_by_email": lambda: db.get_user_by_email(email),
+        "get_user_created_date": lambda: db.get_user_created_date(uid),
+        "get_user_stats": lambda: db.get_user_stats(uid),
+        "get_weekly_goal": lambda: db.get_weekly_goal(uid),
+        "get_subject_colors": lambda: db.get_subject_colors(uid),
+        "get_dashboard_snapshot": lambda: db.get_dashboard_snapshot(uid, today, week_start),
+        "get_presence_window": lambda: db.get_presence_window(uid, today),
+        "get_disciplinas_resumo": lambda: db.get_disciplinas_resumo(uid),
+        "get_disciplinas_drilldown": lambda: db.get_disciplinas_drilldown(uid),
+        "get_day_subject_breakdown": lambda: db.get_day_subject_breakdown(uid, today.isoformat()),
+        "get_total_minutes_by_date_range": lambda: db.get_total_minutes_by_date_range(uid, week_start, today.isoformat()),
+        "get_questions_breakdown_by_date_range": (
+            lambda: db.get_questions_breakdown_by_date_range(uid, week_start, today.isoformat())
+        ),
+        "get_study_records_page": lambda: db.get_study_records_page(uid, limit=20),
+        "get_study_records_page(search)": lambda: db.get_study_records_page(uid, limit=20, search="contratos"),
+        "get_study_records_by_user": lambda: db.get_study_records_by_user(uid),
+        "iter_study_records": lambda: sum(len(c) for c in db.iter_study_records(uid)),
+        "verify_daily_rollup(user)": lambda: db.verify_daily_rollup(uid),
+        "verify_user_stats(user)": lambda: db.verify_user_stats(uid),
+    }
+
+
+def _record_count(db, uid: int) -> int:
+    from sqlalchemy import text
+
+    with db.engine.connect() as conn:
+        return int(conn.execute(text("SELECT COUNT(*) FROM study_records WHERE user_id = :uid"),
+                                {"uid": uid}).scalar() or 0)
+
+
+def _tagged(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for r in records:
+        r["comment"] = WRITE_TAG
+    return records
+
+
+def _writes(db, fake, rng: random.Random, uid: int) -> Dict[str, Callable[[], Any]]:
+    """Escritas medidas; tudo o que criam leva WRITE_TAG / prefixo "Bench " e sai em undo_writes()."""
+    today = dt.date.today()
+
+    def create_delete():
+        r = _tagged(generate_records(fake, rng, 1, today, today))[0]
+        rid = db.create_study_record(uid, **r)
+        db.delete_study_record(rid, uid)
+
+    def new_colors():
+        db.insert_subject_colors(uid, {f"Bench {rng.random():.12f}": "#888888"})
+
+    # bulk: 100 registros no dia do cadastro (dentro do histórico, longe das sequências de hoje)
+    first_day = dt.date.fromisoformat(db.get_user_created_date(uid))
+    return {
+        "create_study_record+delete": create_delete,
+        "upsert_weekly_goal": lambda: db.upsert_weekly_goal(uid, rng.randint(10, 40), rng.randint(100, 600)),
+        "upsert_subject_color": lambda: db.upsert_subject_color(uid, SUBJECTS[0][0], f"#{rng.randrange(1 << 24):06X}"),
+        "insert_subject_colors": new_colors,
+        "bulk_create_study_records(100)": (
+            lambda: db.bulk_create_study_records(uid, _tagged(generate_records(fake, rng, 100, first_day, first_day)))
+        ),
+        "rebuild_user_stats(user)": lambda: db.rebuild_user_stats(uid),
+        "rebuild_daily_rollup(user)": lambda: db.rebuild_daily_rollup(uid),
+    }
+
+
+def seeded_settings(db, uid: int) -> Dict[str, Any]:
+    """Meta semanal e cor que os upserts medidos sobrescrevem (lidas antes, para undo_writes)."""
+    return {
+        "goal": db.get_weekly_goal(uid),
+        "color": db.get_subject_colors(uid).get(SUBJECTS[0][0]),
+    }
+
+
+def undo_writes(db, uid: int, settings: Dict[str, Any] | None = None) -> None:
+    """
+    Devolve o usuário de benchmark ao estado semeado: apaga o que _writes criou,
+    recalcula os agregados e, com `settings` (de seeded_settings), regrava a meta e a cor.
+    """
+    from sqlalchemy import text
+
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM study_records WHERE user_id = :uid AND comment = :tag"),
+                     {"uid": uid, "tag": WRITE_TAG})
+        conn.execute(text("DELETE FROM subject_colors WHERE user_id = :uid AND subject LIKE 'Bench %'"),
+                     {"uid": uid})
+    db.rebuild_daily_rollup(uid)
+    db.rebuild_user_stats(uid)
+    if settings and settings["goal"]:
+        db.upsert_weekly_goal(uid, settings["goal"]["target_hours"], settings["goal"]["target_questions"])
+    if settings and settings["color"]:
+        db.upsert_subject_color(uid, SUBJECTS[0][0], settings["color"])
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or "?"
+    except OSError:
+        return "?"
+
+
+def run(sizes: List[int], repeat: int, output: str, seed: int, only: List[str]) -> None:
+    import db
+    from faker import Faker
+
+    fake = Faker("pt_BR")
+    Faker.seed(seed)
+    rng = random.Random(seed)
+    db.init_db()
+
+    dialect = db.engine.dialect.name
+    header = (
+        f"# {dt.datetime.now():%Y-%m-%d %H:%M:%S}  banco={dialect}  perfil={db.get_pool_stats().get('profile')}"
+        f"  url={db.engine.url.render_as_string(hide_password=True)}  git={_git_rev()}  repeat={repeat}"
+    )
+    lines = [header, f"{'banco':<10} {'registros':>9}  {'função':<40} {'mediana ms':>11} {'p95 ms':>9} {'min ms':>9}"]
+    print(header, flush=True)
+
+    for size in sizes:
+        uid = bench_user(db, fake, rng, size)
+        email = f"bench-{size}@bench.local"
+        funcs = {**_reads(db, uid, email), **_writes(db, fake, rng, uid)}
+        settings = seeded_settings(db, uid)
+        try:
+            for name, fn in funcs.items():
+                if only and not any(o in name for o in only):
+                    continue
+                # escritas que crescem o histórico rodam menos vezes no tamanho maior
+                n = max(1, repeat // 5) if name.startswith("bulk_") and size >= 100_000 else repeat
+                ts = sorted(_time(fn, n))
+                p95 = ts[min(len(ts) - 1, math.ceil(0.95 * len(ts)) - 1)]
+                line = f"{dialect:<10} {size:>9}  {name:<40} {statistics.median(ts):>11.2f} {p95:>9.2f} {ts[0]:>9.2f}"
+                lines.append(line)
+                print(line, flush=True)
+        finally:
+            undo_writes(db, uid, settings)
+
+    with open(output, "a", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n\n")
+    print(f"resultados acrescentados a {output}")
+
+
+def seed(users: int, records: int, seed_value: int) -> None:
+    import db
+    from faker import Faker
+
+    fake = Faker("pt_BR")
+    Faker.seed(seed_value)
+    rng = random.Random(seed_value)
+    db.init_db()
+    for i in range(users):
+        # tamanhos variados em volta de --records (cauda longa, como contas reais)
+        n = max(1, int(records * rng.lognormvariate(0, 0.5)))
+        email = f"seed-{seed_value}-{i}-{fake.user_name()}@bench.local"
+        t = time.perf_counter()
+        seed_user(db, fake, rng, email, n)
+        print(f"{email}: {n} registros em {time.perf_counter() - t:.1f}s", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do db.py com dados sintéticos (Faker).")
+    parser.add_argument("--url", default=None, help="DATABASE_URL a usar (padrão: o do ambiente)")
+    parser.add_argument("--seed", type=int, default=42, help="semente do gerador")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_seed = sub.add_parser("seed", help="cria usuários com registros sintéticos")
+    p_seed.add_argument("--users", type=int, default=10)
+    p_seed.add_argument("--records", type=int, default=1000, help="registros por usuário (média)")
+
+    p_run = sub.add_parser("run", help="mede leituras e escritas em vários tamanhos")
+    p_run.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                       help="registros por usuário, separados por vírgula")
+    p_run.add_argument("--repeat", type=int, default=5)
+    p_run.add_argument("--output", default=OUTPUT)
+    p_run.add_argument("--only", default="", help="só funções cujo nome contém um destes trechos (vírgula)")
+    args = parser.parse_args()
+
+    # antes de importar o db: URL escolhida e cache de leituras desligado
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    os.environ["QUERY_CACHE_MAX_ENTRIES"] = "0"
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    if args.command == "seed":
+        seed(args.users, args.records, args.seed)
+    else:
+        sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+        only = [o.strip() for o in args.only.split(",") if o.strip()]
+        run(sizes, args.repeat, args.output, args.seed, only)
@@ -0,0 +1,69 @@
+# colors.py — cor de cada disciplina, igual em todos os componentes da home
+#
+# A cor nasce de um hash do nome (tom pastel estável) e é gravada em subject_colors
+# na primeira vez que a disciplina aparece, para que possa ser trocada depois.
+# O snapshot da home já traz as cores gravadas; aqui só entram as que faltam, num
+# único INSERT em lote. O mapa resolvido fica em memória por (usuário, versão de
+# dados): enquanto nada mudar, qualquer componente pega o mapa sem custo. São no
+# máximo _RESOLVED_MAX usuários (LRU), e o clear geral do query_cache limpa tudo.
+from __future__ import annotations
+
+import colorsys
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from db import insert_subject_colors
+from query_cache import data_version, on_clear
+
+_RESOLVED_MAX = 1024
+_resolved: "OrderedDict[int, tuple[int, dict[str, str]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+@on_clear
+def _clear_resolved() -> None:
+    with _lock:
+        _resolved.clear()
+
+
+@functools.lru_cache(maxsize=4096)
+def subject_to_color_hex(subject: str) -> str:
+    """Hash -> HSL -> cor PASTEL estável (#RRGGBB)."""
+    h = int(hashlib.md5(subject.strip().lower().encode("utf-8")).hexdigest(), 16)
+    hue = (h % 360) / 360.0
+    sat = 0.45
+    light = 0.78
+    r, g, b = colorsys.hls_to_rgb(hue, light, sat)
+    return f"#{int(r*255):02X}{int(g*255):02X}{int(b*255):02X}"
+
+
+def subject_color_map(user_id: int, snapshot: dict) -> dict[str, str]:
+    """
+    {disciplina: "#RRGGBB"} para todas as disciplinas do usuário (snapshot["disciplinas"]).
+    As que ainda não têm cor gravada são inseridas de uma vez.
+    """
+    uid = int(user_id)
+    with _lock:
+        cached = _resolved.get(uid)
+        if cached and cached[0] == data_version(uid):
+            _resolved.move_to_end(uid)
+            return cached[1]
+
+    colors = dict(snapshot["subject_colors"])
+    missing = {
+        d["subject"]: subject_to_color_hex(d["subject"])
+        for d in snapshot["disciplinas"]
+        if d["subject"] not in colors
+    }
+    if missing:
+        insert_subject_colors(uid, missing)  # invalida o cache do usuário (versão nova)
+        colors.update(missing)
+
+    with _lock:
+        _resolved[uid] = (data_version(uid), colors)
+        _resolved.move_to_end(uid)
+        while len(_resolved) > _RESOLVED_MAX:  # usuários sem acesso recente saem por LRU
+            _resolved.popitem(last=False)
+    return colors
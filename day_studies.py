@@ -1,20 +1,12 @@
 # day_studies.py
 import datetime as dt
-import hashlib
-import colorsys
 
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
-import plotly.graph_objects as go
 
 from auth import get_current_user
 from utils import fmt_horas
-from db import (
-    get_user_created_date,
-    get_day_subject_breakdown,
-    get_subject_colors,
-    upsert_subject_color,
-)
+from colors import subject_color_map
 
 MAX_ROWS = 5  # limite de matérias/linhas
 
@@ -23,52 +15,32 @@ def _clamp(date_val: dt.date, min_d: dt.date, max_d: dt.date) -> dt.date:
     return max(min_d, min(max_d, date_val))
 
 
-# --------- Geração determinística de cor (PASTEL) ----------
-def _subject_to_color_hex(subject: str) -> str:
-    """Hash -> HSL -> cor PASTEL estável (#RRGGBB)."""
-    h = int(hashlib.md5(subject.strip().lower().encode("utf-8")).hexdigest(), 16)
-    hue = (h % 360) / 360.0
-    sat = 0.45
-    light = 0.78
-    r, g, b = colorsys.hls_to_rgb(hue, light, sat)
-    return f"#{int(r*255):02X}{int(g*255):02X}{int(b*255):02X}"
+def resolve_selected_day(created: dt.date | None) -> dt.date:
+    """Dia exibido, já limitado entre a criação da conta e hoje."""
+    today = dt.date.today()
+    if "selected_day" not in st.session_state:
+        st.session_state.selected_day = today
 
+    # clamp sempre
+    st.session_state.selected_day = _clamp(
+        st.session_state.selected_day, created or today, today
+    )
+    return st.session_state.selected_day
 
-def _ensure_colors(user_id: int, subjects: list[str]) -> dict[str, str]:
-    """Garante que todas as matérias tenham cor no DB."""
-    existing = get_subject_colors(user_id)
-    for s in subjects:
-        if s not in existing:
-            hexc = _subject_to_color_hex(s)
-            upsert_subject_color(user_id, s, hexc)
-            existing[s] = hexc
-    return existing
 
+def render_day_studies(snapshot: dict):
+    import plotly.graph_objects as go  # pesado: só quando a home é desenhada
 
-def render_day_studies():
     user = get_current_user()
     today = dt.date.today()
 
-    created = None
-    if user:
-        created_str = get_user_created_date(user["id"])
-        if created_str:
-            try:
-                created = dt.datetime.strptime(created_str, "%Y-%m-%d").date()
-            except Exception:
-                created = None
+    created_str = snapshot["created_date"]
+    created = dt.datetime.strptime(created_str, "%Y-%m-%d").date() if created_str else None
 
     min_day = created or today
     max_day = today
 
-    if "selected_day" not in st.session_state:
-        st.session_state.selected_day = today
-
-    # clamp sempre
-    st.session_state.selected_day = _clamp(
-        st.session_state.selected_day, min_day, max_day
-    )
-    selected_day = st.session_state.selected_day
+    selected_day = resolve_selected_day(created)
 
     can_prev = selected_day > min_day
     can_next = selected_day < max_day
@@ -142,8 +114,7 @@ def render_day_studies():
             st.info("Entre na sua conta para ver seus estudos.")
             return
 
-        day_iso = selected_day.isoformat()
-        rows_db = get_day_subject_breakdown(user["id"], day_iso)
+        rows_db = snapshot["day_breakdown"]
 
         studied = sorted(
             [
@@ -160,7 +131,7 @@ def render_day_studies():
         if studied:
             subjects = [r["subject"] for r in studied]
             values_min = [max(1, r["minutes"]) for r in studied]
-            color_map = _ensure_colors(user["id"], subjects)
+            color_map = subject_color_map(user["id"], snapshot)
             colors = [color_map[s] for s in subjects]
 
             fig = go.Figure(
@@ -217,7 +188,6 @@ def render_day_studies():
         # ------- Lista sempre MAX_ROWS linhas -------
         rows_real = []
         if studied:
-            color_map = _ensure_colors(user["id"], [r["subject"] for r in studied])
             rows_real = [
                 {
                     "subject": r["subject"],
@@ -2,11 +2,23 @@
 from __future__ import annotations
 
 import os
-from typing import Optional, Dict, Any, List
+import re
+import threading
+import time
+from typing import Optional, Dict, Any, Iterator, List
 from datetime import datetime, date, timedelta
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import (
+    BigInteger, Column, Date, DateTime, ForeignKey, Integer, LargeBinary, MetaData,
+    Table, Text, and_, bindparam, delete, func, insert, select, text, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.types import TypeDecorator
+
+from db_engine import build_engine, dialect_capabilities, pool_stats, serialized_writes
+from query_cache import cached_read, invalidates_user
 
 # ------------------------------------------------------------------------------
 # Configuração da conexão
@@ -14,6 +26,9 @@ from sqlalchemy.engine import Engine
 #   Exemplo (Supabase Transaction Pooler, IPv4):
 #   postgresql+psycopg://<user>:<password>@aws-1-sa-east-1.pooler.supabase.com:6543/postgres
 # - Em desenvolvimento, cai para SQLite local.
+# - Pool, keepalive e prepared statements seguem o perfil do db_engine.py
+#   (DB_PROFILE; detectado pela URL quando ausente). No SQLite: WAL + PRAGMAs e
+#   todas as escritas numa única thread (decorador _serialized).
 # ------------------------------------------------------------------------------
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///studies.db")
@@ -22,7 +37,28 @@ DB_URL = os.getenv("DATABASE_URL", "sqlite:///studies.db")
 if DB_URL.startswith("postgresql://"):
     DB_URL = DB_URL.replace("postgresql://", "postgresql+psycopg://", 1)
 
-engine: Engine = create_engine(DB_URL, pool_pre_ping=True, future=True)
+engine: Engine = build_engine(DB_URL)
+
+# Métricas Prometheus por consulta (latência, linhas, erros, espera no pool) num
+# endpoint local; só com METRICS_PORT — sem ele o prometheus_client nem é importado.
+if os.getenv("METRICS_PORT"):
+    import metrics
+
+    metrics.instrument(engine)
+    metrics.serve(int(os.environ["METRICS_PORT"]))
+
+# Escritas: no SQLite passam pela fila do escritor único; no PostgreSQL, no-op.
+_serialized = serialized_writes(engine)
+
+# RETURNING / ON CONFLICT / DATE nativo: decidido uma vez, pela versão do driver
+_caps = dialect_capabilities(engine.dialect)
+if not _caps["on_conflict"]:
+    raise RuntimeError("SQLite >= 3.24 é necessário (INSERT ... ON CONFLICT)")
+
+
+def get_pool_stats() -> Dict[str, Any]:
+    """Perfil e ocupação do pool (checked out, overflow, espera no checkout)."""
+    return pool_stats(engine)
 
 
 def _is_sqlite() -> bool:
@@ -59,16 +95,118 @@ def _date_to_iso(v) -> Optional[str]:
 
 
 # ------------------------------------------------------------------------------
-# Criação de Schema
+# Criação de Schema (migrações versionadas)
+# - MIGRATIONS é a lista ordenada de passos; cada um tem DDL para SQLite e
+#   PostgreSQL. A versão aplicada fica em `schema_version` (uma linha por passo).
+# - Passos com "indexes" criam índices; no PostgreSQL usam
+#   CREATE INDEX CONCURRENTLY (fora de transação), sem travar escritas.
+# - init_db() aplica o que estiver pendente.
+# - ensure_schema() é o que a UI chama: roda init_db() no máximo uma vez por
+#   processo (e por banco); nos reruns seguintes é só um lookup em memória.
 # ------------------------------------------------------------------------------
 
-def init_db() -> None:
-    """
-    Cria as tabelas se não existirem.
-    Usa DDL específico para SQLite e PostgreSQL, garantindo portabilidade.
-    """
-    if _is_sqlite():
-        ddl = [
+_SCHEMA_VERSION_DDL = {
+    "sqlite": """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+    "postgresql": """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+}
+
+# Recalcula o rollup a partir de study_records (migração 3 e rebuild_daily_rollup)
+_ROLLUP_BACKFILL_SQL = """
+    INSERT INTO study_daily_rollup
+        (user_id, study_date, subject, total_sec, hits, mistakes, n_records)
+    SELECT
+        user_id, study_date, subject,
+        SUM(duration_sec), SUM(COALESCE(hits, 0)), SUM(COALESCE(mistakes, 0)), COUNT(*)
+    FROM study_records
+    {where}
+    GROUP BY user_id, study_date, subject
+"""
+
+# Numeração de dias para gaps-and-islands (ver _USER_STATS_SQL)
+_DAY_NUMBER = {
+    "sqlite": "CAST(julianday(study_date) AS INTEGER)",
+    "postgresql": "(study_date - DATE '2000-01-01')",
+}
+
+# Recalcula user_stats a partir do rollup (migração 6, rebuild_user_stats e as
+# escritas que mudam o conjunto de dias estudados). Dia de estudo = >= 1 minuto
+# no dia, a partir do cadastro (o mesmo critério da grade de constância).
+# Sequências de dias seguidos saem por gaps-and-islands: dentro de uma sequência
+# sem buracos, nº do dia - ROW_NUMBER() é constante.
+_USER_STATS_SELECT = """
+    WITH days AS (
+        SELECT user_id, study_date,
+               SUM(total_sec) AS total_sec, SUM(hits) AS hits,
+               SUM(mistakes) AS mistakes, SUM(n_records) AS n_records
+        FROM study_daily_rollup
+        {where}
+        GROUP BY user_id, study_date
+    ),
+    study_days AS (
+        SELECT d.user_id, d.study_date
+        FROM days d
+        JOIN users u ON u.id = d.user_id
+        WHERE d.total_sec >= 60 AND d.study_date >= DATE(u.created_at)
+    ),
+    islands AS (
+        SELECT user_id, study_date,
+               {day_number} - ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY study_date) AS grp
+        FROM study_days
+    ),
+    runs AS (
+        SELECT user_id, MIN(study_date) AS run_start, MAX(study_date) AS run_end, COUNT(*) AS run_len
+        FROM islands
+        GROUP BY user_id, grp
+    ),
+    latest AS (
+        SELECT user_id, run_start, run_end,
+               ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY run_end DESC) AS rn
+        FROM runs
+    ),
+    totals AS (
+        SELECT user_id, SUM(n_records) AS n_records, SUM(total_sec) AS total_sec,
+               SUM(hits) AS hits, SUM(mistakes) AS mistakes,
+               MIN(study_date) AS first_study_date, MAX(study_date) AS last_study_date
+        FROM days
+        GROUP BY user_id
+    )
+    SELECT t.user_id, t.n_records, t.total_sec, t.hits, t.mistakes,
+           t.first_study_date, t.last_study_date,
+           l.run_start AS streak_start, l.run_end AS streak_end,
+           COALESCE((SELECT MAX(r.run_len) FROM runs r WHERE r.user_id = t.user_id), 0) AS longest_streak
+    FROM totals t
+    LEFT JOIN latest l ON l.user_id = t.user_id AND l.rn = 1
+"""
+_USER_STATS_SQL = """
+    INSERT INTO user_stats
+        (user_id, n_records, total_sec, hits, mistakes, first_study_date, last_study_date,
+         streak_start, streak_end, longest_streak)
+""" + _USER_STATS_SELECT
+
+# tsvector da busca no PostgreSQL (trigger da migração 7 e o backfill dela)
+_PG_SEARCH_TSV = "to_tsvector('pt_unaccent', COALESCE({r}.topic, '') || ' ' || COALESCE({r}.comment, ''))"
+
+# linhas por transação nos backfills online (migrações com "backfill")
+_BACKFILL_BATCH = 5000
+
+# chave dos advisory locks (ver _pg_migration_lock) que serializam migrações entre processos
+_MIGRATION_LOCK_KEY = 872301
+
+MIGRATIONS: list[dict] = [
+    {
+        "version": 1,
+        "name": "tabelas base",
+        "sqlite": [
             """
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -116,10 +254,9 @@ def init_db() -> None:
                 FOREIGN KEY(user_id) REFERENCES users(id)
             );
             """,
-        ]
-    else:
+        ],
         # PostgreSQL (Supabase/Neon/etc.)
-        ddl = [
+        "postgresql": [
             """
             CREATE TABLE IF NOT EXISTS users (
                 id SERIAL PRIMARY KEY,
@@ -164,46 +301,499 @@ def init_db() -> None:
                 PRIMARY KEY (user_id, subject)
             );
             """,
-        ]
+        ],
+    },
+    {
+        "version": 2,
+        "name": "índices de study_records",
+        # (nome, tabela, colunas)
+        "indexes": [
+            ("ix_study_records_user_date", "study_records", "user_id, study_date"),
+            ("ix_study_records_user_subject", "study_records", "user_id, subject"),
+        ],
+    },
+    {
+        "version": 3,
+        "name": "rollup diário por disciplina",
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS study_daily_rollup (
+                user_id INTEGER NOT NULL,
+                study_date TEXT NOT NULL,           -- YYYY-MM-DD
+                subject TEXT NOT NULL,
+                total_sec INTEGER NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                mistakes INTEGER NOT NULL DEFAULT 0,
+                n_records INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, study_date, subject),
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            );
+            """,
+            "DELETE FROM study_daily_rollup;",
+            _ROLLUP_BACKFILL_SQL.format(where=""),
+        ],
+        "postgresql": [
+            """
+            CREATE TABLE IF NOT EXISTS study_daily_rollup (
+                user_id INTEGER NOT NULL REFERENCES users(id),
+                study_date DATE NOT NULL,
+                subject TEXT NOT NULL,
+                total_sec BIGINT NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                mistakes INTEGER NOT NULL DEFAULT 0,
+                n_records INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, study_date, subject)
+            );
+            """,
+            "DELETE FROM study_daily_rollup;",
+            _ROLLUP_BACKFILL_SQL.format(where=""),
+        ],
+    },
+    {
+        "version": 4,
+        "name": "índice para drill-down disciplina → categoria → conteúdo",
+        "indexes": [
+            ("ix_study_records_user_subject_cat_topic", "study_records", "user_id, subject, category, topic"),
+        ],
+    },
+    {
+        "version": 5,
+        "name": "índice da paginação por cursor de Meus Registros",
+        "indexes": [
+            ("ix_study_records_user_keyset", "study_records", "user_id, study_date, created_at, id"),
+        ],
+    },
+    {
+        "version": 6,
+        "name": "estatísticas por usuário (user_stats)",
+        "sqlite": [
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                n_records INTEGER NOT NULL DEFAULT 0,
+                total_sec INTEGER NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                mistakes INTEGER NOT NULL DEFAULT 0,
+                first_study_date TEXT,              -- YYYY-MM-DD
+                last_study_date TEXT,
+                streak_start TEXT,                  -- última sequência de dias seguidos
+                streak_end TEXT,
+                longest_streak INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            );
+            """,
+            "DELETE FROM user_stats;",
+            _USER_STATS_SQL.format(where="", day_number=_DAY_NUMBER["sqlite"]),
+        ],
+        "postgresql": [
+            """
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id),
+                n_records INTEGER NOT NULL DEFAULT 0,
+                total_sec BIGINT NOT NULL DEFAULT 0,
+                hits INTEGER NOT NULL DEFAULT 0,
+                mistakes INTEGER NOT NULL DEFAULT 0,
+                first_study_date DATE,
+                last_study_date DATE,
+                streak_start DATE,
+                streak_end DATE,
+                longest_streak INTEGER NOT NULL DEFAULT 0
+            );
+            """,
+            "DELETE FROM user_stats;",
+            _USER_STATS_SQL.format(where="", day_number=_DAY_NUMBER["postgresql"]),
+        ],
+    },
+    {
+        "version": 7,
+        "name": "busca textual em conteúdo e comentário",
+        # SQLite: FTS5 com conteúdo externo (study_records), mantido por triggers;
+        # remove_diacritics ignora acentos e o índice de prefixos acelera "estud*".
+        "sqlite": [
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS study_records_fts USING fts5(
+                topic, comment,
+                content='study_records', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS study_records_fts_ai AFTER INSERT ON study_records BEGIN
+                INSERT INTO study_records_fts (rowid, topic, comment)
+                VALUES (new.id, new.topic, new.comment);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS study_records_fts_ad AFTER DELETE ON study_records BEGIN
+                INSERT INTO study_records_fts (study_records_fts, rowid, topic, comment)
+                VALUES ('delete', old.id, old.topic, old.comment);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS study_records_fts_au AFTER UPDATE OF topic, comment ON study_records BEGIN
+                INSERT INTO study_records_fts (study_records_fts, rowid, topic, comment)
+                VALUES ('delete', old.id, old.topic, old.comment);
+                INSERT INTO study_records_fts (rowid, topic, comment)
+                VALUES (new.id, new.topic, new.comment);
+            END;
+            """,
+            "INSERT INTO study_records_fts (study_records_fts) VALUES ('rebuild');",
+        ],
+        # PostgreSQL: configuração portuguesa sem acentos e uma coluna tsvector mantida
+        # por trigger (INSERT/UPDATE/COPY); o GIN vem na versão 8. Uma coluna GENERATED
+        # ... STORED reescreveria a tabela inteira sob ACCESS EXCLUSIVE. Já ADD COLUMN
+        # anulável sem default só mexe no catálogo, e as linhas antigas são preenchidas
+        # depois, em lotes curtos por faixa de id (só locks de linha). Até o fim do
+        # backfill, registros antigos ainda não aparecem na busca.
+        "postgresql": [
+            "CREATE EXTENSION IF NOT EXISTS unaccent;",
+            """
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent') THEN
+                    CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese);
+                    ALTER TEXT SEARCH CONFIGURATION pt_unaccent
+                        ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+                END IF;
+            END
+            $$;
+            """,
+            "ALTER TABLE study_records ADD COLUMN IF NOT EXISTS search_tsv tsvector;",
+            f"""
+            CREATE OR REPLACE FUNCTION study_records_search_tsv() RETURNS trigger AS $$
+            BEGIN
+                NEW.search_tsv := {_PG_SEARCH_TSV.format(r="NEW")};
+                RETURN NEW;
+            END
+            $$ LANGUAGE plpgsql;
+            """,
+            "DROP TRIGGER IF EXISTS study_records_search_tsv ON study_records;",
+            """
+            CREATE TRIGGER study_records_search_tsv
+                BEFORE INSERT OR UPDATE OF topic, comment ON study_records
+                FOR EACH ROW EXECUTE FUNCTION study_records_search_tsv();
+            """,
+        ],
+        # (tabela, SET, filtro) — só no PostgreSQL, depois do DDL (ver _pg_backfill)
+        "backfill": [
+            ("study_records", f"search_tsv = {_PG_SEARCH_TSV.format(r='study_records')}", "search_tsv IS NULL"),
+        ],
+    },
+    {
+        "version": 8,
+        "name": "índice GIN da busca textual",
+        # (nome, tabela, colunas, método) — índices com método só existem no PostgreSQL
+        "indexes": [
+            ("ix_study_records_search", "study_records", "search_tsv", "gin"),
+        ],
+    },
+]
+
+SCHEMA_VERSION = max(m["version"] for m in MIGRATIONS)
+
+_schema_lock = threading.Lock()
+_schema_ready: set[str] = set()  # bancos (URL sem senha) já verificados neste processo
+
+
+def _schema_key() -> str:
+    return engine.url.render_as_string(hide_password=True)
+
+
+def _dialect_key() -> str:
+    return "sqlite" if _is_sqlite() else "postgresql"
+
+
+def get_schema_version() -> int:
+    """Versão gravada em `schema_version` (0 se a tabela ainda não existe)."""
+    try:
+        with engine.connect() as conn:
+            v = conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar()
+            return int(v or 0)
+    except DBAPIError:
+        return 0
+
+
+def _applied_versions(conn) -> set[int]:
+    return {int(v) for v in conn.execute(text("SELECT version FROM schema_version")).scalars()}
+
+
+def _record_version(conn, version: int) -> None:
+    conn.execute(text("""
+        INSERT INTO schema_version (version) VALUES (:v)
+        ON CONFLICT (version) DO NOTHING
+    """), {"v": int(version)})
+
+
+def _pg_create_index_concurrently(name: str, table: str, columns: str, method: str = "btree") -> None:
+    """
+    CREATE INDEX CONCURRENTLY não roda dentro de transação, então usa uma conexão
+    em AUTOCOMMIT. Se uma tentativa anterior falhou no meio, o índice fica INVALID
+    e o IF NOT EXISTS o ignoraria: nesse caso ele é removido e recriado. Só é seguro
+    sob o pg_advisory_lock de _apply_migration (senão o INVALID pode ser o build de
+    outro processo ainda rodando).
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(text("""
+            SELECT i.indisvalid
+            FROM pg_class c
+            JOIN pg_index i ON i.indexrelid = c.oid
+            WHERE c.relname = :name
+        """), {"name": name}).scalar()
+        if valid is False:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        if not valid:
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING {method} ({columns})"
+            ))
+
+
+def _pg_backfill(table: str, set_clause: str, where: str, batch: int = _BACKFILL_BATCH) -> None:
+    """
+    UPDATE em faixas de `batch` ids, cada uma na própria transação (AUTOCOMMIT):
+    nada de lock de tabela nem transação longa. `where` torna a retomada idempotente.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        lo, hi = conn.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).one()
+        if lo is None:
+            return
+        stmt = text(f"UPDATE {table} SET {set_clause} WHERE id > :lo AND id <= :hi AND {where}")
+        for start in range(int(lo) - 1, int(hi), batch):
+            conn.execute(stmt, {"lo": start, "hi": start + batch})
+
+
+def _pg_migration_lock(conn, session: bool = False) -> None:
+    """
+    Pega o lock de migrações (da transação, ou da sessão com `session=True`) tentando
+    em laço, nunca com a chamada bloqueante: um backend parado num SELECT bloqueante
+    segura um snapshot, e o CREATE INDEX CONCURRENTLY de quem tem o lock esperaria
+    por ele para sempre (um deadlock que o PostgreSQL não enxerga).
+    """
+    fn = "pg_try_advisory_lock" if session else "pg_try_advisory_xact_lock"
+    while not conn.execute(text(f"SELECT {fn}(:k)"), {"k": _MIGRATION_LOCK_KEY}).scalar():
+        time.sleep(0.2)
+
+
+def _apply_migration(m: dict) -> None:
+    dialect = _dialect_key()
+    backfill = m.get("backfill", []) if dialect == "postgresql" else []
+
+    if m.get("indexes") and dialect == "postgresql":
+        # Online: cada índice fora de transação; a versão é gravada no fim. Um índice
+        # INVALID também é o estado de um build em andamento em outro processo, então a
+        # migração inteira roda sob o lock de sessão (mesma chave das migrações de DDL):
+        # quem chega depois espera o build terminar e encontra a versão já gravada.
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+            _pg_migration_lock(lock_conn, session=True)
+            try:
+                if m["version"] in _applied_versions(lock_conn):
+                    return
+                for name, table, columns, *method in m["indexes"]:
+                    _pg_create_index_concurrently(name, table, columns, *method)
+                _record_version(lock_conn, m["version"])
+            finally:
+                lock_conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _MIGRATION_LOCK_KEY})
+        return
 
     with engine.begin() as conn:
-        for stmt in ddl:
+        if dialect == "postgresql":
+            # serializa migrações concorrentes (vários processos subindo juntos)
+            _pg_migration_lock(conn)
+            if m["version"] in _applied_versions(conn):
+                return
+        for stmt in m.get(dialect, []):
             conn.execute(text(stmt))
+        for name, table, columns, *method in m.get("indexes", []):
+            if method:  # GIN etc.: sem equivalente no SQLite
+                continue
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
+        if not backfill:
+            _record_version(conn, m["version"])
+            return
+
+    # DDL já visível (o trigger cobre as linhas novas): preenche as antigas e só então
+    # grava a versão; se cair no meio, a próxima subida refaz o DDL e retoma o backfill.
+    for table, set_clause, where in backfill:
+        _pg_backfill(table, set_clause, where)
+    with engine.begin() as conn:
+        _record_version(conn, m["version"])
+
+
+def ensure_schema() -> None:
+    """
+    Garante o schema uma única vez por processo/banco.
+    Só executa DDL se a versão gravada estiver atrás de SCHEMA_VERSION.
+    """
+    key = _schema_key()
+    if key in _schema_ready:
+        return
+    with _schema_lock:
+        if key in _schema_ready:
+            return
+        if get_schema_version() < SCHEMA_VERSION:
+            init_db()
+        _schema_ready.add(key)
+
+
+@_serialized
+def init_db() -> None:
+    """
+    Aplica, em ordem, as migrações ainda não registradas em `schema_version`.
+    Idempotente: pode ser chamada de novo sem efeito.
+    """
+    with engine.begin() as conn:
+        if not _is_sqlite():
+            _pg_migration_lock(conn)
+        conn.execute(text(_SCHEMA_VERSION_DDL[_dialect_key()]))
+        applied = _applied_versions(conn)
+
+    for m in sorted(MIGRATIONS, key=lambda m: m["version"]):
+        if m["version"] not in applied:
+            _apply_migration(m)
+
+
+# ------------------------------------------------------------------------------
+# Tabelas (SQLAlchemy Core)
+# - Espelho das migrações acima, usado para montar os INSERT/DELETE/upserts do
+#   caminho de escrita. As migrações continuam sendo a fonte do DDL.
+# - Os statements são montados uma vez (constantes de módulo); o SQLAlchemy
+#   guarda a versão compilada de cada um no cache do engine.
+# ------------------------------------------------------------------------------
+
+class IsoDate(TypeDecorator):
+    """DATE no PostgreSQL, TEXT 'YYYY-MM-DD' no SQLite; no Python é sempre a string ISO."""
+
+    impl = Date
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(Date() if dialect_capabilities(dialect)["native_date"] else Text())
+
+    def process_bind_param(self, value, dialect):
+        iso = _date_to_iso(value)
+        if iso is None or not dialect_capabilities(dialect)["native_date"]:
+            return iso
+        return date.fromisoformat(iso)
+
+    def process_result_value(self, value, dialect):
+        return _date_to_iso(value)
+
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("first_name", Text, nullable=False),
+    Column("last_name", Text, nullable=False),
+    Column("email", Text, nullable=False, unique=True),
+    Column("password_hash", LargeBinary, nullable=False),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+)
+
+study_records = Table(
+    "study_records", metadata,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("study_date", IsoDate, nullable=False),
+    Column("category", Text, nullable=False),
+    Column("subject", Text, nullable=False),
+    Column("topic", Text),
+    Column("duration_sec", Integer, nullable=False),
+    Column("hits", Integer),
+    Column("mistakes", Integer),
+    Column("page_start", Integer),
+    Column("page_end", Integer),
+    Column("comment", Text),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+)
+
+weekly_goals = Table(
+    "weekly_goals", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("target_hours", Integer, nullable=False, server_default="0"),
+    Column("target_questions", Integer, nullable=False, server_default="0"),
+    Column("updated_at", DateTime, server_default=func.current_timestamp()),
+)
+
+subject_colors = Table(
+    "subject_colors", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("subject", Text, primary_key=True),
+    Column("color_hex", Text, nullable=False),
+    Column("updated_at", DateTime, server_default=func.current_timestamp()),
+)
+
+study_daily_rollup = Table(
+    "study_daily_rollup", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("study_date", IsoDate, primary_key=True),
+    Column("subject", Text, primary_key=True),
+    Column("total_sec", BigInteger, nullable=False, server_default="0"),
+    Column("hits", Integer, nullable=False, server_default="0"),
+    Column("mistakes", Integer, nullable=False, server_default="0"),
+    Column("n_records", Integer, nullable=False, server_default="0"),
+)
+
+user_stats = Table(
+    "user_stats", metadata,
+    Column("user_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("n_records", Integer, nullable=False, server_default="0"),
+    Column("total_sec", BigInteger, nullable=False, server_default="0"),
+    Column("hits", Integer, nullable=False, server_default="0"),
+    Column("mistakes", Integer, nullable=False, server_default="0"),
+    Column("first_study_date", IsoDate),
+    Column("last_study_date", IsoDate),
+    Column("streak_start", IsoDate),
+    Column("streak_end", IsoDate),
+    Column("longest_streak", Integer, nullable=False, server_default="0"),
+)
+
+# INSERT ... ON CONFLICT do dialeto em uso (o construto genérico não tem upsert)
+_upsert_insert = sqlite.insert if _is_sqlite() else postgresql.insert
+
+# dialeto "puro", com parâmetros :nome, para renderizar statements uma única vez
+_RENDER_DIALECT = (sqlite.base.SQLiteDialect if _is_sqlite() else postgresql.base.PGDialect)(paramstyle="named")
+
+
+def _prerendered(stmt, columns: tuple[str, ...]):
+    """
+    Renderiza o construto uma vez e devolve um text() com os mesmos tipos nos binds.
+    Necessário para o ON CONFLICT: no SQLAlchemy 2.0 essa cláusula não entra no
+    cache de compilação e seria recompilada a cada execução.
+    """
+    compiled = stmt.compile(dialect=_RENDER_DIALECT, column_keys=list(columns))
+    return text(compiled.string).bindparams(
+        *[bindparam(name, type_=b.type) for name, b in compiled.binds.items()]
+    )
+
+
+def _insert_returning_id(table: Table):
+    """INSERT que devolve o id: RETURNING quando existe, senão o lastrowid do cursor."""
+    stmt = insert(table)
+    return stmt.returning(table.c.id) if _caps["returning"] else stmt
+
+
+def _inserted_id(result) -> int:
+    return int(result.scalar_one() if _caps["returning"] else result.lastrowid)
 
 
 # ------------------------------------------------------------------------------
 # Users
 # ------------------------------------------------------------------------------
 
+_INSERT_USER = _insert_returning_id(users)
+
+
+@_serialized
 def create_user(first_name: str, last_name: str, email: str, password_hash: bytes) -> int:
-    sql = text("""
-        INSERT INTO users (first_name, last_name, email, password_hash)
-        VALUES (:fn, :ln, :em, :ph)
-        RETURNING id
-    """)
-    try:
-        with engine.begin() as conn:
-            res = conn.execute(sql, {"fn": first_name.strip(), "ln": last_name.strip(),
-                                     "em": email.strip().lower(), "ph": password_hash})
-            row = res.mappings().fetchone()
-            if row and "id" in row:
-                return int(row["id"])
-    except Exception:
-        if _is_sqlite():
-            with engine.begin() as conn:
-                conn.execute(text("""
-                    INSERT INTO users (first_name, last_name, email, password_hash)
-                    VALUES (:fn, :ln, :em, :ph)
-                """), {"fn": first_name.strip(), "ln": last_name.strip(),
-                       "em": email.strip().lower(), "ph": password_hash})
-                rid = conn.execute(text("SELECT last_insert_rowid() AS id")).mappings().fetchone()
-                return int(rid["id"])
-        raise
-    # fallback
-    with engine.connect() as conn:
-        row = conn.execute(text("SELECT id FROM users WHERE email=:em"),
-                           {"em": email.strip().lower()}).mappings().fetchone()
-        return int(row["id"]) if row else 0
+    with engine.begin() as conn:
+        res = conn.execute(_INSERT_USER, {
+            "first_name": first_name.strip(),
+            "last_name": last_name.strip(),
+            "email": email.strip().lower(),
+            "password_hash": password_hash,
+        })
+        return _inserted_id(res)
 
 
 def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
@@ -213,6 +803,7 @@ def get_user_by_email(email: str) -> Optional[Dict[str, Any]]:
         return _row_to_dict(row)
 
 
+@cached_read
 def get_user_created_date(user_id: int) -> Optional[str]:
     with engine.connect() as conn:
         row = conn.execute(text(
@@ -225,6 +816,29 @@ def get_user_created_date(user_id: int) -> Optional[str]:
 # Study Records (CRUD + agregações)
 # ------------------------------------------------------------------------------
 
+def _record_params(user_id, study_date, category, subject, topic, duration_sec,
+                   hits, mistakes, page_start, page_end, comment) -> Dict[str, Any]:
+    """Normaliza os campos de um registro para os parâmetros do INSERT (chaves = colunas)."""
+    return {
+        "user_id": int(user_id),
+        "study_date": study_date,  # YYYY-MM-DD
+        "category": category.strip(),
+        "subject": subject.strip(),
+        "topic": (topic or "").strip() or None,
+        "duration_sec": int(duration_sec),
+        "hits": None if hits is None else int(hits),
+        "mistakes": None if mistakes is None else int(mistakes),
+        "page_start": None if page_start in (None, "") else int(page_start),
+        "page_end": None if page_end in (None, "") else int(page_end),
+        "comment": (comment or "").strip() or None,
+    }
+
+
+_INSERT_RECORD = _insert_returning_id(study_records)
+
+
+@invalidates_user
+@_serialized
 def create_study_record(
     user_id: int,
     study_date: str,
@@ -238,52 +852,438 @@ def create_study_record(
     page_end: Optional[int],
     comment: Optional[str],
 ) -> int:
-    sql = text("""
-        INSERT INTO study_records
-            (user_id, study_date, category, subject, topic, duration_sec, hits, mistakes, page_start, page_end, comment)
-        VALUES
-            (:uid, :sdate, :cat, :subj, :top, :dur, :hit, :mis, :pstart, :pend, :comm)
-        RETURNING id
+    params = _record_params(user_id, study_date, category, subject, topic, duration_sec,
+                            hits, mistakes, page_start, page_end, comment)
+    with engine.begin() as conn:
+        rid = _inserted_id(conn.execute(_INSERT_RECORD, params))
+        _apply_rollup_delta(conn, params["user_id"], params["study_date"], params["subject"],
+                            params["duration_sec"], params["hits"], params["mistakes"], 1)
+        _apply_stats_delta(conn, params["user_id"], params["study_date"],
+                           params["duration_sec"], params["hits"], params["mistakes"], 1)
+        return rid
+
+
+# o que o rollup precisa saber do registro apagado
+_DELETED_COLS = (
+    study_records.c.study_date, study_records.c.subject, study_records.c.duration_sec,
+    study_records.c.hits, study_records.c.mistakes,
+)
+_RECORD_OWNED = and_(
+    study_records.c.id == bindparam("rid"), study_records.c.user_id == bindparam("uid")
+)
+_DELETE_RECORD = delete(study_records).where(_RECORD_OWNED)
+_DELETE_RECORD_RETURNING = _DELETE_RECORD.returning(*_DELETED_COLS)
+_SELECT_FOR_DELETE = select(*_DELETED_COLS).where(_RECORD_OWNED)
+
+
+@invalidates_user
+@_serialized
+def delete_study_record(record_id: int, user_id: int) -> bool:
+    params = {"rid": int(record_id), "uid": int(user_id)}
+    with engine.begin() as conn:
+        if _caps["returning"]:
+            # DELETE ... RETURNING: apaga e devolve os valores numa ida só
+            row = conn.execute(_DELETE_RECORD_RETURNING, params).mappings().fetchone()
+            if not row:
+                return False
+        else:
+            row = conn.execute(_SELECT_FOR_DELETE, params).mappings().fetchone()
+            if not row:
+                return False
+            if (conn.execute(_DELETE_RECORD, params).rowcount or 0) == 0:
+                return False  # apagado por outra sessão entre o SELECT e o DELETE
+        _apply_rollup_delta(conn, user_id, row["study_date"], row["subject"],
+                            -int(row["duration_sec"] or 0), -int(row["hits"] or 0),
+                            -int(row["mistakes"] or 0), -1)
+        _apply_stats_delta(conn, user_id, row["study_date"], -int(row["duration_sec"] or 0),
+                           -int(row["hits"] or 0), -int(row["mistakes"] or 0), -1)
+        return True
+
+
+_RECORD_INSERT_COLUMNS = (
+    "user_id", "study_date", "category", "subject", "topic", "duration_sec",
+    "hits", "mistakes", "page_start", "page_end", "comment",
+)
+
+# sem RETURNING: com uma lista de parâmetros vira executemany no driver
+_RECORD_INSERT_MANY = insert(study_records)
+
+
+def _copy_records_pg(conn, batch: list[Dict[str, Any]]) -> None:
+    """COPY ... FROM STDIN pela conexão psycopg da transação corrente."""
+    raw = conn.connection.driver_connection
+    cols = ", ".join(_RECORD_INSERT_COLUMNS)
+    with raw.cursor() as cur:
+        with cur.copy(f"COPY study_records ({cols}) FROM STDIN") as copy:
+            for p in batch:
+                copy.write_row(tuple(p[k] for k in _RECORD_INSERT_COLUMNS))
+
+
+@_serialized
+def _write_record_batch(batch: list[Dict[str, Any]], deltas: list[Dict[str, Any]]) -> None:
+    # um lote por vez na fila do escritor: outras sessões escrevem entre os lotes
+    # e on_progress continua rodando na thread de quem chamou
+    with engine.begin() as conn:
+        if _is_sqlite():
+            conn.execute(_RECORD_INSERT_MANY, batch)
+        else:
+            _copy_records_pg(conn, batch)
+        conn.execute(_ROLLUP_UPSERT, deltas)
+        # o lote pode criar vários dias de uma vez: recalcula a linha do usuário uma vez só
+        for uid in {d["user_id"] for d in deltas}:
+            _refresh_user_stats(conn, uid)
+
+
+@invalidates_user
+def bulk_create_study_records(
+    user_id: int,
+    records: List[Dict[str, Any]],
+    batch_size: int = 2000,
+    on_progress=None,
+) -> int:
+    """
+    Importação em massa. `records` usa as mesmas chaves de create_study_record
+    (study_date, category, subject, topic, duration_sec, hits, mistakes, page_start,
+    page_end, comment) e já deve ter passado pela validação.
+    - Cada lote é UMA transação: COPY no PostgreSQL, executemany no SQLite,
+      mais o delta agregado do rollup diário (uma linha por dia/disciplina do lote).
+    - on_progress(inseridos, total) é chamado após cada lote.
+    Retorna o número de registros inseridos.
+    """
+    total = len(records)
+    done = 0
+    for start in range(0, total, batch_size):
+        batch = [
+            _record_params(
+                user_id, r["study_date"], r["category"], r["subject"], r.get("topic"),
+                r["duration_sec"], r.get("hits"), r.get("mistakes"),
+                r.get("page_start"), r.get("page_end"), r.get("comment"),
+            )
+            for r in records[start:start + batch_size]
+        ]
+
+        deltas: Dict[tuple, Dict[str, Any]] = {}
+        for p in batch:
+            d = deltas.setdefault((p["study_date"], p["subject"]), {
+                "user_id": p["user_id"], "study_date": p["study_date"], "subject": p["subject"],
+                "total_sec": 0, "hits": 0, "mistakes": 0, "n_records": 0,
+            })
+            d["total_sec"] += p["duration_sec"]
+            d["hits"] += p["hits"] or 0
+            d["mistakes"] += p["mistakes"] or 0
+            d["n_records"] += 1
+
+        _write_record_batch(batch, list(deltas.values()))
+        done += len(batch)
+        if on_progress:
+            on_progress(done, total)
+    return done
+
+
+# ------------------------------------------------------------------------------
+# Rollup diário (study_daily_rollup)
+# - Uma linha por (usuário, dia, disciplina) com as somas de study_records.
+# - Mantido na MESMA transação de create/delete_study_record, então as leituras
+#   agregadas não precisam mais varrer os registros brutos.
+# ------------------------------------------------------------------------------
+
+def _upsert_add(table: Table, keys: tuple[str, ...], sums: tuple[str, ...]):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE: soma os valores de `sums` aos existentes."""
+    stmt = _upsert_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[k] for k in keys],
+        set_={c: table.c[c] + stmt.excluded[c] for c in sums},
+    )
+    return _prerendered(stmt, keys + sums)
+
+
+_ROLLUP_UPSERT = _upsert_add(
+    study_daily_rollup, ("user_id", "study_date", "subject"),
+    ("total_sec", "hits", "mistakes", "n_records"),
+)
+
+_ROLLUP_PRUNE = delete(study_daily_rollup).where(
+    study_daily_rollup.c.user_id == bindparam("user_id"),
+    study_daily_rollup.c.study_date == bindparam("study_date"),
+    study_daily_rollup.c.subject == bindparam("subject"),
+    study_daily_rollup.c.n_records <= 0,
+)
+
+
+def _apply_rollup_delta(conn, user_id: int, study_date, subject: str,
+                        total_sec: int, hits: Optional[int], mistakes: Optional[int], n_records: int) -> None:
+    """Soma (ou subtrai, com valores negativos) um delta na linha do rollup."""
+    params = {
+        "user_id": int(user_id),
+        "study_date": study_date,
+        "subject": subject,
+        "total_sec": int(total_sec or 0),
+        "hits": int(hits or 0),
+        "mistakes": int(mistakes or 0),
+        "n_records": int(n_records),
+    }
+    conn.execute(_ROLLUP_UPSERT, params)
+    if n_records < 0:
+        conn.execute(_ROLLUP_PRUNE, params)
+
+
+@invalidates_user
+@_serialized
+def rebuild_daily_rollup(user_id: Optional[int] = None) -> int:
+    """Reconstrói o rollup a partir de study_records (tudo ou só um usuário). Retorna nº de linhas."""
+    where = "WHERE user_id = :uid" if user_id is not None else ""
+    params = {"uid": int(user_id)} if user_id is not None else {}
+    with engine.begin() as conn:
+        conn.execute(text(f"DELETE FROM study_daily_rollup {where}"), params)
+        conn.execute(text(_ROLLUP_BACKFILL_SQL.format(where=where)), params)
+        _rebuild_user_stats(conn, where, params)
+        return int(conn.execute(text(f"SELECT COUNT(*) FROM study_daily_rollup {where}"), params).scalar() or 0)
+
+
+def verify_daily_rollup(user_id: Optional[int] = None) -> list[dict]:
+    """
+    Compara o rollup com a agregação de study_records.
+    Retorna as divergências ("missing" = falta/errado no rollup, "stale" = sobra no rollup).
+    """
+    where = "WHERE user_id = :uid" if user_id is not None else ""
+    params = {"uid": int(user_id)} if user_id is not None else {}
+    sql = text(f"""
+        WITH agg AS (
+            SELECT user_id, study_date, subject,
+                   SUM(duration_sec) AS total_sec,
+                   SUM(COALESCE(hits, 0)) AS hits,
+                   SUM(COALESCE(mistakes, 0)) AS mistakes,
+                   COUNT(*) AS n_records
+            FROM study_records
+            {where}
+            GROUP BY user_id, study_date, subject
+        ),
+        roll AS (
+            SELECT user_id, study_date, subject, total_sec, hits, mistakes, n_records
+            FROM study_daily_rollup
+            {where}
+        )
+        SELECT 'missing' AS problem, a.* FROM (SELECT * FROM agg EXCEPT SELECT * FROM roll) a
+        UNION ALL
+        SELECT 'stale' AS problem, b.* FROM (SELECT * FROM roll EXCEPT SELECT * FROM agg) b
     """)
+    with engine.connect() as conn:
+        rows = conn.execute(sql, params).mappings().fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        d["study_date"] = _date_to_iso(d["study_date"])
+        out.append(d)
+    return out
+
+
+# ------------------------------------------------------------------------------
+# Estatísticas por usuário (user_stats)
+# - Uma linha por usuário: totais da vida, primeiro/último dia com registro e a
+#   última/maior sequência de dias seguidos estudando.
+# - Totais: delta somado na mesma transação de create/delete_study_record.
+# - Datas e sequências só mudam quando o conjunto de dias muda (o dia ganha ou
+#   perde o primeiro registro, ou cruza 1 minuto). Os casos comuns — estudar hoje
+#   (estende a última sequência ou abre outra), apagar o registro de hoje — são
+#   ajustados direto na linha; o resto (dias dentro ou antes de uma sequência,
+#   exclusões que partem uma sequência) recalcula a linha com _USER_STATS_SQL.
+# ------------------------------------------------------------------------------
+
+_STATS_UPSERT = _upsert_add(user_stats, ("user_id",), ("n_records", "total_sec", "hits", "mistakes"))
+
+_STATS_DELETE_USER = text("DELETE FROM user_stats WHERE user_id = :uid")
+_STATS_INSERT_USER = text(_USER_STATS_SQL.format(
+    where="WHERE user_id = :uid", day_number=_DAY_NUMBER[_dialect_key()],
+))
+
+_STATS_DAYS = select(
+    user_stats.c.first_study_date, user_stats.c.last_study_date,
+    user_stats.c.streak_start, user_stats.c.streak_end, user_stats.c.longest_streak,
+).where(user_stats.c.user_id == bindparam("user_id"))
+
+# totais somados como no _STATS_UPSERT; datas/sequências já calculadas (bindparams "new_<coluna>")
+_STATS_DAY_COLS = ("first_study_date", "last_study_date", "streak_start", "streak_end", "longest_streak")
+_STATS_UPDATE_DAYS = update(user_stats).where(user_stats.c.user_id == bindparam("uid")).values(
+    n_records=user_stats.c.n_records + bindparam("d_records"),
+    total_sec=user_stats.c.total_sec + bindparam("d_sec"),
+    hits=user_stats.c.hits + bindparam("d_hits"),
+    mistakes=user_stats.c.mistakes + bindparam("d_mistakes"),
+    **{c: bindparam(f"new_{c}") for c in _STATS_DAY_COLS},
+)
+
+_DAY_TOTALS = select(
+    func.coalesce(func.sum(study_daily_rollup.c.total_sec), 0),
+    func.coalesce(func.sum(study_daily_rollup.c.n_records), 0),
+).where(
+    study_daily_rollup.c.user_id == bindparam("user_id"),
+    study_daily_rollup.c.study_date == bindparam("study_date"),
+)
+
+
+def _refresh_user_stats(conn, user_id: int) -> None:
+    params = {"uid": int(user_id)}
+    conn.execute(_STATS_DELETE_USER, params)
+    conn.execute(_STATS_INSERT_USER, params)
+
+
+def _rebuild_user_stats(conn, where: str, params: dict) -> None:
+    conn.execute(text(f"DELETE FROM user_stats {where}"), params)
+    conn.execute(text(_USER_STATS_SQL.format(where=where, day_number=_DAY_NUMBER[_dialect_key()])), params)
+
+
+def _apply_stats_delta(conn, user_id: int, study_date, total_sec: int,
+                       hits: Optional[int], mistakes: Optional[int], n_records: int) -> None:
+    """Chamada logo após _apply_rollup_delta, na mesma transação e com o mesmo delta."""
     params = {
-        "uid": int(user_id),
-        "sdate": study_date,  # YYYY-MM-DD
-        "cat": category.strip(),
-        "subj": subject.strip(),
-        "top": (topic or "").strip() or None,
-        "dur": int(duration_sec),
-        "hit": None if hits is None else int(hits),
-        "mis": None if mistakes is None else int(mistakes),
-        "pstart": None if page_start in (None, "") else int(page_start),
-        "pend": None if page_end in (None, "") else int(page_end),
-        "comm": (comment or "").strip() or None,
+        "user_id": int(user_id),
+        "study_date": study_date,
+        "total_sec": int(total_sec or 0),
+        "hits": int(hits or 0),
+        "mistakes": int(mistakes or 0),
+        "n_records": int(n_records),
     }
-    try:
-        with engine.begin() as conn:
-            row = conn.execute(sql, params).mappings().fetchone()
-            return int(row["id"]) if row and "id" in row else 0
-    except Exception:
-        if _is_sqlite():
-            with engine.begin() as conn:
-                conn.execute(text("""
-                    INSERT INTO study_records
-                        (user_id, study_date, category, subject, topic, duration_sec, hits, mistakes, page_start, page_end, comment)
-                    VALUES
-                        (:uid, :sdate, :cat, :subj, :top, :dur, :hit, :mis, :pstart, :pend, :comm)
-                """), params)
-                rid = conn.execute(text("SELECT last_insert_rowid() AS id")).mappings().fetchone()
-                return int(rid["id"])
-        raise
+    sec_after, n_after = conn.execute(_DAY_TOTALS, params).one()
+    sec_before, n_before = sec_after - params["total_sec"], n_after - params["n_records"]
+    if (n_before > 0) == (n_after > 0) and (sec_before >= 60) == (sec_after >= 60):
+        conn.execute(_STATS_UPSERT, params)
+        return
+    row = conn.execute(_STATS_DAYS, params).mappings().fetchone()
+    days = _stats_days_after(row, _date_to_iso(study_date), n_before > 0, n_after > 0,
+                             sec_before >= 60, sec_after >= 60) if row else None
+    if days is None:
+        _refresh_user_stats(conn, user_id)
+        return
+    conn.execute(_STATS_UPDATE_DAYS, {
+        "uid": params["user_id"], "d_records": params["n_records"], "d_sec": params["total_sec"],
+        "d_hits": params["hits"], "d_mistakes": params["mistakes"],
+        **{f"new_{c}": days[c] for c in _STATS_DAY_COLS},
+    })
 
 
-def delete_study_record(record_id: int, user_id: int) -> bool:
+def _stats_days_after(row, day: str, had_records: bool, has_records: bool,
+                      was_study: bool, is_study: bool) -> Optional[Dict[str, Any]]:
+    """
+    Datas e sequências de user_stats depois que `day` entrou ou saiu do conjunto de
+    dias, sem recalcular; None quando só o recálculo completo acerta.
+    """
+    first, last = row["first_study_date"], row["last_study_date"]
+    start, end, longest = row["streak_start"], row["streak_end"], int(row["longest_streak"] or 0)
+
+    if has_records and not had_records:
+        first, last = min(first, day), max(last, day)
+    elif had_records and not has_records and day in (first, last):
+        return None  # o novo primeiro/último dia exige varrer o rollup
+
+    if is_study and not was_study:
+        if end is None or day <= end:
+            return None  # dentro/antes de uma sequência (pode unir duas) ou antes do cadastro
+        d = date.fromisoformat(day)
+        if d == date.fromisoformat(end) + timedelta(days=1):
+            end = day
+        else:
+            start = end = day
+        longest = max(longest, (d - date.fromisoformat(start)).days + 1)
+    elif was_study and not is_study:
+        # só tirar o último dia de uma sequência que não é a maior nem tem um dia só
+        if day != end or start == end:
+            return None
+        run = (date.fromisoformat(end) - date.fromisoformat(start)).days + 1
+        if run >= longest:
+            return None
+        end = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+
+    return {
+        "first_study_date": first, "last_study_date": last,
+        "streak_start": start, "streak_end": end, "longest_streak": longest,
+    }
+
+
+@invalidates_user
+@_serialized
+def rebuild_user_stats(user_id: Optional[int] = None) -> int:
+    """Recalcula user_stats a partir do rollup (tudo ou só um usuário). Retorna nº de linhas."""
+    where = "WHERE user_id = :uid" if user_id is not None else ""
+    params = {"uid": int(user_id)} if user_id is not None else {}
     with engine.begin() as conn:
-        res = conn.execute(text(
-            "DELETE FROM study_records WHERE id = :rid AND user_id = :uid"
-        ), {"rid": int(record_id), "uid": int(user_id)})
-        return (res.rowcount or 0) > 0
+        _rebuild_user_stats(conn, where, params)
+        return int(conn.execute(text(f"SELECT COUNT(*) FROM user_stats {where}"), params).scalar() or 0)
+
 
+def verify_user_stats(user_id: Optional[int] = None) -> list[dict]:
+    """
+    Compara user_stats com o recálculo completo (mesmo formato de verify_daily_rollup:
+    "missing" = falta/errado em user_stats, "stale" = sobra em user_stats).
+    """
+    where = "WHERE user_id = :uid" if user_id is not None else ""
+    params = {"uid": int(user_id)} if user_id is not None else {}
+    cols = (
+        "user_id, n_records, total_sec, hits, mistakes, first_study_date, last_study_date, "
+        "streak_start, streak_end, longest_streak"
+    )
+    expected = _USER_STATS_SELECT.format(where=where, day_number=_DAY_NUMBER[_dialect_key()])
+    sql = text(f"""
+        SELECT 'missing' AS problem, a.* FROM (
+            SELECT {cols} FROM ({expected}) e
+            EXCEPT SELECT {cols} FROM user_stats {where}
+        ) a
+        UNION ALL
+        SELECT 'stale' AS problem, b.* FROM (
+            SELECT {cols} FROM user_stats {where}
+            EXCEPT SELECT {cols} FROM ({expected}) e
+        ) b
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(sql, params).mappings().fetchall()
+    out = []
+    for r in rows:
+        d = dict(r)
+        for k in ("first_study_date", "last_study_date", "streak_start", "streak_end"):
+            d[k] = _date_to_iso(d[k])
+        out.append(d)
+    return out
+
+
+def _stats_dict(n_records, total_sec, hits, mistakes, first_day, last_day,
+                streak_start, streak_end, longest, today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Linha de user_stats pronta para a UI. A sequência atual é a última sequência
+    gravada, desde que ela inclua hoje (senão 0) — vale para qualquer dia sem reescrever a linha.
+    """
+    today = today or date.today()
+    start, end = _date_to_iso(streak_start), _date_to_iso(streak_end)
+    current = 0
+    if start and end and start <= today.isoformat() <= end:
+        current = (today - date.fromisoformat(start)).days + 1
+    return {
+        "n_records": int(n_records or 0),
+        "total_sec": int(total_sec or 0),
+        "hits": int(hits or 0),
+        "mistakes": int(mistakes or 0),
+        "first_study_date": _date_to_iso(first_day),
+        "last_study_date": _date_to_iso(last_day),
+        "current_streak": current,
+        "longest_streak": int(longest or 0),
+    }
+
+
+_EMPTY_STATS = _stats_dict(0, 0, 0, 0, None, None, None, None, 0)
+
+_SELECT_USER_STATS = select(user_stats).where(user_stats.c.user_id == bindparam("uid"))
+
+
+@cached_read
+def get_user_stats(user_id: int) -> Dict[str, Any]:
+    """Uma leitura por chave primária: totais, primeiro/último dia e sequências."""
+    with engine.connect() as conn:
+        r = conn.execute(_SELECT_USER_STATS, {"uid": int(user_id)}).mappings().fetchone()
+    if not r:
+        return dict(_EMPTY_STATS)
+    return _stats_dict(r["n_records"], r["total_sec"], r["hits"], r["mistakes"],
+                       r["first_study_date"], r["last_study_date"],
+                       r["streak_start"], r["streak_end"], r["longest_streak"])
 
+
+@cached_read
 def get_study_records_by_user(user_id: int) -> List[Dict[str, Any]]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
@@ -295,48 +1295,168 @@ def get_study_records_by_user(user_id: int) -> List[Dict[str, Any]]:
         return [dict(r) for r in rows]
 
 
-def get_study_presence_since_signup(user_id: int) -> list[dict]:
-    with engine.connect() as conn:
-        row = conn.execute(text(
-            "SELECT DATE(created_at) AS created_date FROM users WHERE id = :uid"
-        ), {"uid": int(user_id)}).mappings().fetchone()
-        if not row or not row["created_date"]:
-            return []
+_RECORD_COLUMNS = """
+    id, study_date, category, subject, topic, duration_sec, hits, mistakes,
+    page_start, page_end, comment, created_at
+"""
 
-        start_iso = _date_to_iso(row["created_date"])
-        start = datetime.strptime(start_iso, "%Y-%m-%d").date()
-        end = date.today()
+# Marcadores dos trechos encontrados em topic_hl/comment_hl (caracteres de
+# controle, que não aparecem em texto digitado); a UI escapa o texto e troca por <mark>.
+HL_START, HL_END = "\x02", "\x03"
 
-        q = text("""
-            SELECT study_date, COALESCE(SUM(duration_sec), 0) AS total_sec
-            FROM study_records
-            WHERE user_id = :uid
-              AND study_date BETWEEN :start AND :end
-            GROUP BY study_date
+_SEARCH_MAX_TERMS = 8
+
+
+def _search_terms(search: Optional[str]) -> list[str]:
+    """Palavras da busca (só letras/dígitos), cada uma usada como prefixo."""
+    return re.findall(r"\w+", search or "")[:_SEARCH_MAX_TERMS]
+
+
+def normalize_search(search: Optional[str]) -> Optional[str]:
+    """
+    A busca como get_study_records_page a enxerga (mesmas palavras, separadas por
+    espaço), ou None sem nenhuma — "licitações!" e " licitações" viram a mesma chave.
+    """
+    return " ".join(_search_terms(search)) or None
+
+
+def _search_query(terms: list[str]) -> str:
+    """Todas as palavras, como prefixo: FTS5 `"estud"* "lei"*`, tsquery `estud:* & lei:*`."""
+    if _is_sqlite():
+        return " ".join(f'"{t}"*' for t in terms)
+    return " & ".join(f"{t}:*" for t in terms)
+
+
+def _search_page_sql(where: str) -> str:
+    """Página da busca com os trechos destacados (só para as linhas da página)."""
+    if _is_sqlite():
+        return f"""
+            SELECT r.id, r.study_date, r.category, r.subject, r.topic, r.duration_sec, r.hits,
+                   r.mistakes, r.page_start, r.page_end, r.comment, r.created_at,
+                   highlight(study_records_fts, 0, :hl_start, :hl_end) AS topic_hl,
+                   highlight(study_records_fts, 1, :hl_start, :hl_end) AS comment_hl
+            FROM study_records_fts
+            CROSS JOIN study_records r  -- CROSS JOIN fixa a ordem: o FTS dirige, r por rowid
+            WHERE study_records_fts MATCH :q AND r.id = study_records_fts.rowid AND {where}
+            ORDER BY r.study_date DESC, r.created_at DESC, r.id DESC
+            LIMIT :lim
+        """
+    # ts_headline é caro: roda depois do LIMIT, só nas linhas da página
+    return f"""
+        SELECT p.*,
+               ts_headline('pt_unaccent', COALESCE(p.topic, ''), p.tsq, :hl_opts) AS topic_hl,
+               ts_headline('pt_unaccent', COALESCE(p.comment, ''), p.tsq, :hl_opts) AS comment_hl
+        FROM (
+            SELECT r.id, r.study_date, r.category, r.subject, r.topic, r.duration_sec, r.hits,
+                   r.mistakes, r.page_start, r.page_end, r.comment, r.created_at, q.tsq
+            FROM study_records r, to_tsquery('pt_unaccent', :q) AS q(tsq)
+            WHERE r.search_tsv @@ q.tsq AND {where}
+            ORDER BY r.study_date DESC, r.created_at DESC, r.id DESC
+            LIMIT :lim
+        ) p
+        ORDER BY p.study_date DESC, p.created_at DESC, p.id DESC
+    """
+
+
+@cached_read
+def get_study_records_page(
+    user_id: int,
+    limit: int = 20,
+    cursor: Optional[tuple] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    subject: Optional[str] = None,
+    category: Optional[str] = None,
+    search: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Página de registros (mais recentes primeiro) com paginação por cursor (keyset).
+    - cursor: (study_date, created_at, id) do último registro da página anterior;
+      None = primeira página. O custo depende de `limit`, não do tamanho do histórico.
+    - Filtros opcionais: intervalo de datas (YYYY-MM-DD), disciplina e categoria.
+    - search: busca textual em conteúdo e comentário (todas as palavras, por prefixo,
+      sem diferenciar acentos) pelo índice FTS5/GIN; cada registro ganha topic_hl e
+      comment_hl com os trechos entre HL_START/HL_END.
+    Retorna {"records": [...], "next_cursor": tuple | None}.
+    """
+    conds = ["r.user_id = :uid"]
+    params: Dict[str, Any] = {"uid": int(user_id), "lim": int(limit) + 1}
+    if start_date:
+        conds.append("r.study_date >= :start")
+        params["start"] = _date_to_iso(start_date)
+    if end_date:
+        conds.append("r.study_date <= :end")
+        params["end"] = _date_to_iso(end_date)
+    if subject:
+        conds.append("r.subject = :subj")
+        params["subj"] = subject
+    if category:
+        conds.append("r.category = :cat")
+        params["cat"] = category
+    if cursor:
+        conds.append("(r.study_date, r.created_at, r.id) < (:c_date, :c_created, :c_id)")
+        params["c_date"], params["c_created"], params["c_id"] = cursor
+
+    terms = _search_terms(search)
+    if terms:
+        params["q"] = _search_query(terms)
+        if _is_sqlite():
+            params["hl_start"], params["hl_end"] = HL_START, HL_END
+        else:
+            params["hl_opts"] = f"StartSel={HL_START}, StopSel={HL_END}, HighlightAll=true"
+        sql = text(_search_page_sql(" AND ".join(conds)))
+    else:
+        sql = text(f"""
+            SELECT {_RECORD_COLUMNS}
+            FROM study_records r
+            WHERE {" AND ".join(conds)}
+            ORDER BY study_date DESC, created_at DESC, id DESC
+            LIMIT :lim
         """)
-        totals_rows = conn.execute(q, {
-            "uid": int(user_id),
-            "start": start.isoformat(),
-            "end": end.isoformat()
-        }).mappings().fetchall()
+    with engine.connect() as conn:
+        rows = [dict(r) for r in conn.execute(sql, params).mappings().fetchall()]
 
-        # 🔑 chaves SEMPRE string ISO
-        totals = {_date_to_iso(r["study_date"]): int((r["total_sec"] or 0) // 60) for r in totals_rows}
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = (last["study_date"], last["created_at"], last["id"])
+    for r in rows:
+        r["study_date"] = _date_to_iso(r["study_date"])
+        r.pop("tsq", None)
+    return {"records": rows, "next_cursor": next_cursor}
 
-    days = (end - start).days + 1
-    out = []
-    for i in range(days):
-        d = (start + timedelta(days=i)).isoformat()
-        mins = totals.get(d, 0)
-        out.append({"date": d, "minutes": mins, "has_study": mins > 0})
-    return out
+
+def iter_study_records(user_id: int, chunk_size: int = 5000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Todos os registros do usuário em blocos de até `chunk_size` linhas, sem carregar
+    o histórico inteiro: no PostgreSQL usa cursor do lado do servidor
+    (stream_results/yield_per); no SQLite o cursor já é incremental.
+    Sem cache: é pensado para exportação.
+    """
+    sql = text(f"""
+        SELECT {_RECORD_COLUMNS}
+        FROM study_records
+        WHERE user_id = :uid
+        ORDER BY study_date, created_at, id
+    """)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(
+            sql, {"uid": int(user_id)}
+        )
+        for part in result.mappings().partitions(chunk_size):
+            chunk = [dict(r) for r in part]
+            for r in chunk:
+                r["study_date"] = _date_to_iso(r["study_date"])
+            yield chunk
 
 
+@cached_read
 def get_total_minutes_by_date_range(user_id: int, start_date: str, end_date: str) -> dict[str, int]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
-            SELECT study_date, COALESCE(SUM(duration_sec), 0) AS total_sec
-            FROM study_records
+            SELECT study_date, COALESCE(SUM(total_sec), 0) AS total_sec
+            FROM study_daily_rollup
             WHERE user_id = :uid
               AND study_date BETWEEN :start AND :end
             GROUP BY study_date
@@ -344,14 +1464,15 @@ def get_total_minutes_by_date_range(user_id: int, start_date: str, end_date: str
         return {_date_to_iso(r["study_date"]): int((r["total_sec"] or 0) // 60) for r in rows}
 
 
+@cached_read
 def get_questions_breakdown_by_date_range(user_id: int, start_date: str, end_date: str) -> dict[str, dict[str, int]]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
             SELECT
                 study_date,
-                COALESCE(SUM(COALESCE(hits, 0)), 0)      AS total_hits,
-                COALESCE(SUM(COALESCE(mistakes, 0)), 0)  AS total_mistakes
-            FROM study_records
+                COALESCE(SUM(hits), 0)      AS total_hits,
+                COALESCE(SUM(mistakes), 0)  AS total_mistakes
+            FROM study_daily_rollup
             WHERE user_id = :uid
               AND study_date BETWEEN :start AND :end
             GROUP BY study_date
@@ -366,55 +1487,136 @@ def get_questions_breakdown_by_date_range(user_id: int, start_date: str, end_dat
         return out
 
 
+@cached_read
 def get_day_subject_breakdown(user_id: int, day_iso: str) -> list[dict]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
-            SELECT subject, COALESCE(SUM(duration_sec), 0) AS total_sec
-            FROM study_records
+            SELECT subject, total_sec
+            FROM study_daily_rollup
             WHERE user_id = :uid AND study_date = :day
-            GROUP BY subject
             ORDER BY subject
         """), {"uid": int(user_id), "day": day_iso}).mappings().fetchall()
         return [{"subject": r["subject"], "total_sec": int(r["total_sec"] or 0)} for r in rows]
 
 
+@cached_read
 def get_disciplinas_resumo(user_id: int) -> list[dict]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
             SELECT 
                 subject,
-                COALESCE(SUM(duration_sec), 0)           AS total_sec,
-                COALESCE(SUM(COALESCE(hits,0)), 0)       AS total_hits,
-                COALESCE(SUM(COALESCE(mistakes,0)), 0)   AS total_mistakes
-            FROM study_records
+                COALESCE(SUM(total_sec), 0)   AS total_sec,
+                COALESCE(SUM(hits), 0)        AS total_hits,
+                COALESCE(SUM(mistakes), 0)    AS total_mistakes
+            FROM study_daily_rollup
             WHERE user_id = :uid
             GROUP BY subject
             ORDER BY subject
         """), {"uid": int(user_id)}).mappings().fetchall()
 
-    out = []
+    return [_resumo_row(r["subject"], r["total_sec"], r["total_hits"], r["total_mistakes"]) for r in rows]
+
+
+def _resumo_row(subject: str, total_sec, hits, mistakes) -> dict:
+    return {"subject": subject, **_totals(total_sec, hits, mistakes)}
+
+
+def _totals(total_sec, hits, mistakes) -> dict:
+    hits = int(hits or 0)
+    mistakes = int(mistakes or 0)
+    total_q = hits + mistakes
+    pct = int(hits * 100 / total_q) if total_q else 0
+    total_sec = int(total_sec or 0)
+    return {
+        "total_sec": total_sec,
+        "total_min": total_sec // 60,
+        "hits": hits,
+        "mistakes": mistakes,
+        "total": total_q,
+        "pct": pct,
+    }
+
+
+# Três níveis (disciplina, disciplina+categoria, disciplina+categoria+conteúdo)
+# numa única query. g_cat/g_top = 1 quando a coluna foi "enrolada" no nível.
+_DRILLDOWN_SQL_PG = text("""
+    SELECT
+        subject, category, topic,
+        GROUPING(category) AS g_cat,
+        GROUPING(topic)    AS g_top,
+        SUM(duration_sec)           AS total_sec,
+        SUM(COALESCE(hits, 0))      AS total_hits,
+        SUM(COALESCE(mistakes, 0))  AS total_mistakes
+    FROM study_records
+    WHERE user_id = :uid
+    GROUP BY subject, ROLLUP (category, topic)
+""")
+
+# SQLite não tem GROUPING SETS/ROLLUP: mesmos níveis via UNION ALL.
+_DRILLDOWN_SQL_SQLITE = text("""
+    SELECT subject, category, topic, 0 AS g_cat, 0 AS g_top,
+           SUM(duration_sec) AS total_sec,
+           SUM(COALESCE(hits, 0)) AS total_hits,
+           SUM(COALESCE(mistakes, 0)) AS total_mistakes
+    FROM study_records
+    WHERE user_id = :uid
+    GROUP BY subject, category, topic
+
+    UNION ALL
+    SELECT subject, category, NULL, 0, 1,
+           SUM(duration_sec), SUM(COALESCE(hits, 0)), SUM(COALESCE(mistakes, 0))
+    FROM study_records
+    WHERE user_id = :uid
+    GROUP BY subject, category
+
+    UNION ALL
+    SELECT subject, NULL, NULL, 1, 1,
+           SUM(duration_sec), SUM(COALESCE(hits, 0)), SUM(COALESCE(mistakes, 0))
+    FROM study_records
+    WHERE user_id = :uid
+    GROUP BY subject
+""")
+
+
+@cached_read
+def get_disciplinas_drilldown(user_id: int) -> list[dict]:
+    """
+    Árvore disciplina → categoria → conteúdo com os mesmos totais de get_disciplinas_resumo.
+    [{"subject", totais..., "categorias": [{"category", totais..., "topicos": [{"topic", totais...}]}]}]
+    Disciplinas em ordem alfabética; categorias e conteúdos por tempo (desc).
+    """
+    sql = _DRILLDOWN_SQL_SQLITE if _is_sqlite() else _DRILLDOWN_SQL_PG
+    with engine.connect() as conn:
+        rows = conn.execute(sql, {"uid": int(user_id)}).mappings().fetchall()
+
+    subjects: dict[str, dict] = {}
+    categories: dict[tuple[str, str], dict] = {}
+    topics: list[tuple[str, str, dict]] = []
     for r in rows:
-        hits = int(r["total_hits"] or 0)
-        mistakes = int(r["total_mistakes"] or 0)
-        total_q = hits + mistakes
-        pct = int(hits * 100 / total_q) if total_q else 0
-        total_sec = int(r["total_sec"] or 0)
-        out.append({
-            "subject": r["subject"],
-            "total_sec": total_sec,
-            "total_min": total_sec // 60,
-            "hits": hits,
-            "mistakes": mistakes,
-            "total": total_q,
-            "pct": pct,
-        })
-    return out
+        totals = _totals(r["total_sec"], r["total_hits"], r["total_mistakes"])
+        if r["g_cat"]:
+            subjects[r["subject"]] = {"subject": r["subject"], **totals, "categorias": []}
+        elif r["g_top"]:
+            categories[(r["subject"], r["category"])] = {"category": r["category"], **totals, "topicos": []}
+        else:
+            topics.append((r["subject"], r["category"], {"topic": r["topic"], **totals}))
+
+    for subj, cat, t in topics:
+        categories[(subj, cat)]["topicos"].append(t)
+    for (subj, _cat), c in categories.items():
+        c["topicos"].sort(key=lambda t: t["total_sec"], reverse=True)
+        subjects[subj]["categorias"].append(c)
+    for s in subjects.values():
+        s["categorias"].sort(key=lambda c: c["total_sec"], reverse=True)
+
+    return sorted(subjects.values(), key=lambda s: s["subject"])
 
 
 # ------------------------------------------------------------------------------
 # Weekly Goals
 # ------------------------------------------------------------------------------
 
+@cached_read
 def get_weekly_goal(user_id: int) -> Optional[Dict[str, int]]:
     with engine.connect() as conn:
         row = conn.execute(text("""
@@ -425,33 +1627,34 @@ def get_weekly_goal(user_id: int) -> Optional[Dict[str, int]]:
         return {"target_hours": int(row["target_hours"]), "target_questions": int(row["target_questions"])} if row else None
 
 
+def _upsert_replace(table: Table, keys: tuple[str, ...], cols: tuple[str, ...]):
+    """INSERT ... ON CONFLICT (keys) DO UPDATE: substitui `cols` e carimba updated_at."""
+    stmt = _upsert_insert(table)
+    set_ = {c: stmt.excluded[c] for c in cols}
+    set_["updated_at"] = func.current_timestamp()
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c[k] for k in keys], set_=set_)
+    return _prerendered(stmt, keys + cols)
+
+
+_UPSERT_WEEKLY_GOAL = _upsert_replace(weekly_goals, ("user_id",), ("target_hours", "target_questions"))
+
+
+@invalidates_user
+@_serialized
 def upsert_weekly_goal(user_id: int, target_hours: int, target_questions: int) -> None:
-    if _is_sqlite():
-        sql = text("""
-            INSERT INTO weekly_goals (user_id, target_hours, target_questions)
-            VALUES (:uid, :th, :tq)
-            ON CONFLICT(user_id) DO UPDATE SET
-                target_hours=excluded.target_hours,
-                target_questions=excluded.target_questions,
-                updated_at=CURRENT_TIMESTAMP
-        """)
-    else:
-        sql = text("""
-            INSERT INTO weekly_goals (user_id, target_hours, target_questions)
-            VALUES (:uid, :th, :tq)
-            ON CONFLICT (user_id) DO UPDATE SET
-                target_hours = EXCLUDED.target_hours,
-                target_questions = EXCLUDED.target_questions,
-                updated_at = CURRENT_TIMESTAMP
-        """)
     with engine.begin() as conn:
-        conn.execute(sql, {"uid": int(user_id), "th": int(target_hours), "tq": int(target_questions)})
+        conn.execute(_UPSERT_WEEKLY_GOAL, {
+            "user_id": int(user_id),
+            "target_hours": int(target_hours),
+            "target_questions": int(target_questions),
+        })
 
 
 # ------------------------------------------------------------------------------
 # Subject Colors (opcional, caso seu app use)
 # ------------------------------------------------------------------------------
 
+@cached_read
 def get_subject_colors(user_id: int) -> dict[str, str]:
     with engine.connect() as conn:
         rows = conn.execute(text("""
@@ -462,22 +1665,309 @@ def get_subject_colors(user_id: int) -> dict[str, str]:
         return {r["subject"]: r["color_hex"] for r in rows}
 
 
+_UPSERT_SUBJECT_COLOR = _upsert_replace(subject_colors, ("user_id", "subject"), ("color_hex",))
+
+
+@invalidates_user
+@_serialized
 def upsert_subject_color(user_id: int, subject: str, color_hex: str) -> None:
-    if _is_sqlite():
-        sql = text("""
-            INSERT INTO subject_colors (user_id, subject, color_hex)
-            VALUES (:uid, :subj, :hex)
-            ON CONFLICT(user_id, subject) DO UPDATE SET
-                color_hex=excluded.color_hex,
-                updated_at=CURRENT_TIMESTAMP
-        """)
-    else:
-        sql = text("""
-            INSERT INTO subject_colors (user_id, subject, color_hex)
-            VALUES (:uid, :subj, :hex)
-            ON CONFLICT (user_id, subject) DO UPDATE SET
-                color_hex = EXCLUDED.color_hex,
-                updated_at = CURRENT_TIMESTAMP
-        """)
     with engine.begin() as conn:
-        conn.execute(sql, {"uid": int(user_id), "subj": subject.strip(), "hex": color_hex.strip().upper()})
+        conn.execute(_UPSERT_SUBJECT_COLOR, {
+            "user_id": int(user_id),
+            "subject": subject.strip(),
+            "color_hex": color_hex.strip().upper(),
+        })
+
+
+@invalidates_user
+@_serialized
+def insert_subject_colors(user_id: int, colors: dict[str, str]) -> int:
+    """
+    Grava de uma vez as cores que ainda não existem (um INSERT de várias linhas com
+    ON CONFLICT DO NOTHING: não sobrescreve cor já escolhida). Retorna nº de linhas novas.
+    """
+    if not colors:
+        return 0
+    rows = [
+        {"user_id": int(user_id), "subject": s.strip(), "color_hex": c.strip().upper()}
+        for s, c in colors.items()
+    ]
+    stmt = _upsert_insert(subject_colors).values(rows).on_conflict_do_nothing(
+        index_elements=[subject_colors.c.user_id, subject_colors.c.subject]
+    )
+    with engine.begin() as conn:
+        return int(conn.execute(stmt).rowcount or 0)
+
+
+# ------------------------------------------------------------------------------
+# Dashboard (home) — tudo o que os render_* precisam em UMA ida ao banco
+# ------------------------------------------------------------------------------
+
+# Janela padrão da grade de constância (dias até hoje)
+PRESENCE_WINDOW_DAYS = 90
+
+# Cada bloco vira linhas marcadas por `kind`; colunas genéricas k1/k2 (texto) e
+# n1..n3 (números). UNION ALL funciona igual no SQLite e no PostgreSQL.
+# Os agregados vêm do rollup diário, não de study_records.
+# 'daily': só os dias que a home desenha — a janela recente (grade de constância e
+# semana atual) e a semana selecionada —, então o custo não cresce com a idade da conta.
+# 'stats'/'totals': a linha de user_stats (sequências e totais da vida).
+_SNAPSHOT_SQL = text("""
+    SELECT 'user' AS kind, CAST(DATE(created_at) AS TEXT) AS k1, NULL AS k2,
+           NULL AS n1, NULL AS n2, NULL AS n3
+    FROM users
+    WHERE id = :uid
+
+    UNION ALL
+    SELECT 'goal', NULL, NULL, target_hours, target_questions, NULL
+    FROM weekly_goals
+    WHERE user_id = :uid
+
+    UNION ALL
+    SELECT 'color', subject, color_hex, NULL, NULL, NULL
+    FROM subject_colors
+    WHERE user_id = :uid
+
+    UNION ALL
+    SELECT 'daily', CAST(study_date AS TEXT), NULL, SUM(total_sec), SUM(hits), SUM(mistakes)
+    FROM study_daily_rollup
+    WHERE user_id = :uid
+      AND (study_date BETWEEN :recent_start AND :recent_end
+           OR study_date BETWEEN :week_start AND :week_end)
+    GROUP BY study_date
+
+    UNION ALL
+    SELECT 'subject', subject, NULL, SUM(total_sec), SUM(hits), SUM(mistakes)
+    FROM study_daily_rollup
+    WHERE user_id = :uid
+    GROUP BY subject
+
+    UNION ALL
+    SELECT 'day', subject, NULL, total_sec, NULL, NULL
+    FROM study_daily_rollup
+    WHERE user_id = :uid AND study_date = :day
+
+    UNION ALL
+    SELECT 'stats', CAST(streak_start AS TEXT), CAST(streak_end AS TEXT), longest_streak, n_records, NULL
+    FROM user_stats
+    WHERE user_id = :uid
+
+    UNION ALL
+    SELECT 'totals', CAST(first_study_date AS TEXT), CAST(last_study_date AS TEXT), total_sec, hits, mistakes
+    FROM user_stats
+    WHERE user_id = :uid
+""")
+
+
+def _presence_bitmap(start: date, days: int, study_days) -> bytes:
+    """Bit i (LSB primeiro em cada byte) = estudou em start + i. Só toca os dias estudados."""
+    bits = bytearray((days + 7) // 8)
+    start_iso = start.isoformat()
+    end_iso = (start + timedelta(days=days - 1)).isoformat()
+    for iso in study_days:
+        if start_iso <= iso <= end_iso:
+            i = (date.fromisoformat(iso) - start).days
+            bits[i >> 3] |= 1 << (i & 7)
+    return bytes(bits)
+
+
+_PRESENCE_WINDOW = (
+    select(study_daily_rollup.c.study_date)
+    .where(
+        study_daily_rollup.c.user_id == bindparam("uid"),
+        study_daily_rollup.c.study_date.between(bindparam("start"), bindparam("end")),
+    )
+    .group_by(study_daily_rollup.c.study_date)
+    .having(func.sum(study_daily_rollup.c.total_sec) >= 60)
+)
+
+
+@cached_read
+def get_presence_window(user_id: int, end: date | str, days: int = PRESENCE_WINDOW_DAYS) -> Optional[dict]:
+    """
+    Janela da grade de constância terminando em `end` (páginas anteriores ao snapshot),
+    no mesmo formato de snapshot["presence"] mais "has_older" (há dias antes da janela).
+    O custo depende só de `days`, não da idade da conta. None se `end` for antes do cadastro.
+    """
+    end_d = date.fromisoformat(_date_to_iso(end))
+    with engine.connect() as conn:
+        created = conn.execute(
+            text("SELECT CAST(DATE(created_at) AS TEXT) FROM users WHERE id = :uid"), {"uid": int(user_id)}
+        ).scalar()
+        if not created:
+            return None
+        created_d = date.fromisoformat(_date_to_iso(created))
+        start = max(created_d, end_d - timedelta(days=int(days) - 1))
+        if start > end_d:
+            return None
+        rows = conn.execute(_PRESENCE_WINDOW, {"uid": int(user_id), "start": start, "end": end_d}).scalars()
+        studied = [_date_to_iso(d) for d in rows]
+    n = (end_d - start).days + 1
+    return {
+        "start": start.isoformat(),
+        "days": n,
+        "bits": _presence_bitmap(start, n, studied),
+        "has_older": start > created_d,
+    }
+
+
+@cached_read
+def get_dashboard_snapshot(
+    user_id: int,
+    selected_day: date | str,
+    week_start: date | str,
+    presence_days: int = PRESENCE_WINDOW_DAYS,
+) -> dict:
+    """
+    Snapshot da home em uma única query. Retorna:
+      - created_date: 'YYYY-MM-DD' ou None
+      - weekly_goal: {"target_hours", "target_questions"} ou None
+      - subject_colors: {subject: "#RRGGBB"}
+      - presence: janela dos últimos `presence_days` dias (limitada ao cadastro) como
+        {"start": 'YYYY-MM-DD', "days": n, "bits": bytes, "has_older": bool} — ver _presence_bitmap
+      - stats: mesmo formato de get_user_stats (totais da vida e sequências)
+      - streak: dias seguidos com estudo terminando hoje (= stats["current_streak"])
+      - disciplinas: mesmo formato de get_disciplinas_resumo
+      - day_breakdown: mesmo formato de get_day_subject_breakdown(selected_day)
+      - week: 7 dias a partir de week_start ({"date", "minutes", "hits", "mistakes"})
+      - goal_progress: {"minutes", "questions"} da semana atual (segunda → domingo)
+    """
+    day_iso = _date_to_iso(selected_day)
+    week_start_d = datetime.strptime(_date_to_iso(week_start), "%Y-%m-%d").date()
+    today = date.today()
+    monday = today - timedelta(days=today.weekday())
+
+    with engine.connect() as conn:
+        rows = conn.execute(_SNAPSHOT_SQL, {
+            "uid": int(user_id), "day": day_iso,
+            "recent_start": min(today - timedelta(days=int(presence_days) - 1), monday).isoformat(),
+            "recent_end": max(today, monday + timedelta(days=6)).isoformat(),
+            "week_start": week_start_d.isoformat(),
+            "week_end": (week_start_d + timedelta(days=6)).isoformat(),
+        }).mappings().fetchall()
+
+    created_date = None
+    weekly_goal = None
+    colors: dict[str, str] = {}
+    daily: dict[str, dict[str, int]] = {}
+    disciplinas = []
+    day_breakdown = []
+    stats_row = totals_row = None
+    for r in rows:
+        kind = r["kind"]
+        if kind == "daily":
+            total_sec = int(r["n1"] or 0)
+            daily[_date_to_iso(r["k1"])] = {
+                "total_sec": total_sec,
+                "minutes": total_sec // 60,
+                "hits": int(r["n2"] or 0),
+                "mistakes": int(r["n3"] or 0),
+            }
+        elif kind == "subject":
+            disciplinas.append(_resumo_row(r["k1"], r["n1"], r["n2"], r["n3"]))
+        elif kind == "day":
+            day_breakdown.append({"subject": r["k1"], "total_sec": int(r["n1"] or 0)})
+        elif kind == "color":
+            colors[r["k1"]] = r["k2"]
+        elif kind == "goal":
+            weekly_goal = {"target_hours": int(r["n1"]), "target_questions": int(r["n2"])}
+        elif kind == "user":
+            created_date = _date_to_iso(r["k1"])
+        elif kind == "stats":
+            stats_row = r
+        elif kind == "totals":
+            totals_row = r
+
+    disciplinas.sort(key=lambda d: d["subject"])
+    day_breakdown.sort(key=lambda d: d["subject"])
+
+    stats = dict(_EMPTY_STATS)
+    if stats_row and totals_row:
+        stats = _stats_dict(
+            stats_row["n2"], totals_row["n1"], totals_row["n2"], totals_row["n3"],
+            totals_row["k1"], totals_row["k2"], stats_row["k1"], stats_row["k2"], stats_row["n1"],
+            today=today,
+        )
+
+    presence = None
+    if created_date:
+        start = max(date.fromisoformat(created_date), today - timedelta(days=int(presence_days) - 1))
+        days = (today - start).days + 1
+        studied = (k for k, v in daily.items() if v["minutes"] > 0)
+        presence = {
+            "start": start.isoformat(),
+            "days": days,
+            "bits": _presence_bitmap(start, days, studied),
+            "has_older": start > date.fromisoformat(created_date),
+        }
+
+    empty = {"total_sec": 0, "minutes": 0, "hits": 0, "mistakes": 0}
+    week = []
+    for i in range(7):
+        d = (week_start_d + timedelta(days=i)).isoformat()
+        v = daily.get(d, empty)
+        week.append({"date": d, "minutes": v["minutes"], "hits": v["hits"], "mistakes": v["mistakes"]})
+
+    goal_days = [daily.get((monday + timedelta(days=i)).isoformat(), empty) for i in range(7)]
+    goal_progress = {
+        "minutes": sum(v["minutes"] for v in goal_days),
+        "questions": sum(v["hits"] + v["mistakes"] for v in goal_days),
+    }
+
+    return {
+        "created_date": created_date,
+        "weekly_goal": weekly_goal,
+        "subject_colors": colors,
+        "presence": presence,
+        "stats": stats,
+        "streak": stats["current_streak"],
+        "disciplinas": disciplinas,
+        "day_breakdown": day_breakdown,
+        "selected_day": day_iso,
+        "week": week,
+        "goal_progress": goal_progress,
+    }
+
+
+# ------------------------------------------------------------------------------
+# Linha de comando (manutenção)
+#   python db.py migrate
+#   python db.py rollup-rebuild [--user ID]
+#   python db.py rollup-verify  [--user ID]
+#   python db.py stats-rebuild  [--user ID]
+#   python db.py stats-verify   [--user ID]
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manutenção do banco do Estudo Operacional.")
+    parser.add_argument("command", choices=[
+        "migrate", "rollup-rebuild", "rollup-verify", "stats-rebuild", "stats-verify", "pool-stats",
+    ])
+    parser.add_argument("--user", type=int, default=None, help="restringe a um usuário")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "rollup-rebuild":
+        n = rebuild_daily_rollup(args.user)
+        print(f"rollup reconstruído: {n} linha(s)")
+    elif args.command == "rollup-verify":
+        problems = verify_daily_rollup(args.user)
+        for p in problems:
+            print(p)
+        print(f"{len(problems)} divergência(s)")
+        raise SystemExit(1 if problems else 0)
+    elif args.command == "stats-rebuild":
+        n = rebuild_user_stats(args.user)
+        print(f"user_stats recalculado: {n} linha(s)")
+    elif args.command == "stats-verify":
+        problems = verify_user_stats(args.user)
+        for p in problems:
+            print(p)
+        print(f"{len(problems)} divergência(s)")
+        raise SystemExit(1 if problems else 0)
+    elif args.command == "pool-stats":
+        print(get_pool_stats())
+    else:
+        print(f"schema na versão {get_schema_version()}")
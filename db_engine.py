@@ -0,0 +1,344 @@
+# db_engine.py — fábrica do Engine do SQLAlchemy com perfis de pool por ambiente
+#
+# Perfis (DB_PROFILE; sem ele, detectado pela URL):
+#   sqlite-local           arquivo local: WAL, PRAGMAs e escritor único; sem keepalive
+#   pg-direct              PostgreSQL direto (porta 5432): pool maior, recycle longo
+#   pg-transaction-pooler  Supabase Transaction Pooler / PgBouncer (porta 6543 ou host
+#                          "pooler"): prepared statements desligados — a conexão do
+#                          servidor muda a cada transação — e recycle curto
+#
+# Em vez de pool_pre_ping (um round trip a mais em TODO checkout), o PostgreSQL usa:
+#   - keepalive TCP do libpq, que detecta conexão morta pelo sistema operacional;
+#   - uma thread em segundo plano que, a cada KEEPALIVE segundos, passa um SELECT 1
+#     pelas conexões ociosas; as quebradas são descartadas pelo próprio SQLAlchemy
+#     antes de chegarem a uma página;
+#   - aquecimento: abre `warm` conexões logo na subida do processo.
+#
+# No SQLite (arquivo), toda conexão recebe os PRAGMAs do perfil (WAL,
+# synchronous=NORMAL, busy_timeout, mmap, cache) e as escritas passam por
+# SingleWriter: uma única thread, em fila, abrindo transações com BEGIN IMMEDIATE.
+# Com WAL os leitores nunca esperam o escritor, e como só existe um escritor por
+# processo, "database is locked" deixa de acontecer entre sessões do Streamlit.
+#
+# Ajustes finos por ambiente: DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT,
+# DB_POOL_RECYCLE, DB_KEEPALIVE_INTERVAL, DB_WARM_CONNECTIONS.
+from __future__ import annotations
+
+import contextvars
+import functools
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+log = logging.getLogger(__name__)
+
+_PG_KEEPALIVE_ARGS = {
+    "connect_timeout": 10,
+    "keepalives": 1,
+    "keepalives_idle": 30,
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "sqlite-local": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": -1,
+        "keepalive": 0,
+        "warm": 0,
+        "connect_args": {},
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,             # ms: outro processo escrevendo
+            "mmap_size": 256 * 1024 * 1024,
+            "cache_size": -16000,             # KiB (negativo), por conexão
+            "temp_store": "MEMORY",
+        },
+    },
+    "pg-direct": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "keepalive": 120,
+        "warm": 2,
+        "connect_args": dict(_PG_KEEPALIVE_ARGS),
+    },
+    "pg-transaction-pooler": {
+        # o pooler já multiplexa; poucas conexões cliente bastam e não seguram o limite
+        "pool_size": 4,
+        "max_overflow": 6,
+        "pool_timeout": 10,
+        "pool_recycle": 300,
+        "keepalive": 60,
+        "warm": 2,
+        "connect_args": {**_PG_KEEPALIVE_ARGS, "prepare_threshold": None},
+    },
+}
+
+_ENV_OVERRIDES = {
+    "DB_POOL_SIZE": ("pool_size", int),
+    "DB_MAX_OVERFLOW": ("max_overflow", int),
+    "DB_POOL_TIMEOUT": ("pool_timeout", float),
+    "DB_POOL_RECYCLE": ("pool_recycle", int),
+    "DB_KEEPALIVE_INTERVAL": ("keepalive", float),
+    "DB_WARM_CONNECTIONS": ("warm", int),
+}
+
+
+def detect_profile(url: str) -> str:
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return "sqlite-local"
+    if u.port == 6543 or "pooler" in (u.host or ""):
+        return "pg-transaction-pooler"
+    return "pg-direct"
+
+
+def resolve_profile(url: str, name: Optional[str] = None) -> Dict[str, Any]:
+    """Perfil escolhido (argumento > DB_PROFILE > detecção) com os overrides do ambiente."""
+    name = name or os.getenv("DB_PROFILE") or detect_profile(url)
+    if name not in PROFILES:
+        raise ValueError(f"DB_PROFILE desconhecido: {name!r} (use: {', '.join(PROFILES)})")
+    profile = {**PROFILES[name], "name": name}
+    profile["connect_args"] = dict(profile["connect_args"])
+    for env, (key, cast) in _ENV_OVERRIDES.items():
+        if os.getenv(env):
+            profile[key] = cast(os.environ[env])
+    return profile
+
+
+# ------------------------------------------------------------------------------
+# Pool com medição do tempo de espera no checkout
+# ------------------------------------------------------------------------------
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool que mede quanto cada checkout esperou (fila cheia ou conexão nova).
+    `on_wait(segundos, timeout)`, se definido, recebe cada espera (ver metrics.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.on_wait: Optional[Callable[[float, bool], None]] = None
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            timed_out = True
+            with self._wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - t0
+            with self._wait_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            if self.on_wait is not None:
+                self.on_wait(waited, timed_out)
+
+    def wait_stats(self) -> Dict[str, float]:
+        with self._wait_lock:
+            n = self.checkouts
+            return {
+                "checkouts": n,
+                "wait_avg_ms": round(self.wait_total / n * 1000, 3) if n else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "wait_total_s": round(self.wait_total, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+def pool_stats(engine: Engine) -> Dict[str, Any]:
+    pool = engine.pool
+    stats: Dict[str, Any] = {"profile": getattr(engine, "_profile_name", None)}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),  # o contador interno começa em -pool_size
+        })
+    if isinstance(pool, TimedQueuePool):
+        stats.update(pool.wait_stats())
+    return stats
+
+
+# ------------------------------------------------------------------------------
+# Capacidades do dialeto
+# ------------------------------------------------------------------------------
+
+def dialect_capabilities(dialect) -> Dict[str, bool]:
+    """
+    O que o banco aceita, decidido pela versão do driver — sem round trip:
+      returning    INSERT/DELETE ... RETURNING (SQLite >= 3.35)
+      on_conflict  INSERT ... ON CONFLICT (SQLite >= 3.24; PostgreSQL >= 9.5)
+      native_date  coluna DATE de verdade (no SQLite as datas são TEXT 'YYYY-MM-DD')
+    """
+    if dialect.name == "sqlite":
+        # dialeto sem driver (só para compilar SQL): vale a versão do sqlite3 embutido
+        v = (dialect.dbapi or sqlite3).sqlite_version_info
+        return {"returning": v >= (3, 35), "on_conflict": v >= (3, 24), "native_date": False}
+    return {"returning": True, "on_conflict": True, "native_date": True}
+
+
+# ------------------------------------------------------------------------------
+# SQLite: PRAGMAs por conexão e escritor único
+# ------------------------------------------------------------------------------
+
+class SingleWriter:
+    """Executa funções de escrita, uma por vez, numa thread dedicada (fila FIFO)."""
+
+    def __init__(self, name: str = "db-writer"):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._local = threading.local()
+
+    def in_writer(self) -> bool:
+        return getattr(self._local, "active", False)
+
+    def run(self, fn: Callable, *args, **kwargs):
+        if self.in_writer():  # escrita chamada de dentro de outra: já está na fila
+            return fn(*args, **kwargs)
+        # a função leva o contexto de quem a chamou (ContextVars, ex.: seção do profiler)
+        return self._executor.submit(contextvars.copy_context().run, self._call, fn, args, kwargs).result()
+
+    def _call(self, fn: Callable, args, kwargs):
+        self._local.active = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._local.active = False
+
+
+def _setup_sqlite(engine: Engine, pragmas: Dict[str, Any], writer: SingleWriter) -> None:
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        # o SQLAlchemy passa a emitir o BEGIN (abaixo), em vez do pysqlite
+        dbapi_conn.isolation_level = None
+        cur = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cur.execute(f"PRAGMA {name}={value}")
+        cur.close()
+
+    @event.listens_for(engine, "begin")
+    def _on_begin(conn):
+        # o escritor reserva o lock de escrita já no início: sem upgrade de leitura
+        # para escrita no meio da transação (que falharia sem esperar o busy_timeout)
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if writer.in_writer() else "BEGIN")
+
+
+def serialized_writes(engine: Engine) -> Callable[[Callable], Callable]:
+    """
+    Decorador para funções de escrita. No SQLite roda a função no SingleWriter do
+    engine; nos demais bancos é um no-op (o PostgreSQL já lida com concorrência).
+    """
+    writer = getattr(engine, "_single_writer", None)
+
+    def decorator(fn: Callable) -> Callable:
+        if writer is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return writer.run(fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+# ------------------------------------------------------------------------------
+# Aquecimento e keepalive em segundo plano
+# ------------------------------------------------------------------------------
+
+def warm_up(engine: Engine, n: int) -> int:
+    """Abre `n` conexões ao mesmo tempo e as devolve ao pool. Retorna quantas abriram."""
+    conns = []
+    try:
+        for _ in range(n):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+            conn.rollback()
+    except Exception as e:
+        log.warning("aquecimento do pool interrompido: %s", e)
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def _ping_idle(engine: Engine) -> None:
+    # pool FIFO: cada checkout pega a conexão ociosa mais antiga, então
+    # `checkedin()` checkouts seguidos passam por todas elas
+    for _ in range(engine.pool.checkedin()):
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except Exception as e:
+            # erro de desconexão já invalidou a conexão; a próxima é criada sob demanda
+            log.info("keepalive descartou uma conexão: %s", e)
+
+
+def _keepalive_loop(engine: Engine, interval: float, warm: int) -> None:
+    if warm:
+        warm_up(engine, warm)
+    while interval > 0:
+        time.sleep(interval)
+        _ping_idle(engine)
+
+
+def build_engine(url: str, profile: Optional[str] = None) -> Engine:
+    """
+    Cria o Engine do perfil. No PostgreSQL inicia aquecimento e keepalive; no SQLite
+    em arquivo aplica os PRAGMAs e cria o escritor único (ver serialized_writes).
+    """
+    p = resolve_profile(url, profile)
+    u = make_url(url)
+    kwargs: Dict[str, Any] = {"future": True, "connect_args": p["connect_args"]}
+    sqlite_file = u.get_backend_name() == "sqlite" and u.database not in (None, "", ":memory:")
+    # SQLite em memória fica com o SingletonThreadPool padrão (uma conexão por thread)
+    if u.get_backend_name() != "sqlite" or sqlite_file:
+        kwargs.update(
+            poolclass=TimedQueuePool,
+            pool_size=p["pool_size"],
+            max_overflow=p["max_overflow"],
+            pool_timeout=p["pool_timeout"],
+            pool_recycle=p["pool_recycle"],
+        )
+    engine = create_engine(url, **kwargs)
+    engine._profile_name = p["name"]
+    engine._single_writer = None
+    if sqlite_file and p.get("pragmas") is not None:
+        engine._single_writer = SingleWriter()
+        _setup_sqlite(engine, p["pragmas"], engine._single_writer)
+
+    if p["keepalive"] > 0 or p["warm"] > 0:
+        threading.Thread(
+            target=_keepalive_loop,
+            args=(engine, p["keepalive"], p["warm"]),
+            name="db-keepalive",
+            daemon=True,
+        ).start()
+    return engine
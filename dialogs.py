@@ -1,13 +1,16 @@
 # dialogs.py
 import datetime as dt
+import hashlib
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
 
 # ADICIONADOS:
-from auth import get_current_user
+from auth import get_current_user, get_current_user_created_date
+from utils import CATEGORIAS, validar_registro
+from records_io import parse_records_file
 from db import (
     create_study_record,
-    get_user_created_date,
+    bulk_create_study_records,
     get_weekly_goal,          # NOVO
     upsert_weekly_goal        # NOVO
 )
@@ -22,14 +25,7 @@ def dialog_study_record():
 
     # ==== Recupera usuário atual e calcula data mínima do seletor de data ====
     user = get_current_user()
-    created_date = None
-    if user:
-        created_date_str = get_user_created_date(user["id"])
-        if created_date_str:
-            try:
-                created_date = dt.datetime.strptime(created_date_str, "%Y-%m-%d").date()
-            except Exception:
-                created_date = None  # fallback seguro
+    created_date = get_current_user_created_date()  # guardada na sessão (sem query)
 
     # ===== LINHA 0: Data (pills + date_input) =====
     left, right = st.columns([3, 1])
@@ -93,7 +89,7 @@ def dialog_study_record():
     with c:
         categoria = st.selectbox(
             "Categoria",
-            ["Teoria", "Revisão", "Questões", "Leitura de Lei", "Jurisprudência"],
+            CATEGORIAS,
             index=None,
             placeholder="Selecione..."
         )
@@ -150,12 +146,9 @@ def dialog_study_record():
 
     st.markdown('<div style="padding:0 10px; margin-bottom:15px;"></div>', unsafe_allow_html=True)
 
-    # ===== Regras para habilitar "Salvar" =====
-    tempo_valido = (tempo_estudo.hour > 0) or (tempo_estudo.minute > 0) or (tempo_estudo.second > 0)
-    categoria_valida = categoria is not None
-    disciplina_valida = bool(disciplina.strip())
-
-    pode_salvar = tempo_valido and categoria_valida and disciplina_valida
+    # ===== Regras para habilitar "Salvar" (as mesmas da importação) =====
+    duration_sec = tempo_estudo.hour * 3600 + tempo_estudo.minute * 60 + tempo_estudo.second
+    pode_salvar = not validar_registro(duration_sec, categoria, disciplina)
 
     # ===== Botões =====
     col1, col2 = st.columns(2)
@@ -179,9 +172,6 @@ def dialog_study_record():
                     study_date = dt.date.today()
                 study_date_str = study_date.isoformat()
 
-                # Tempo total em segundos
-                duration_sec = tempo_estudo.hour * 3600 + tempo_estudo.minute * 60 + tempo_estudo.second
-
                 try:
                     create_study_record(
                         user_id=user["id"],
@@ -201,6 +191,100 @@ def dialog_study_record():
                 except Exception as e:
                     st.error(f"Falha ao salvar o registro: {e}")
 
+@st.dialog("Importar Registros", width="large")
+def dialog_import_records():
+    """
+    Importa registros em massa de um arquivo CSV/JSON/JSONL.
+    - Cada linha passa pelas mesmas regras do registro manual (inclusive a data mínima).
+    - Linhas inválidas são listadas e ignoradas; as válidas entram em lotes.
+    - O resultado da leitura fica na sessão (chave: hash do arquivo), então os
+      reruns do diálogo — inclusive o clique em "Importar" — não reprocessam o arquivo.
+    - Cada lote é gravado por conta própria: se um falhar, os anteriores já estão
+      salvos. A sessão guarda quantos (por hash do arquivo) e a nova tentativa
+      continua dali, sem duplicar.
+    """
+    user = get_current_user()
+    if not user:
+        st.error("Você precisa estar logado para importar registros.")
+        return
+
+    st.caption(
+        "Colunas: data, categoria, disciplina, tempo (HH:MM) ou duration_sec, "
+        "conteudo, acertos, erros, pagina_inicio, pagina_fim, comentario."
+    )
+    arquivo = st.file_uploader(
+        "Arquivo", type=["csv", "json", "jsonl"], label_visibility="collapsed", key="import-arquivo"
+    )
+    if arquivo is None:
+        return
+
+    data = arquivo.getvalue()
+    file_hash = hashlib.sha256(data).hexdigest()
+    # mesma data mínima do registro manual: a criação da conta
+    min_date = get_current_user_created_date()
+    parsed = st.session_state.get("_import_parsed")
+    if not parsed or parsed["key"] != (file_hash, min_date):
+        validos, erros = parse_records_file(arquivo.name, data, min_date=min_date)
+        parsed = {"key": (file_hash, min_date), "validos": validos, "erros": erros}
+        st.session_state["_import_parsed"] = parsed
+    validos, erros = parsed["validos"], parsed["erros"]
+
+    # lotes já gravados numa tentativa anterior que falhou no meio
+    salvos_por_arquivo = st.session_state.setdefault("_import_saved", {})
+    ja_salvos = min(salvos_por_arquivo.get(file_hash, 0), len(validos))
+    pendentes = validos[ja_salvos:]
+
+    c1, c2 = st.columns(2)
+    c1.metric("Linhas válidas", len(validos))
+    c2.metric("Linhas com erro", len(erros))
+    if ja_salvos:
+        st.info(
+            f"{ja_salvos} registro(s) deste arquivo já foram salvos na tentativa anterior; "
+            f"Importar grava só os {len(pendentes)} restantes."
+        )
+    if erros:
+        with st.expander("Ver erros"):
+            st.dataframe(
+                [{"Linha": n, "Erro": msg} for n, msg in erros[:500]],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    col1, col2 = st.columns(2)
+    with col2:
+        btn1, btn2 = st.columns(2)
+        with btn1:
+            if st.button("Cancelar", use_container_width=True, key="import-cancelar"):
+                st.rerun()
+        with btn2:
+            importar = st.button(
+                "Importar", type="primary", use_container_width=True,
+                disabled=not pendentes, key="import-confirmar",
+            )
+
+    if importar:
+        barra = st.progress(0.0, text="Importando...")
+
+        # chamado depois de cada lote confirmado: `feitos` já está no banco
+        def _progresso(feitos: int, total: int):
+            salvos_por_arquivo[file_hash] = ja_salvos + feitos
+            barra.progress(feitos / total, text=f"Importando... {feitos}/{total}")
+
+        try:
+            n = bulk_create_study_records(user["id"], pendentes, on_progress=_progresso)
+        except Exception as e:
+            salvos = salvos_por_arquivo.get(file_hash, 0)
+            st.error(
+                f"Falha ao importar: {e}. {salvos} de {len(validos)} registro(s) já foram salvos; "
+                "clique em Importar de novo para continuar a partir do próximo."
+            )
+            return
+        salvos_por_arquivo.pop(file_hash, None)
+        st.session_state.pop("_import_parsed", None)
+        st.toast(f"{ja_salvos + n} registro(s) importado(s) com sucesso!")  # sobrevive ao rerun
+        st.rerun()
+
+
 @st.dialog("Definir Meta", width="small")
 def dialog_weekly_goal():
     # Garante que só usuários logados editem metas
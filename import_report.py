@@ -0,0 +1,113 @@
+# import_report.py — tempo de import por módulo (python -X importtime)
+#
+#   python import_report.py                      # tela de login e home
+#   python import_report.py login --top 30
+#   python import_report.py home --budget-ms 2500
+#   python import_report.py painel weekly_study  # módulos avulsos
+#
+# Cada alvo roda num processo novo (cache de import frio no Python, não no disco).
+# O relatório soma o tempo próprio ("self") de cada módulo no pacote de topo a que
+# ele pertence (streamlit, sqlalchemy, pandas...), então o custo fica com quem o gera
+# e não com o primeiro módulo que o importou.
+# Sai com código 1 se um alvo passar do orçamento ou se a tela de login carregar
+# algum pacote de HEAVY_PACKAGES — serve para acompanhar regressões na CI.
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# módulos que o app.py importa antes (login) e depois (home) do render_auth_gate;
+# a home inclui os pacotes de gráfico que os render_* importam ao desenhar
+TARGETS = {
+    "login": ["utils", "auth"],
+    "home": [
+        "utils", "auth", "painel", "streak", "dialogs", "day_studies",
+        "weekly_goal", "weekly_study", "records", "prefetch",
+        "plotly.graph_objects",
+    ],
+}
+
+# não podem aparecer no caminho do login (plotly não entra: o próprio streamlit o
+# importa em streamlit.elements.plotly_chart quando está instalado)
+HEAVY_PACKAGES = ("pandas", "altair", "pyarrow")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(modules: list[str]) -> list[tuple[int, int, int, str]]:
+    """Importa `modules` num processo novo; retorna [(self_us, cumulative_us, nível, módulo)]."""
+    code = "; ".join(f"import {m}" for m in modules)
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"falha ao importar {modules}:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            self_us, cum_us, indent, name = m.groups()
+            rows.append((int(self_us), int(cum_us), len(indent) // 2, name))
+    return rows
+
+
+def summarize(rows: list[tuple[int, int, int, str]]) -> tuple[int, dict[str, int]]:
+    """Total (soma dos imports de nível 0) e tempo próprio somado por pacote de topo."""
+    total = 0
+    by_package: dict[str, int] = defaultdict(int)
+    for self_us, cum_us, level, name in rows:
+        if level == 0:
+            total += cum_us
+        by_package[name.split(".")[0]] += self_us
+    return total, dict(by_package)
+
+
+def report(name: str, modules: list[str], top: int, budget_ms: float | None) -> bool:
+    rows = measure(modules)
+    total, by_package = summarize(rows)
+    loaded = {n.split(".")[0] for _s, _c, _l, n in rows}
+
+    print(f"== {name}: {' '.join(modules)}")
+    print(f"   total {total / 1000:8.1f} ms  ({len(rows)} módulos)")
+    for pkg, us in sorted(by_package.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"   {us / 1000:8.1f} ms  {pkg}")
+
+    ok = True
+    if budget_ms is not None and total / 1000 > budget_ms:
+        print(f"   ACIMA DO ORÇAMENTO: {total / 1000:.1f} ms > {budget_ms:.1f} ms")
+        ok = False
+    if name == "login":
+        heavy = sorted(loaded.intersection(HEAVY_PACKAGES))
+        if heavy:
+            print(f"   login carregou pacotes pesados: {', '.join(heavy)}")
+            ok = False
+    print()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tempo de import por módulo (python -X importtime).")
+    parser.add_argument("targets", nargs="*", help="login, home ou nomes de módulos (padrão: login e home)")
+    parser.add_argument("--top", type=int, default=15, help="pacotes listados por alvo")
+    parser.add_argument("--budget-ms", type=float, default=None, help="falha se algum alvo passar disso")
+    args = parser.parse_args()
+
+    targets = args.targets or ["login", "home"]
+    named = [t for t in targets if t in TARGETS]
+    loose = [t for t in targets if t not in TARGETS]
+
+    ok = True
+    for t in named:
+        ok &= report(t, TARGETS[t], args.top, args.budget_ms)
+    if loose:
+        ok &= report("módulos", loose, args.top, args.budget_ms)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,322 @@
+# loadtest.py — carga de sessões simultâneas do app.py (streamlit.testing AppTest)
+#
+#   python loadtest.py                                  # 10 sessões × 3 iterações
+#   python loadtest.py --sessions 50 --iterations 5 --ramp 10
+#   python loadtest.py --url postgresql+psycopg://localhost/estudos_load
+#
+# Cada sessão é um AppTest do app.py rodando numa thread própria, todas no mesmo
+# processo — como num servidor Streamlit: módulos, engine/pool do db.py e o cache de
+# leituras são compartilhados. O roteiro de cada sessão imita um aluno:
+#   login (formulário) → [abrir "Adicionar Estudo" → salvar → ⭠⭠⭢ dias → ⭠⭢ semanas
+#   → selecionar e excluir o registro mais recente na aba de registros] × --iterations
+# Cada passo é um rerun do script; o relatório traz os percentis de latência por passo,
+# reruns/s no total e as conexões ao banco (abertas, pico em uso, espera no pool).
+#
+# Roda offline: o banco é o do DATABASE_URL (ou --url), SQLite ou PostgreSQL local.
+# Os usuários (load-<i>@loadtest.local) são criados na primeira vez com um histórico
+# sintético do bench.py (--history registros), para que as telas tenham o que mostrar.
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+PASSWORD = "loadtest"
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+
+def _email(i: int) -> str:
+    return f"load-{i}@loadtest.local"
+
+
+# ------------------------------------------------------------------------------
+# Preparação
+# ------------------------------------------------------------------------------
+
+def prepare_users(db, sessions: int, history: int, seed: int) -> List[str]:
+    """Garante os usuários load-<i>; só os que faltam são criados (com histórico)."""
+    from faker import Faker
+
+    from auth import hash_password
+    from bench import seed_user
+
+    fake = Faker("pt_BR")
+    Faker.seed(seed)
+    rng = random.Random(seed)
+    pw_hash = hash_password(PASSWORD)
+    emails = [_email(i) for i in range(sessions)]
+    for email in emails:
+        if not db.get_user_by_email(email):
+            seed_user(db, fake, rng, email, history, password_hash=pw_hash)
+    return emails
+
+
+def _patch_apptest() -> None:
+    # AppTest: st.pills com selection_mode="single" quebra no 2º run (o valor str é
+    # iterado como lista de opções) — o diálogo de registro usa um pills assim
+    from streamlit.testing.v1 import element_tree as et
+
+    orig = et.ButtonGroup.indices.fget
+
+    def indices(self):
+        v = self.value
+        if isinstance(v, str):
+            return [self.options.index(self.format_func(v))]
+        return orig(self)
+
+    et.ButtonGroup.indices = property(indices)
+
+
+def _share_runtime() -> None:
+    """
+    Um só Runtime (simulado) e uma só configuração para todas as sessões.
+    O AppTest troca Runtime._instance e config.get_option a cada run e os desfaz no
+    fim — globais do processo que, com várias threads, uma sessão apagaria no meio do
+    run da outra. Num servidor real também há um Runtime só, com um cache de
+    st.cache_* e um gerenciador de mídia compartilhados.
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.testing.v1.util import build_mock_config_get_option
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    # o patch de cada run salva e restaura esta versão, então nenhuma thread fica sem ela
+    config.get_option = build_mock_config_get_option({"global.appTest": True, "logger.level": "error"})
+
+
+# ------------------------------------------------------------------------------
+# Conexões ao banco (eventos do pool)
+# ------------------------------------------------------------------------------
+
+def track_connections(engine) -> Dict[str, int]:
+    """Conta conexões DBAPI abertas e o pico de conexões em uso ao mesmo tempo."""
+    from sqlalchemy import event
+
+    stats = {"opened": 0, "in_use": 0, "peak_in_use": 0}
+    lock = threading.Lock()
+
+    @event.listens_for(engine, "connect")
+    def _connect(dbapi_conn, record):
+        with lock:
+            stats["opened"] += 1
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_conn, record, proxy):
+        with lock:
+            stats["in_use"] += 1
+            stats["peak_in_use"] = max(stats["peak_in_use"], stats["in_use"])
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_conn, record):
+        with lock:
+            stats["in_use"] -= 1
+
+    return stats
+
+
+# ------------------------------------------------------------------------------
+# Roteiro de uma sessão
+# ------------------------------------------------------------------------------
+
+class _Session:
+    """Um AppTest logado; cada passo é um rerun cronometrado."""
+
+    def __init__(self, email: str, timeout: float, timings: Dict[str, List[float]], lock: threading.Lock):
+        from streamlit.testing.v1 import AppTest
+
+        self.email = email
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.timings = timings
+        self.lock = lock
+
+    def _run(self, step: str, widget_states=None) -> None:
+        t = time.perf_counter()
+        if widget_states is None:
+            self.at.run()
+        else:
+            self.at._run(widget_states)
+        elapsed = time.perf_counter() - t
+        if self.at.exception:
+            raise RuntimeError(f"{step}: {self.at.exception[0].value}")
+        with self.lock:
+            self.timings[step].append(elapsed)
+
+    def _button(self, key: str):
+        return self.at.button(key=key)
+
+    def login(self) -> None:
+        self._run("tela_login")
+        self.at.text_input[0].input(self.email)  # aba "Entrar" vem antes de "Criar conta"
+        self.at.text_input[1].input(PASSWORD)
+        self._button("FormSubmitter:login_form-Entrar").click()
+        self._run("login")
+        if not any(b.key == "adicionar-estudos" for b in self.at.button):
+            raise RuntimeError(f"login falhou para {self.email}")
+
+    def add_record(self, rng: random.Random) -> None:
+        self._button("adicionar-estudos").click()
+        self._run("abrir_dialogo")
+
+        # widgets do diálogo não têm key (exceto o tempo); os filtros da aba de
+        # registros têm, e é isso que os separa
+        [s for s in self.at.selectbox if s.label == "Categoria" and s.key is None][0].select(
+            rng.choice(["Teoria", "Questões", "Revisão"])
+        )
+        [t for t in self.at.text_input if t.label == "Disciplina" and t.key is None][0].input(
+            rng.choice(["Direito Constitucional", "Língua Portuguesa", "Raciocínio Lógico"])
+        )
+        [t for t in self.at.text_input if t.label == "Conteúdo"][0].input("carga")
+        self.at.time_input(key="tempo_estudo").set_value(dt.time(0, rng.randint(10, 59)))
+        # o AppTest não reexecuta só o fragmento do diálogo: num rerun completo o
+        # diálogo fecha. Por isso o clique que o abre vai junto com o "Salvar".
+        self._button("adicionar-estudos").click()
+        [b for b in self.at.button if b.label == "Salvar"][0].click()
+        self._run("salvar")
+
+    def navigate(self) -> None:
+        for key, step in (
+            ("btn-prev-day", "dia_anterior"),
+            ("btn-prev-day", "dia_anterior"),
+            ("btn-next-day", "dia_seguinte"),
+            ("btn-prev-week", "semana_anterior"),
+            ("btn-next-week", "semana_seguinte"),
+        ):
+            self._button(key).click()
+            self._run(step)
+
+    def _with_selection(self, table_id: str, rows: List[int]):
+        """Estados dos widgets da árvore + a seleção de linhas de um st.dataframe."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        states = self.at._tree.get_widget_states()
+        ws = WidgetState(id=table_id)
+        ws.string_value = json.dumps({"selection": {"rows": rows, "columns": []}})
+        states.widgets.append(ws)
+        return states
+
+    def delete_latest(self) -> None:
+        # o AppTest não sabe selecionar linhas de st.dataframe (nem guarda a seleção
+        # entre runs): o estado vai junto com os demais widgets, como o navegador faria
+        table_id = [d for d in self.at.dataframe if "rec-table" in d.proto.id][0].proto.id
+        self._run("selecionar", self._with_selection(table_id, [0]))
+        self._button("rec-delete").click()
+        self._run("excluir", self._with_selection(table_id, [0]))
+        if not self.at.toast:
+            raise RuntimeError("excluir: nenhum registro excluído")
+
+
+def run_session(email: str, iterations: int, timeout: float, delay: float, seed: int,
+                timings: Dict[str, List[float]], errors: List[str], lock: threading.Lock) -> None:
+    time.sleep(delay)
+    rng = random.Random(seed)
+    try:
+        s = _Session(email, timeout, timings, lock)
+        s.login()
+        for _ in range(iterations):
+            s.add_record(rng)
+            s.navigate()
+            s.delete_latest()
+    except Exception as e:  # uma sessão que falha não derruba as outras
+        with lock:
+            errors.append(f"{email}: {e}")
+
+
+# ------------------------------------------------------------------------------
+# Relatório
+# ------------------------------------------------------------------------------
+
+def _pct(ts: List[float], p: float) -> float:
+    return ts[min(len(ts) - 1, math.ceil(p * len(ts)) - 1)]
+
+
+def report(timings: Dict[str, List[float]], wall: float, sessions: int,
+           connections: Dict[str, int], pool: Dict[str, Any], errors: List[str]) -> None:
+    all_ts = sorted(t for ts in timings.values() for t in ts)
+    print(f"\n{sessions} sessões, {len(all_ts)} reruns em {wall:.1f}s "
+          f"→ {len(all_ts) / wall:.1f} reruns/s")
+    print(f"{'passo':<18} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    rows = [(step, sorted(ts)) for step, ts in timings.items()]
+    rows.append(("(todos)", all_ts))
+    for step, ts in rows:
+        if not ts:
+            continue
+        print(f"{step:<18} {len(ts):>6} {statistics.median(ts) * 1000:>9.1f} "
+              f"{_pct(ts, 0.95) * 1000:>9.1f} {_pct(ts, 0.99) * 1000:>9.1f} {ts[-1] * 1000:>9.1f}")
+
+    print(f"\nconexões: {connections['opened']} abertas, pico de {connections['peak_in_use']} em uso")
+    print("pool:", ", ".join(f"{k}={v}" for k, v in pool.items()))
+    if errors:
+        print(f"\n{len(errors)} sessão(ões) com erro:")
+        for e in errors[:10]:
+            print("  ", e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga de sessões simultâneas do app.py (AppTest).")
+    parser.add_argument("--url", default=None, help="DATABASE_URL a usar (padrão: o do ambiente)")
+    parser.add_argument("--sessions", type=int, default=10, help="sessões simultâneas")
+    parser.add_argument("--iterations", type=int, default=3, help="repetições do roteiro por sessão")
+    parser.add_argument("--ramp", type=float, default=2.0, help="segundos para abrir todas as sessões")
+    parser.add_argument("--history", type=int, default=500, help="registros de cada usuário novo")
+    parser.add_argument("--timeout", type=float, default=120.0, help="limite de um rerun (s)")
+    parser.add_argument("--seed", type=int, default=42, help="semente do gerador")
+    args = parser.parse_args()
+
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(os.path.dirname(APP))
+
+    from streamlit.logger import set_log_level
+
+    import db
+
+    set_log_level("error")  # sem o aviso de "missing ScriptRunContext" de cada thread
+    _patch_apptest()
+    _share_runtime()
+    db.ensure_schema()
+    t = time.perf_counter()
+    emails = prepare_users(db, args.sessions, args.history, args.seed)
+    print(f"{len(emails)} usuários prontos em {time.perf_counter() - t:.1f}s "
+          f"(banco={db.engine.dialect.name}, perfil={db.get_pool_stats().get('profile')})", flush=True)
+
+    connections = track_connections(db.engine)
+    timings: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(
+            target=run_session,
+            args=(email, args.iterations, args.timeout, args.ramp * i / max(1, args.sessions),
+                  args.seed + i, timings, errors, lock),
+            name=f"load-{i}",
+        )
+        for i, email in enumerate(emails)
+    ]
+    t = time.perf_counter()
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - t
+
+    report(timings, wall, args.sessions, connections, db.get_pool_stats(), errors)
+    raise SystemExit(1 if errors else 0)
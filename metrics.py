@@ -0,0 +1,113 @@
+# metrics.py — métricas Prometheus das consultas do db.py
+#
+#   METRICS_PORT=9464 streamlit run app.py
+#   curl -s localhost:9464/metrics | grep estudos_db_
+#
+# Só é importado com METRICS_PORT definido (ver db.py); sem ele nada disso roda.
+# Ganchos de evento no Engine medem cada statement e o atribuem a uma "consulta":
+# a função pública mais externa do db.py na pilha de quem executou
+# (get_dashboard_snapshot, create_study_record...). Assim os statements internos de
+# uma função — helpers, refresh do user_stats, rollup — somam na função que o app
+# chamou, e as escritas do SQLite, que rodam na thread do escritor único, também
+# (a pilha lá começa na própria função de escrita).
+#
+# Métricas:
+#   estudos_db_query_seconds{query}          histograma da latência por statement
+#   estudos_db_query_rows_total{query}       linhas devolvidas/afetadas (rowcount);
+#                                            no SQLite o SELECT não informa (-1)
+#   estudos_db_query_errors_total{query,error}
+#   estudos_db_pool_wait_seconds             espera no checkout (TimedQueuePool)
+#   estudos_db_pool_timeouts_total
+#   estudos_db_pool_checked_out              conexões em uso agora
+#
+# O endpoint escuta em 127.0.0.1 (METRICS_ADDR para outro endereço).
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from db_engine import TimedQueuePool
+
+# statements do SQLite levam de dezenas de µs a poucos ms; os do pooler, dezenas de ms
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+QUERY_SECONDS = Histogram(
+    "estudos_db_query_seconds", "Latência de cada statement, por consulta do db.py",
+    ["query"], buckets=_BUCKETS,
+)
+QUERY_ROWS = Counter(
+    "estudos_db_query_rows_total", "Linhas devolvidas ou afetadas (rowcount), por consulta", ["query"],
+)
+QUERY_ERRORS = Counter(
+    "estudos_db_query_errors_total", "Statements que falharam, por consulta e tipo de erro", ["query", "error"],
+)
+POOL_WAIT = Histogram(
+    "estudos_db_pool_wait_seconds", "Espera no checkout de conexão do pool", buckets=_BUCKETS,
+)
+POOL_TIMEOUTS = Counter("estudos_db_pool_timeouts_total", "Checkouts que estouraram o pool_timeout")
+POOL_CHECKED_OUT = Gauge("estudos_db_pool_checked_out", "Conexões do pool em uso")
+
+OTHER = "(outros)"  # statements fora do db.py (keepalive, DDL do ensure_schema via CLI...)
+
+_server_lock = threading.Lock()
+_server_started = False
+
+
+def query_name(module: str = "db") -> str:
+    """Função pública mais externa de `module` na pilha atual."""
+    name = OTHER
+    f = sys._getframe(1)
+    while f is not None:
+        if f.f_globals.get("__name__") == module:
+            code = f.f_code.co_name
+            if not code.startswith(("_", "<")):
+                name = code
+        f = f.f_back
+    return name
+
+
+def instrument(engine: Engine, module: str = "db") -> None:
+    """Liga os ganchos de métricas no `engine` (statements de `module`)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query", []).append((query_name(module), time.perf_counter()))
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        name, t0 = conn.info["metrics_query"].pop()
+        QUERY_SECONDS.labels(name).observe(time.perf_counter() - t0)
+        if cursor.rowcount > 0:
+            QUERY_ROWS.labels(name).inc(cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("metrics_query") if ctx.connection is not None else None
+        name = stack.pop()[0] if stack else query_name(module)
+        QUERY_ERRORS.labels(name, type(ctx.original_exception).__name__).inc()
+
+    pool = engine.pool
+    if isinstance(pool, TimedQueuePool):
+        def _on_wait(seconds: float, timed_out: bool) -> None:
+            POOL_WAIT.observe(seconds)
+            if timed_out:
+                POOL_TIMEOUTS.inc()
+
+        pool.on_wait = _on_wait
+        POOL_CHECKED_OUT.set_function(pool.checkedout)
+
+
+def serve(port: int, addr: str | None = None) -> None:
+    """Sobe o endpoint /metrics uma vez por processo (reruns e reimports não repetem)."""
+    global _server_started
+    with _server_lock:
+        if _server_started:
+            return
+        start_http_server(port, addr=addr or os.getenv("METRICS_ADDR", "127.0.0.1"))
+        _server_started = True
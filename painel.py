@@ -1,10 +1,26 @@
+import html
+import json
+
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit_extras.stylable_container import stylable_container
 from auth import get_current_user
-from db import get_disciplinas_resumo
+from colors import subject_color_map
+from db import get_disciplinas_drilldown
 from utils import fmt_horas
 
 
+def _pct_colors(p: int) -> tuple[str, str]:
+    """(fundo, texto) do badge de % conforme faixas."""
+    if p <= 0:
+        return "#F5F2E8", "#000000"  # branco, texto preto
+    if p < 65:
+        return "#C96C67", "#FFFFFF"  # vermelho, texto branco
+    if p < 75:
+        return "#E2C76D", "#000000"  # amarelo, texto preto
+    return "#7BA77A", "#FFFFFF"  # verde, texto branco
+
+
 def _pct_badge_html(pct: int) -> str:
     """Retorna HTML do badge quadrado de % conforme faixas."""
     try:
@@ -12,16 +28,7 @@ def _pct_badge_html(pct: int) -> str:
     except Exception:
         p = 0
 
-    # Decide cor de fundo e texto
-    if p <= 0:
-        bg, fg = "#F5F2E8", "#000000"  # branco, texto preto
-    elif p < 65:
-        bg, fg = "#C96C67", "#FFFFFF"  # vermelho, texto branco
-    elif p < 75:
-        bg, fg = "#E2C76D", "#000000"  # amarelo, texto preto
-    else:
-        bg, fg = "#7BA77A", "#FFFFFF"  # verde, texto branco
-
+    bg, fg = _pct_colors(p)
     return (
         f"<span style=\"display:inline-block; min-width:28px; padding:2px 6px; "
         f"border-radius:6px; background:{bg}; color:{fg}; "
@@ -31,7 +38,185 @@ def _pct_badge_html(pct: int) -> str:
     )
 
 
-def render_painel():
+_DRILL_CSS = """
+<style>
+.pn-drill{text-align:left;font-size:.92rem;}
+.pn-drill details{border-bottom:1px solid #2A2A2A;padding:4px 0;}
+.pn-drill details details{margin-left:18px;border-bottom:none;}
+.pn-drill summary{cursor:pointer;display:flex;gap:8px;align-items:center;}
+.pn-drill .pn-name{flex:1;}
+.pn-drill .pn-num{min-width:70px;text-align:right;opacity:.9;}
+.pn-drill ul{list-style:none;margin:2px 0 4px 36px;padding:0;}
+.pn-drill li{display:flex;gap:8px;padding:2px 0;opacity:.85;}
+</style>
+"""
+
+
+def _drill_cells(label: str, d: dict) -> str:
+    tempo = fmt_horas(d["total_min"]) if d["total_sec"] else "-"
+    return (
+        f"<span class='pn-name'>{html.escape(label)}</span>"
+        f"<span class='pn-num'>{tempo}</span>"
+        f"<span class='pn-num' style='color:#7BA77A'>{d['hits']}</span>"
+        f"<span class='pn-num' style='color:#C96C67'>{d['mistakes']}</span>"
+        f"<span class='pn-num'>{_pct_badge_html(d['pct'])}</span>"
+    )
+
+
+def _drilldown_html(tree: list[dict]) -> str:
+    """Disciplina → categoria → conteúdo como <details> aninhados (expansão no navegador)."""
+    parts = [_DRILL_CSS, "<div class='pn-drill'>"]
+    for s in tree:
+        parts.append(f"<details><summary>{_drill_cells(s['subject'], s)}</summary>")
+        for c in s["categorias"]:
+            parts.append(f"<details><summary>{_drill_cells(c['category'], c)}</summary><ul>")
+            for t in c["topicos"]:
+                parts.append(f"<li>{_drill_cells(t['topic'] or '(sem conteúdo)', t)}</li>")
+            parts.append("</ul></details>")
+        parts.append("</details>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+# Tabela inteira num único iframe: ordenação por clique no cabeçalho e, acima de
+# _TABLE_MAX_ROWS linhas, rolagem virtualizada (só as linhas visíveis viram DOM).
+_TABLE_ROW_H = 30
+_TABLE_HEAD_H = 34
+_TABLE_MAX_ROWS = 15
+
+_TABLE_TEMPLATE = """
+<style>
+html,body{margin:0;padding:0;background:#1A1A1A;color:#FFFFFF;
+  font-family:"Source Sans Pro",sans-serif;font-size:16px;}
+.pn-wrap{height:__BODY_H__px;overflow-y:auto;}
+table{width:100%;border-collapse:collapse;table-layout:fixed;text-align:center;}
+thead th{position:sticky;top:0;z-index:1;background:#1A1A1A;height:__HEAD_H__px;
+  font-size:1.1rem;font-weight:600;cursor:pointer;user-select:none;white-space:nowrap;}
+thead th.sorted::after{content:attr(data-dir);font-size:.7rem;margin-left:3px;opacity:.7;}
+td{height:__ROW_H__px;padding:0 4px;box-sizing:border-box;white-space:nowrap;
+  overflow:hidden;text-overflow:ellipsis;}
+tbody tr.alt{background:#222222;}
+.c-name{text-align:left;width:48%;}
+.c-time{border-left:1px solid #444;border-right:1px solid #444;width:14%;}
+.ok{color:#7BA77A;} .err{color:#C96C67;}
+.dot{display:inline-block;width:10px;height:10px;border-radius:50%;margin-right:6px;}
+.badge{display:inline-block;min-width:28px;padding:2px 6px;border-radius:6px;
+  font-weight:700;font-size:.85rem;line-height:1.2;}
+</style>
+<div class="pn-wrap" id="wrap">
+<table>
+  <thead><tr>
+    <th class="c-name" data-key="name">Disciplinas</th>
+    <th class="c-time" data-key="sec">Tempo</th>
+    <th data-key="hits"><span class="ok">✔</span></th>
+    <th data-key="mis"><span class="err">✕</span></th>
+    <th data-key="total">∑</th>
+    <th data-key="pct">%</th>
+  </tr></thead>
+  <tbody id="body"></tbody>
+</table>
+</div>
+<script>
+(function(){
+  const ROWS = __DATA__;
+  const ROW_H = __ROW_H__, BUFFER = 10;
+  const wrap = document.getElementById("wrap");
+  const body = document.getElementById("body");
+  const heads = document.querySelectorAll("thead th");
+  let order = ROWS.slice(), sortKey = "name", asc = true;
+
+  function esc(s){
+    // os atributos gerados usam aspas simples: ' também precisa virar entidade
+    return String(s).replace(/[&<>"']/g, c => ({"&":"&amp;","<":"&lt;",">":"&gt;",'"':"&quot;","'":"&#39;"}[c]));
+  }
+  function rowHtml(d, i){
+    return "<tr" + (i % 2 ? "" : " class='alt'") + ">"
+      + "<td class='c-name' title='" + esc(d.name) + "'><span class='dot' style='background:" + esc(d.color) + "'></span>" + esc(d.name) + "</td>"
+      + "<td class='c-time'>" + d.time + "</td>"
+      + "<td class='ok'>" + d.hits + "</td>"
+      + "<td class='err'>" + d.mis + "</td>"
+      + "<td>" + d.total + "</td>"
+      + "<td><span class='badge' style='background:" + esc(d.bg) + ";color:" + esc(d.fg) + "'>" + d.pct + "</span></td>"
+      + "</tr>";
+  }
+  function spacer(h){
+    return h > 0 ? "<tr style='height:" + h + "px'><td colspan='6'></td></tr>" : "";
+  }
+
+  // só as linhas visíveis (+ folga) entram no DOM; espaçadores mantêm a barra de rolagem
+  function paint(){
+    const first = Math.max(0, Math.floor(wrap.scrollTop / ROW_H) - BUFFER);
+    const last = Math.min(order.length, first + Math.ceil(wrap.clientHeight / ROW_H) + 2 * BUFFER);
+    let out = spacer(first * ROW_H);
+    for (let i = first; i < last; i++) out += rowHtml(order[i], i);
+    out += spacer((order.length - last) * ROW_H);
+    body.innerHTML = out;
+  }
+
+  function sortBy(key){
+    asc = key === sortKey ? !asc : key === "name";
+    sortKey = key;
+    const dir = asc ? 1 : -1;
+    order.sort((a, b) => {
+      const x = a[key], y = b[key];
+      const c = key === "name" ? x.localeCompare(y, "pt-BR", {sensitivity: "base"}) : x - y;
+      return c * dir || a.name.localeCompare(b.name, "pt-BR", {sensitivity: "base"});
+    });
+    heads.forEach(h => {
+      const on = h.dataset.key === sortKey;
+      h.classList.toggle("sorted", on);
+      h.dataset.dir = on ? (asc ? "▲" : "▼") : "";
+    });
+    wrap.scrollTop = 0;
+    paint();
+  }
+
+  heads.forEach(h => h.addEventListener("click", () => sortBy(h.dataset.key)));
+  let raf = null;
+  wrap.addEventListener("scroll", () => {
+    if (raf) return;
+    raf = requestAnimationFrame(() => { raf = null; paint(); });
+  });
+  asc = false;  // o primeiro sortBy("name") inverte para crescente
+  sortBy("name");
+})();
+</script>
+"""
+
+
+def _table_html(linhas: list[dict], colors: dict[str, str]) -> tuple[str, int]:
+    """HTML da tabela do PAINEL e a altura do iframe (`colors`: mapa de colors.py)."""
+    rows = []
+    for d in linhas:
+        total_sec = int(d.get("total_sec") or 0)
+        pct = int(d.get("pct") or 0)
+        bg, fg = _pct_colors(pct)
+        rows.append({
+            "name": d["subject"] or "",
+            "color": colors.get(d["subject"], "#2A2A2A"),
+            "sec": total_sec,
+            "time": fmt_horas(total_sec // 60) if total_sec else "-",
+            "hits": int(d["hits"]),
+            "mis": int(d["mistakes"]),
+            "total": int(d["total"]),
+            "pct": pct,
+            "bg": bg,
+            "fg": fg,
+        })
+    body_h = _TABLE_HEAD_H + min(len(rows), _TABLE_MAX_ROWS) * _TABLE_ROW_H
+    data = json.dumps(rows, ensure_ascii=False).replace("</", "<\\/")
+    out = (
+        _TABLE_TEMPLATE
+        .replace("__DATA__", data)
+        .replace("__BODY_H__", str(body_h))
+        .replace("__HEAD_H__", str(_TABLE_HEAD_H))
+        .replace("__ROW_H__", str(_TABLE_ROW_H))
+    )
+    return out, body_h
+
+
+def render_painel(snapshot: dict, drilldown: list[dict] | None = None):
+    """`drilldown`: árvore já buscada pelo prefetch (quando o detalhamento está ligado)."""
     user = get_current_user()
     if not user:
         return
@@ -54,70 +239,23 @@ def render_painel():
             unsafe_allow_html=True
         )
         
-        linhas = get_disciplinas_resumo(user["id"])
+        linhas = snapshot["disciplinas"]
         if not linhas:
             st.caption("Nenhum estudo registrado ainda.")
             return
 
-        # Ordena por nome
-        linhas = sorted(linhas, key=lambda d: (d.get("subject") or "").lower())
-
-        # Cabeçalho
-        cols = st.columns([4, 1, 0.5, 0.5, 0.5, 0.5])
-        headers = [
-            "Disciplinas",
-            "<div style='border-left:1px solid #444;border-right:1px solid #444;'>Tempo</div>",
-            "<span style='color:#7BA77A'>✔</span>",
-            "<span style='color:#C96C67'>✕</span>",
-            "∑",
-            "%"
-        ]
-        for c, h in zip(cols, headers):
-            c.markdown(
-                f"<div style='font-size: 1.1rem; font-weight: 600;'>{h}</div>",
-                unsafe_allow_html=True
-            )
-
-        # Linhas
-        for i, d in enumerate(linhas):
-            bg = "#1A1A1A" if i % 2 else "#222222"
-            c = st.columns([4, 1, 0.5, 0.5, 0.5, 0.5])
-
-            # Disciplina
-            c[0].markdown(
-                f"<div style='background:{bg};padding:4px; text-align: left;'>{d['subject']}</div>",
-                unsafe_allow_html=True
-            )
-
-            # Tempo
-            total_sec = int(d.get("total_sec") or 0)
-            tempo_fmt = fmt_horas(total_sec // 60) if total_sec else "-"
-            c[1].markdown(
-                f"<div style='background:{bg};padding:4px 8px;"
-                "border-left:1px solid #444;border-right:1px solid #444;"
-                "box-sizing:border-box;'>"
-                f"{tempo_fmt}"
-                "</div>",
-                unsafe_allow_html=True
-            )
-
-            # Acertos / Erros / Total
-            c[2].markdown(
-                f"<div style='background:{bg};padding:4px;color:#7BA77A'>{d['hits']}</div>",
-                unsafe_allow_html=True
-            )
-            c[3].markdown(
-                f"<div style='background:{bg};padding:4px;color:#C96C67'>{d['mistakes']}</div>",
-                unsafe_allow_html=True
-            )
-            c[4].markdown(
-                f"<div style='background:{bg};padding:4px'>{d['total']}</div>",
-                unsafe_allow_html=True
-            )
-
-            # % badge
-            pct_html = _pct_badge_html(int(d.get("pct", 0)))
-            c[5].markdown(
-                f"<div style='background:{bg};padding:4px;'>{pct_html}</div>",
-                unsafe_allow_html=True
-            )
+        # Totais da vida (user_stats, já no snapshot)
+        stats = snapshot["stats"]
+        questoes = stats["hits"] + stats["mistakes"]
+        acerto = f" · {round(100 * stats['hits'] / questoes)}% de acerto" if questoes else ""
+        st.caption(f"Total: {fmt_horas(stats['total_sec'] // 60)} · {questoes} questões{acerto}")
+
+        # Tabela: um único elemento, qualquer que seja o nº de disciplinas
+        table_html, height = _table_html(linhas, subject_color_map(user["id"], snapshot))
+        components.html(table_html, height=height, scrolling=False)
+
+        # Detalhamento: uma única query traz todos os níveis; expandir é só no navegador
+        if st.toggle("Detalhar por categoria e conteúdo", key="painel-detalhar"):
+            if drilldown is None:
+                drilldown = get_disciplinas_drilldown(user["id"])
+            st.markdown(_drilldown_html(drilldown), unsafe_allow_html=True)
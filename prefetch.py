@@ -0,0 +1,47 @@
+# prefetch.py — leituras independentes da home disparadas em paralelo
+#
+# O app.py monta, no topo da página, um dicionário {nome: leitura} com tudo o que
+# os componentes vão precisar (snapshot, página de registros, detalhamento do
+# PAINEL...) e recebe os resultados de uma vez. Cada leitura usa a própria
+# conexão do pool, então o tempo da página fica perto da leitura mais lenta em vez
+# da soma de todas.
+#
+# Só leituras entram aqui: nada de chamadas st.* dentro das funções (as threads
+# do pool não têm o contexto de execução do Streamlit).
+from __future__ import annotations
+
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+# compartilhado entre sessões; fique abaixo do pool do banco (db_engine)
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "4")),
+    thread_name_prefix="prefetch",
+)
+
+
+def prefetch(calls: Dict[str, Optional[Callable[[], Any]]]) -> Dict[str, Any]:
+    """
+    Executa as leituras ao mesmo tempo e devolve {nome: resultado}.
+    Entradas None são puladas (resultado None). A primeira leitura roda na
+    própria thread de quem chamou; exceções são relançadas aqui.
+    """
+    pending = [(name, fn) for name, fn in calls.items() if fn is not None]
+    results: Dict[str, Any] = {name: None for name in calls}
+    if not pending:
+        return results
+
+    (first_name, first_fn), rest = pending[0], pending[1:]
+    # cada leitura leva o contexto de quem pediu (ContextVars, ex.: seção do profiler)
+    futures = {name: _executor.submit(contextvars.copy_context().run, fn) for name, fn in rest}
+    try:
+        results[first_name] = first_fn()
+    except BaseException:
+        for fut in futures.values():
+            fut.cancel()
+        raise
+    for name, fut in futures.items():
+        results[name] = fut.result()
+    return results
@@ -0,0 +1,177 @@
+# profiler.py — quanto cada componente da home custa em cada rerun (modo de depuração)
+#
+#   ?profile=1 na URL, ou PROFILE_RENDER=1 no ambiente
+#   PROFILE_LOG=profile.jsonl   acrescenta uma linha JSON por rerun (análise offline)
+#
+# O app.py abre uma seção por componente (`with profile.section("render_painel"):`)
+# e, para cada uma, mede:
+#   wall_ms    tempo de parede da seção
+#   db_ms      tempo dentro de statements do banco (eventos do Engine)
+#   queries    statements executados — leituras do query_cache não contam
+#   elements   elementos enviados ao navegador (deltas new_element, inclusive os
+#              que o Streamlit troca por referência ao cache do navegador)
+# A seção corrente fica num ContextVar: as leituras do prefetch e as escritas do
+# escritor único do SQLite rodam em outras threads, mas herdam o contexto de quem
+# as pediu, então o tempo de banco delas cai na seção certa.
+#
+# O painel (um expander fechado) aparece no topo da home. Desligado, start_profile()
+# devolve um perfil nulo e as seções não custam nada.
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+_section: ContextVar[Optional[Dict[str, Any]]] = ContextVar("profile_section", default=None)
+
+_engine_lock = threading.Lock()
+_engine_hooked = False
+
+
+def enabled() -> bool:
+    return os.getenv("PROFILE_RENDER") == "1" or st.query_params.get("profile") == "1"
+
+
+# ------------------------------------------------------------------------------
+# Ganchos (banco e elementos), instalados uma vez e inertes fora de uma seção
+# ------------------------------------------------------------------------------
+
+def _hook_engine() -> None:
+    global _engine_hooked
+    with _engine_lock:
+        if _engine_hooked:
+            return
+        from sqlalchemy import event
+
+        from db import engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if _section.get() is not None:
+                context._profile_t0 = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            sec = _section.get()
+            t0 = getattr(context, "_profile_t0", None)
+            if sec is not None and t0 is not None:
+                elapsed = time.perf_counter() - t0
+                with sec["lock"]:  # o prefetch soma de várias threads
+                    sec["db_s"] += elapsed
+                    sec["queries"] += 1
+
+        _engine_hooked = True
+
+
+def _hook_elements() -> None:
+    """
+    Conta os new_element enviados pela sessão enquanto uma seção está aberta.
+    Envolve ctx.enqueue, e não ctx._enqueue: depois dele, um elemento que o
+    navegador já tem em cache virou só um ref_hash e não seria contado.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or getattr(ctx, "_profile_counting", False):
+        return
+    enqueue = ctx.enqueue
+
+    def counting(msg):
+        sec = _section.get()
+        if sec is not None and msg.WhichOneof("type") == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            sec["elements"] += 1
+        enqueue(msg)
+
+    ctx.enqueue = counting
+    ctx._profile_counting = True
+
+
+# ------------------------------------------------------------------------------
+# Perfil de um rerun
+# ------------------------------------------------------------------------------
+
+class RenderProfile:
+    """Seções medidas de um rerun; `finish()` desenha o painel e grava o log."""
+
+    def __init__(self):
+        _hook_engine()
+        _hook_elements()
+        self.t0 = time.perf_counter()
+        self.sections: List[Dict[str, Any]] = []
+        self.panel = st.container()  # reservado no topo; preenchido no finish()
+
+    @contextmanager
+    def section(self, name: str):
+        sec = {"name": name, "db_s": 0.0, "queries": 0, "elements": 0, "lock": threading.Lock()}
+        token = _section.set(sec)
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            sec["wall_s"] = time.perf_counter() - t
+            _section.reset(token)
+            self.sections.append(sec)
+
+    def rows(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": s["name"],
+                "wall_ms": round(s["wall_s"] * 1000, 2),
+                "db_ms": round(s["db_s"] * 1000, 2),
+                "queries": s["queries"],
+                "elements": s["elements"],
+            }
+            for s in self.sections
+        ]
+
+    def finish(self, user_id: Optional[int] = None) -> None:
+        total_ms = (time.perf_counter() - self.t0) * 1000
+        rows = self.rows()
+        self._render(rows, total_ms)
+        path = os.getenv("PROFILE_LOG")
+        if path:
+            record = {
+                "ts": dt.datetime.now().isoformat(timespec="milliseconds"),
+                "user_id": user_id,
+                "total_ms": round(total_ms, 2),
+                "sections": rows,
+            }
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _render(self, rows: List[Dict[str, Any]], total_ms: float) -> None:
+        sections_ms = sum(r["wall_ms"] for r in rows)
+        lines = [
+            "| componente | parede (ms) | banco (ms) | queries | elementos |",
+            "|---|---:|---:|---:|---:|",
+        ]
+        for r in sorted(rows, key=lambda r: -r["wall_ms"]):
+            lines.append(
+                f"| `{r['name']}` | {r['wall_ms']:.1f} | {r['db_ms']:.1f} | {r['queries']} | {r['elements']} |"
+            )
+        lines.append(
+            f"| **rerun** | **{total_ms:.1f}** | {sum(r['db_ms'] for r in rows):.1f} | "
+            f"{sum(r['queries'] for r in rows)} | {sum(r['elements'] for r in rows)} |"
+        )
+        with self.panel.expander(f"⏱ Profiler — {total_ms:.0f} ms", expanded=False):
+            st.markdown("\n".join(lines))
+            st.caption(f"fora das seções: {max(0.0, total_ms - sections_ms):.1f} ms")
+
+
+class _NullProfile:
+    def section(self, name: str):
+        return nullcontext()
+
+    def finish(self, user_id: Optional[int] = None) -> None:
+        pass
+
+
+def start_profile():
+    """RenderProfile se o modo de depuração estiver ligado; senão um perfil nulo."""
+    return RenderProfile() if enabled() else _NullProfile()
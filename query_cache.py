@@ -0,0 +1,182 @@
+# query_cache.py — cache em memória das leituras do db.py, escopado por usuário
+#
+# - Chave: (função, argumentos, versão de dados do usuário, dia corrente).
+# - Toda escrita de um usuário (create/delete de registro, metas, cores) incrementa
+#   a versão dele; as entradas antigas deixam de ser alcançáveis e saem por LRU/TTL.
+# - Valores guardados com pickle: cada leitura recebe uma cópia (quem chama pode
+#   mutar o resultado sem corromper o cache) e o tamanho em bytes sai de graça.
+# - Limites configuráveis por ambiente:
+#     QUERY_CACHE_MAX_ENTRIES (padrão 2048; 0 desliga o cache)
+#     QUERY_CACHE_MAX_BYTES   (padrão 64 MiB)
+#     QUERY_CACHE_TTL         (segundos, padrão 300)
+# - A versão é por processo: com vários processos servindo o app, o TTL limita
+#   quanto tempo uma escrita feita em outro processo pode ficar invisível.
+from __future__ import annotations
+
+import functools
+import inspect
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+
+class QueryCache:
+    """LRU com limite de entradas, de bytes e TTL; thread-safe."""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl)
+        self._data: "OrderedDict[Hashable, Tuple[float, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return False, None
+            expires_at, blob = item
+            if expires_at < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+        return True, pickle.loads(blob)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return  # sozinho já estoura o limite: não vale a pena guardar
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, blob)
+            self._bytes += len(blob)
+            while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._data))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+            }
+
+    def _drop(self, key: Hashable) -> None:
+        _, blob = self._data.pop(key)
+        self._bytes -= len(blob)
+
+
+cache = QueryCache(
+    max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "2048")),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "300")),
+)
+
+# ------------------------------------------------------------------------------
+# Versão de dados por usuário
+# ------------------------------------------------------------------------------
+
+_versions: Dict[int, int] = {}
+_versions_lock = threading.Lock()
+_clear_hooks: List[Callable[[], None]] = []  # caches derivados, limpos junto no clear geral
+
+
+def on_clear(fn: Callable[[], None]) -> Callable[[], None]:
+    """Registra `fn` para rodar quando todas as leituras são invalidadas (bump_version(None))."""
+    _clear_hooks.append(fn)
+    return fn
+
+
+def data_version(user_id: int) -> int:
+    return _versions.get(int(user_id), 0)
+
+
+def bump_version(user_id: Optional[int]) -> None:
+    """Invalida as leituras de um usuário (ou de todos, com None)."""
+    if user_id is None:
+        cache.clear()
+        for fn in _clear_hooks:
+            fn()
+        return
+    with _versions_lock:
+        uid = int(user_id)
+        _versions[uid] = _versions.get(uid, 0) + 1
+
+
+def get_cache_stats() -> Dict[str, int]:
+    return cache.stats()
+
+
+# ------------------------------------------------------------------------------
+# Decoradores usados no db.py
+# ------------------------------------------------------------------------------
+
+def _bound_args(sig: inspect.Signature, args, kwargs) -> "OrderedDict[str, Any]":
+    bound = sig.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return bound.arguments
+
+
+def cached_read(fn: Callable) -> Callable:
+    """Cacheia uma leitura cujo parâmetro `user_id` define o escopo de invalidação."""
+    sig = inspect.signature(fn)
+    name = fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not cache.enabled:
+            return fn(*args, **kwargs)
+        arguments = _bound_args(sig, args, kwargs)
+        uid = int(arguments["user_id"])
+        # o dia entra na chave: presença/semana dependem de "hoje"
+        key = (name, data_version(uid), date.today().toordinal(), tuple(arguments.items()))
+        hit, value = cache.get(key)
+        if hit:
+            return value
+        value = fn(*args, **kwargs)
+        cache.set(key, value)
+        return value
+
+    return wrapper
+
+
+def invalidates_user(fn: Callable) -> Callable:
+    """Escrita: ao terminar (após o commit), incrementa a versão do `user_id`."""
+    sig = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            bump_version(_bound_args(sig, args, kwargs).get("user_id"))
+
+    return wrapper
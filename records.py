@@ -0,0 +1,256 @@
+# records.py — "Meus Registros de Estudo": lista paginada (cursor) com filtros
+import datetime as dt
+import html
+import os
+
+import streamlit as st
+
+from auth import get_current_user
+from db import HL_END, HL_START, get_study_records_page, delete_study_record, normalize_search
+from dialogs import dialog_import_records
+from records_io import EXPORT_FORMATS, cleanup_stale_exports, export_records_to_tempfile
+from utils import CATEGORIAS
+
+PAGE_SIZES = [10, 20, 50]
+
+cleanup_stale_exports()  # sobras de um processo anterior (uma vez, no import)
+
+
+def _reset_pages():
+    # pilha com o cursor de início de cada página visitada (None = primeira)
+    st.session_state["_rec_cursors"] = [None]
+
+
+def _fmt_duration(sec: int) -> str:
+    sec = int(sec or 0)
+    return f"{sec // 3600}h {(sec % 3600) // 60}min"
+
+
+def _fmt_pages(r: dict) -> str:
+    if r.get("page_start") or r.get("page_end"):
+        return f"{r.get('page_start') or '-'} até {r.get('page_end') or '-'}"
+    return ""
+
+
+def _table_rows(records: list[dict]) -> list[dict]:
+    out = []
+    for r in records:
+        try:
+            dt_br = dt.datetime.strptime(r["study_date"], "%Y-%m-%d").strftime("%d/%m/%Y")
+        except Exception:
+            dt_br = r["study_date"]
+        out.append({
+            "Data": dt_br,
+            "Categoria": r.get("category") or "",
+            "Disciplina": r.get("subject") or "",
+            "Duração": _fmt_duration(r["duration_sec"]),
+            "Conteúdo": r.get("topic") or "",
+            "Acertos": r.get("hits") or 0,
+            "Erros": r.get("mistakes") or 0,
+            "Páginas": _fmt_pages(r),
+            "Comentário": r.get("comment") or "",
+            "Salvo em": str(r.get("created_at") or ""),
+        })
+    return out
+
+
+def _highlight(text: str | None) -> str:
+    """Trecho vindo da busca: escapa o texto e troca os marcadores por <mark>."""
+    out = html.escape(text or "")
+    return out.replace(HL_START, "<mark>").replace(HL_END, "</mark>")
+
+
+def _search_results_html(records: list[dict]) -> str:
+    """Resultados da busca num único bloco, com os termos destacados."""
+    parts = ["<div style='display:flex; flex-direction:column; gap:6px;'>"]
+    for r in records:
+        try:
+            dt_br = dt.datetime.strptime(r["study_date"], "%Y-%m-%d").strftime("%d/%m/%Y")
+        except Exception:
+            dt_br = r["study_date"]
+        meta = " · ".join(html.escape(x) for x in (dt_br, r.get("subject") or "", r.get("category") or "") if x)
+        parts.append(
+            "<div style='background:#1A1A1A; border:1px solid #2a2a2a; border-radius:8px; padding:6px 10px;'>"
+            f"<div style='font-size:.8rem; opacity:.7;'>{meta} · {_fmt_duration(r['duration_sec'])}</div>"
+        )
+        if r.get("topic"):
+            parts.append(f"<div>{_highlight(r.get('topic_hl') or r['topic'])}</div>")
+        if r.get("comment"):
+            parts.append(f"<div style='font-size:.9rem; opacity:.85;'>💬 {_highlight(r.get('comment_hl') or r['comment'])}</div>")
+        parts.append("</div>")
+    parts.append("</div>")
+    return "".join(parts)
+
+
+def _page_args(user_id: int, periodo, subject, category, page_size, search=None) -> dict:
+    """Argumentos de get_study_records_page para os filtros e a página corrente."""
+    periodo = periodo or ()
+    start_date = periodo[0].isoformat() if len(periodo) >= 1 else None
+    end_date = periodo[1].isoformat() if len(periodo) == 2 else start_date
+    return {
+        "user_id": user_id,
+        "limit": page_size,
+        "cursor": st.session_state.get("_rec_cursors", [None])[-1],
+        "start_date": start_date,
+        "end_date": end_date,
+        "subject": subject,
+        "category": category,
+        "search": normalize_search(search),
+    }
+
+
+def records_page_args(user_id: int) -> dict:
+    """Os mesmos argumentos, lidos do estado dos filtros antes de desenhá-los (prefetch)."""
+    ss = st.session_state
+    return _page_args(
+        user_id, ss.get("rec-periodo"), ss.get("rec-disciplina"),
+        ss.get("rec-categoria"), ss.get("rec-page-size", PAGE_SIZES[1]), ss.get("rec-busca"),
+    )
+
+
+def _discard_export():
+    st.session_state.pop("_rec_export", None)
+
+
+def _render_export(user: dict):
+    """
+    Gera o arquivo sob demanda (em blocos, direto no disco), lê uma única vez e
+    apaga o temporário. Os reruns seguintes passam os mesmos bytes ao download
+    (o media manager do Streamlit reconhece o conteúdo e não guarda outra cópia);
+    o clique em "Baixar" os descarta.
+    """
+    fmt = st.radio("Formato", list(EXPORT_FORMATS), horizontal=True, key="rec-export-fmt")
+    if st.button("Gerar arquivo", key="rec-export-gerar", use_container_width=True):
+        _discard_export()
+        cleanup_stale_exports()
+        with st.spinner("Exportando..."):
+            path, n = export_records_to_tempfile(user["id"], fmt)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            finally:
+                os.remove(path)
+        st.session_state["_rec_export"] = {"data": data, "fmt": fmt, "n": n}
+
+    export = st.session_state.get("_rec_export")
+    if export:
+        suffix, mime = EXPORT_FORMATS[export["fmt"]]
+        st.caption(f"{export['n']} registro(s) prontos.")
+        st.download_button(
+            "Baixar",
+            data=export["data"],
+            file_name=f"estudos_{dt.date.today().isoformat()}{suffix}",
+            mime=mime,
+            on_click=_discard_export,
+            key="rec-export-baixar",
+            use_container_width=True,
+        )
+
+
+def render_records(snapshot: dict, prefetched: dict | None = None):
+    """
+    `prefetched` = {"args": ..., "page": ...} vindo do prefetch do app.py; só é
+    usado se os filtros desenhados agora baterem com os argumentos da busca.
+    """
+    user = get_current_user()
+    if not user:
+        return
+
+    st.session_state.setdefault("_rec_cursors", [None])
+    st.session_state.setdefault("_rec_table_v", 0)
+
+    b_import, b_export, _ = st.columns([1, 1, 5])
+    with b_import:
+        if st.button("Importar registros", key="rec-importar", use_container_width=True):
+            dialog_import_records()
+    with b_export:
+        with st.popover("Exportar", use_container_width=True):
+            _render_export(user)
+
+    # ---------- Filtros (mudar qualquer um volta para a primeira página) ----------
+    search = st.text_input(
+        "Buscar",
+        placeholder="Buscar no conteúdo e nos comentários (ex.: licitações)",
+        key="rec-busca",
+        on_change=_reset_pages,
+        label_visibility="collapsed",
+    )
+    subjects = [d["subject"] for d in snapshot["disciplinas"]]
+    f_periodo, f_disc, f_cat, f_size = st.columns([2, 2, 2, 1])
+    with f_periodo:
+        periodo = st.date_input(
+            "Período", value=(), format="DD/MM/YYYY", key="rec-periodo", on_change=_reset_pages
+        )
+    with f_disc:
+        subject = st.selectbox(
+            "Disciplina", subjects, index=None, placeholder="Todas", key="rec-disciplina", on_change=_reset_pages
+        )
+    with f_cat:
+        category = st.selectbox(
+            "Categoria", CATEGORIAS, index=None, placeholder="Todas", key="rec-categoria", on_change=_reset_pages
+        )
+    with f_size:
+        page_size = st.selectbox("Por página", PAGE_SIZES, index=1, key="rec-page-size", on_change=_reset_pages)
+
+    cursors = st.session_state["_rec_cursors"]
+    args = _page_args(user["id"], periodo, subject, category, page_size, search)
+    if prefetched and prefetched["args"] == args:
+        page = prefetched["page"]
+    else:
+        page = get_study_records_page(**args)
+    records = page["records"]
+
+    if not records:
+        st.info("Nenhum registro encontrado.")
+        if len(cursors) > 1 and st.button("⭠ Voltar ao início", key="rec-first"):
+            _reset_pages()
+            st.rerun()
+        return
+
+    if args["search"]:
+        # ---------- Resultados da busca (trechos destacados) ----------
+        st.markdown(_search_results_html(records), unsafe_allow_html=True)
+        _render_nav(st.columns([4, 1, 1, 1])[1:], cursors, page)
+        return
+
+    # ---------- Tabela (um único elemento, com seleção para excluir) ----------
+    event = st.dataframe(
+        _table_rows(records),
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="multi-row",
+        key=f"rec-table-{st.session_state['_rec_table_v']}",
+    )
+    selected = [records[i]["id"] for i in event.selection.rows]
+
+    acoes, *nav = st.columns([4, 1, 1, 1])
+    with acoes:
+        if st.button(
+            f"🗑️ Excluir selecionados ({len(selected)})", key="rec-delete", disabled=not selected
+        ):
+            ok = sum(1 for rid in selected if delete_study_record(rid, user["id"]))
+            if ok:
+                st.toast(f"{ok} registro(s) excluído(s) com sucesso.")
+            if ok < len(selected):
+                st.error("Não foi possível excluir alguns registros.")
+            st.session_state["_rec_table_v"] += 1  # limpa a seleção
+            st.rerun()
+    _render_nav(nav, cursors, page)
+
+
+def _render_nav(cols: list, cursors: list, page: dict):
+    nav_prev, nav_info, nav_next = cols
+    with nav_prev:
+        if st.button("⭠", key="rec-prev", disabled=len(cursors) <= 1, use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with nav_info:
+        st.markdown(
+            f"<div style='text-align:center; padding-top:6px;'>Página {len(cursors)}</div>",
+            unsafe_allow_html=True,
+        )
+    with nav_next:
+        if st.button("⭢", key="rec-next", disabled=page["next_cursor"] is None, use_container_width=True):
+            cursors.append(page["next_cursor"])
+            st.rerun()
@@ -0,0 +1,300 @@
+# records_io.py — importação (CSV / JSON / JSON Lines) e exportação (CSV / Parquet)
+# de registros de estudo
+#
+# Importação — colunas aceitas (nome em inglês ou português, sem diferenciar maiúsculas/acentos):
+#   study_date | data            -> YYYY-MM-DD ou DD/MM/YYYY (obrigatória)
+#   category   | categoria       -> uma de utils.CATEGORIAS (obrigatória)
+#   subject    | disciplina      -> texto (obrigatória)
+#   duration_sec                 -> segundos  ┐ uma das duas (obrigatória)
+#   tempo      | duracao         -> HH:MM[:SS] ou minutos ┘
+#   topic      | conteudo        -> texto
+#   hits       | acertos         -> inteiro >= 0
+#   mistakes   | erros           -> inteiro >= 0
+#   page_start | pagina_inicio   -> inteiro >= 0
+#   page_end   | pagina_fim      -> inteiro >= 0
+#   comment    | comentario      -> texto
+#
+# Exportação — lê o banco em blocos (db.iter_study_records) e grava cada bloco
+# direto no arquivo, então a memória fica constante com qualquer tamanho de histórico.
+from __future__ import annotations
+
+import csv
+import datetime as dt
+import io
+import json
+import math
+import os
+import tempfile
+import time
+import unicodedata
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from db import iter_study_records
+from utils import CATEGORIAS, validar_registro
+
+_ALIASES = {
+    "study_date": "study_date", "data": "study_date",
+    "category": "category", "categoria": "category",
+    "subject": "subject", "disciplina": "subject",
+    "duration_sec": "duration_sec",
+    "tempo": "tempo", "duracao": "tempo", "duration": "tempo",
+    "topic": "topic", "conteudo": "topic",
+    "hits": "hits", "acertos": "hits",
+    "mistakes": "mistakes", "erros": "mistakes",
+    "page_start": "page_start", "pagina_inicio": "page_start",
+    "page_end": "page_end", "pagina_fim": "page_end",
+    "comment": "comment", "comentario": "comment",
+}
+
+
+def _norm(s: str) -> str:
+    s = unicodedata.normalize("NFKD", str(s)).encode("ascii", "ignore").decode("ascii")
+    return s.strip().lower().replace(" ", "_")
+
+
+# categorias comparadas sem acento/maiúsculas ("revisao" -> "Revisão")
+_CATEGORIAS_NORM = {_norm(c): c for c in CATEGORIAS}
+
+
+def _parse_date(v: Any) -> dt.date:
+    s = str(v).strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return dt.datetime.strptime(s[:10], fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"data inválida: {s!r}")
+
+
+def _finite(v: Any, campo: str) -> float:
+    x = float(v)
+    if not math.isfinite(x):
+        raise ValueError(f"{campo} inválido: {v!r}")
+    return x
+
+
+def _parse_duration(raw: Dict[str, Any]) -> int:
+    if raw.get("duration_sec") not in (None, ""):
+        return int(_finite(raw["duration_sec"], "duration_sec"))
+    tempo = str(raw.get("tempo") or "").strip()
+    if not tempo:
+        return 0
+    if ":" in tempo:
+        parts = [int(p) for p in tempo.split(":")]
+        parts += [0] * (3 - len(parts))
+        h, m, s = parts[:3]
+        return h * 3600 + m * 60 + s
+    return int(_finite(tempo, "tempo") * 60)  # minutos
+
+
+def _opt_int(v: Any, campo: str) -> Optional[int]:
+    if v in (None, ""):
+        return None
+    n = int(_finite(v, campo))
+    if n < 0:
+        raise ValueError(f"{campo} não pode ser negativo")
+    return n
+
+
+def _opt_text(v: Any) -> Optional[str]:
+    s = "" if v is None else str(v).strip()
+    return s or None
+
+
+def validate_row(
+    raw: Dict[str, Any], max_date: Optional[dt.date] = None, min_date: Optional[dt.date] = None
+) -> Dict[str, Any]:
+    """
+    Converte uma linha crua no formato de db.create_study_record.
+    Aplica as regras do diálogo (utils.validar_registro) e rejeita datas futuras ou
+    anteriores a `min_date` (criação da conta: dias, semana e sequência não as mostram).
+    Lança ValueError com a descrição do problema.
+    """
+    row = {_ALIASES[k2]: v for k, v in raw.items() if (k2 := _norm(k)) in _ALIASES}
+    max_date = max_date or dt.date.today()
+
+    if not row.get("study_date"):
+        raise ValueError("data não preenchida")
+    study_date = _parse_date(row["study_date"])
+    if study_date > max_date:
+        raise ValueError(f"data no futuro: {study_date.isoformat()}")
+    if min_date and study_date < min_date:
+        raise ValueError(
+            f"data anterior à criação da conta ({min_date.strftime('%d/%m/%Y')}): {study_date.isoformat()}"
+        )
+
+    category = _CATEGORIAS_NORM.get(_norm(row.get("category") or ""), row.get("category"))
+    subject = _opt_text(row.get("subject"))
+    duration_sec = _parse_duration(row)
+
+    erros = validar_registro(duration_sec, category, subject)
+    if erros:
+        raise ValueError("; ".join(erros))
+
+    return {
+        "study_date": study_date.isoformat(),
+        "category": category,
+        "subject": subject,
+        "topic": _opt_text(row.get("topic")),
+        "duration_sec": duration_sec,
+        "hits": _opt_int(row.get("hits"), "acertos"),
+        "mistakes": _opt_int(row.get("mistakes"), "erros"),
+        "page_start": _opt_int(row.get("page_start"), "página inicial"),
+        "page_end": _opt_int(row.get("page_end"), "página final"),
+        "comment": _opt_text(row.get("comment")),
+    }
+
+
+def _iter_raw(filename: str, data: bytes) -> Iterator[Dict[str, Any]]:
+    name = filename.lower()
+    text = data.decode("utf-8-sig")
+    if name.endswith(".jsonl") or name.endswith(".ndjson"):
+        for line in io.StringIO(text):
+            if line.strip():
+                yield json.loads(line)
+    elif name.endswith(".json"):
+        payload = json.loads(text)
+        if isinstance(payload, dict):
+            payload = payload.get("records") or payload.get("registros") or []
+        if not isinstance(payload, list):
+            raise ValueError("JSON deve ser uma lista de objetos")
+        yield from payload
+    else:
+        sample = text[:4096]
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.DictReader(io.StringIO(text), dialect=dialect)
+
+
+def parse_records_file(
+    filename: str, data: bytes, min_date: Optional[dt.date] = None
+) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+    """
+    Lê um arquivo CSV/JSON/JSONL e valida cada linha (datas entre `min_date` e hoje).
+    Retorna (registros_válidos, [(nº_da_linha, erro), ...]). A numeração começa em 1.
+    """
+    valid: List[Dict[str, Any]] = []
+    errors: List[Tuple[int, str]] = []
+    today = dt.date.today()
+    try:
+        for i, raw in enumerate(_iter_raw(filename, data), start=1):
+            if not isinstance(raw, dict):
+                errors.append((i, "linha não é um objeto"))
+                continue
+            try:
+                valid.append(validate_row(raw, max_date=today, min_date=min_date))
+            except (ValueError, TypeError) as e:
+                errors.append((i, str(e)))
+    except (UnicodeDecodeError, json.JSONDecodeError, csv.Error, ValueError) as e:
+        errors.append((0, f"arquivo ilegível: {e}"))
+    return valid, errors
+
+
+# ------------------------------------------------------------------------------
+# Exportação
+# ------------------------------------------------------------------------------
+
+EXPORT_COLUMNS = [
+    "id", "study_date", "category", "subject", "topic", "duration_sec",
+    "hits", "mistakes", "page_start", "page_end", "comment", "created_at",
+]
+
+EXPORT_FORMATS = {
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def _created_at(v: Any) -> Optional[dt.datetime]:
+    if v is None or isinstance(v, dt.datetime):
+        return v
+    try:
+        return dt.datetime.fromisoformat(str(v))
+    except ValueError:
+        return None
+
+
+def write_records_csv(user_id: int, fileobj, chunk_size: int = 5000) -> int:
+    """Grava os registros do usuário em CSV (UTF-8 com BOM, abre direto no Excel)."""
+    writer = csv.DictWriter(fileobj, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+    fileobj.write("\ufeff")
+    writer.writeheader()
+    n = 0
+    for chunk in iter_study_records(user_id, chunk_size=chunk_size):
+        writer.writerows(chunk)
+        n += len(chunk)
+    return n
+
+
+def write_records_parquet(user_id: int, path: str, chunk_size: int = 5000) -> int:
+    """Grava os registros do usuário em Parquet, um row group por bloco lido do banco."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("study_date", pa.date32()),
+        ("category", pa.string()),
+        ("subject", pa.string()),
+        ("topic", pa.string()),
+        ("duration_sec", pa.int64()),
+        ("hits", pa.int64()),
+        ("mistakes", pa.int64()),
+        ("page_start", pa.int64()),
+        ("page_end", pa.int64()),
+        ("comment", pa.string()),
+        ("created_at", pa.timestamp("s")),
+    ])
+    n = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        for chunk in iter_study_records(user_id, chunk_size=chunk_size):
+            cols = {c: [r.get(c) for r in chunk] for c in EXPORT_COLUMNS}
+            cols["study_date"] = [dt.date.fromisoformat(v) if v else None for v in cols["study_date"]]
+            cols["created_at"] = [_created_at(v) for v in cols["created_at"]]
+            writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+            n += len(chunk)
+    return n
+
+
+EXPORT_PREFIX = "estudos_"
+
+
+def export_records_to_tempfile(user_id: int, fmt: str) -> Tuple[str, int]:
+    """Exporta para um arquivo temporário no disco. Retorna (caminho, nº de registros)."""
+    suffix, _mime = EXPORT_FORMATS[fmt]
+    fd, path = tempfile.mkstemp(prefix=EXPORT_PREFIX, suffix=suffix)
+    try:
+        if fmt == "CSV":
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+                n = write_records_csv(user_id, f)
+        else:
+            os.close(fd)
+            n = write_records_parquet(user_id, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, n
+
+
+def cleanup_stale_exports(max_age: float = 3600) -> int:
+    """
+    Apaga exportações temporárias esquecidas (processo que caiu no meio, por exemplo)
+    com mais de `max_age` segundos. Retorna quantas saíram.
+    """
+    tmp = tempfile.gettempdir()
+    suffixes = tuple(suffix for suffix, _mime in EXPORT_FORMATS.values())
+    limit = time.time() - max_age
+    removed = 0
+    for name in os.listdir(tmp):
+        if not (name.startswith(EXPORT_PREFIX) and name.endswith(suffixes)):
+            continue
+        path = os.path.join(tmp, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass  # outro processo apagou antes
+    return removed
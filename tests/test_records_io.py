@@ -0,0 +1,58 @@
+# Importação de registros: arquivos que parecem válidos não podem derrubar o diálogo
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records_io import cleanup_stale_exports, parse_records_file  # noqa: E402
+
+HEADER = "study_date,category,subject,duration_sec\n"
+
+
+def test_duracao_infinita_vira_erro_da_linha():
+    data = (HEADER + "2024-01-02,Teoria,Português,inf\n2024-01-02,Teoria,Português,600\n").encode()
+    valid, errors = parse_records_file("r.csv", data)
+    assert len(valid) == 1
+    assert errors and errors[0][0] == 1
+
+
+def test_inteiro_nao_finito_vira_erro_da_linha():
+    data = (
+        "study_date,category,subject,duration_sec,hits\n"
+        "2024-01-02,Teoria,Português,600,nan\n"
+    ).encode()
+    valid, errors = parse_records_file("r.csv", data)
+    assert valid == [] and errors[0][0] == 1
+
+
+def test_json_escalar_no_topo_vira_erro_do_arquivo():
+    valid, errors = parse_records_file("r.json", b"5")
+    assert valid == []
+    assert errors == [(0, "arquivo ilegível: JSON deve ser uma lista de objetos")]
+
+
+def test_data_anterior_a_criacao_da_conta_e_rejeitada():
+    import datetime as dt
+
+    data = (HEADER + "2024-01-01,Teoria,Português,600\n2024-01-02,Teoria,Português,600\n").encode()
+    valid, errors = parse_records_file("r.csv", data, min_date=dt.date(2024, 1, 2))
+    assert [r["study_date"] for r in valid] == ["2024-01-02"]
+    assert errors[0][0] == 1 and "criação da conta" in errors[0][1]
+
+
+def test_limpeza_so_apaga_exportacoes_antigas(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    old = tmp_path / "estudos_abc.csv"
+    fresh = tmp_path / "estudos_def.csv"
+    other = tmp_path / "outro_ghi.csv"
+    for p in (old, fresh, other):
+        p.write_text("x")
+    past = time.time() - 7200
+    os.utime(old, (past, past))
+    os.utime(other, (past, past))
+
+    assert cleanup_stale_exports(max_age=3600) == 1
+    assert not old.exists() and fresh.exists() and other.exists()
@@ -2,6 +2,8 @@ import streamlit as st
 from pathlib import Path
 from datetime import date, timedelta
 
+CATEGORIAS = ["Teoria", "Revisão", "Questões", "Leitura de Lei", "Jurisprudência"]
+
 def local_css(rel_path: str = "assets/styles/styles.css") -> None:
     css_path = Path(rel_path) 
     if not css_path.exists():
@@ -20,4 +22,15 @@ def week_range_starting_sunday(d: date) -> tuple[date, date]:
 def fmt_horas(minutos: int) -> str:
     """Formata minutos como '00h00min' obrigatoriamente."""
     h, m = divmod(int(minutos), 60)
-    return f"{h:02d}h{m:02d}min"
\ No newline at end of file
+    return f"{h:02d}h{m:02d}min"
+
+def validar_registro(duration_sec: int, categoria: str | None, disciplina: str | None) -> list[str]:
+    """Regras do registro de estudo (diálogo e importação). Lista vazia = válido."""
+    erros = []
+    if not duration_sec or int(duration_sec) <= 0:
+        erros.append("tempo de estudo deve ser maior que zero")
+    if categoria not in CATEGORIAS:
+        erros.append(f"categoria inválida (use: {', '.join(CATEGORIAS)})")
+    if not (disciplina or "").strip():
+        erros.append("disciplina não preenchida")
+    return erros
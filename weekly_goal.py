@@ -4,12 +4,6 @@ from streamlit_extras.stylable_container import stylable_container
 from dialogs import dialog_weekly_goal
 
 from auth import get_current_user
-from db import (
-    get_weekly_goal,
-    get_total_minutes_by_date_range,
-    get_questions_breakdown_by_date_range,
-)
-import datetime as dt
 import textwrap
 
 
@@ -70,7 +64,7 @@ def render_progress_bar(
     st.markdown(html, unsafe_allow_html=True)
 
 
-def render_weekly_goal():
+def render_weekly_goal(snapshot: dict):
     with stylable_container(
         key="meta-de-estudo-semanal",
         css_styles="""
@@ -112,25 +106,13 @@ def render_weekly_goal():
             return
 
         # Se o usuário ainda não tem metas, trate como 0 por padrão
-        goal = get_weekly_goal(user["id"]) or {"target_hours": 0, "target_questions": 0}
+        goal = snapshot["weekly_goal"] or {"target_hours": 0, "target_questions": 0}
 
-        # Semana atual (segunda → domingo)
-        today = dt.date.today()
-        start_week = today - dt.timedelta(days=today.weekday())
-        end_week = start_week + dt.timedelta(days=6)
-
-        # Minutos estudados na semana
-        minutes_by_day = get_total_minutes_by_date_range(
-            user["id"], start_week.isoformat(), end_week.isoformat()
-        )
-        total_minutes = sum(minutes_by_day.values())
+        # Semana atual (segunda → domingo), já somada no snapshot
+        total_minutes = snapshot["goal_progress"]["minutes"]
         target_minutes = int(goal["target_hours"]) * 60
 
-        # Questões na semana
-        breakdown = get_questions_breakdown_by_date_range(
-            user["id"], start_week.isoformat(), end_week.isoformat()
-        )
-        total_questions = sum((v["hits"] + v["mistakes"]) for v in breakdown.values())
+        total_questions = snapshot["goal_progress"]["questions"]
         target_questions = int(goal["target_questions"])
 
         # Barras (porcentagem dentro; com min-width para sempre exibir "0.0%")
@@ -1,20 +1,18 @@
 import datetime as dt
-from datetime import timedelta
-import pandas as pd
-import altair as alt
+import math
+import threading
+from collections import OrderedDict
+
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
 
 from auth import get_current_user
-from db import (
-    get_user_created_date,
-    get_total_minutes_by_date_range,
-    get_questions_breakdown_by_date_range,  # novo
-)
-from utils import week_range_starting_sunday, fmt_horas
+from query_cache import data_version
+from utils import fmt_horas
 
 
 WEEKDAY_LABELS_PT = ["DOM", "SEG", "TER", "QUA", "QUI", "SEX", "SAB"]
+MODOS = ["TEMPO", "QUESTÕES"]
 
 
 def _sunday_of_week(d: dt.date) -> dt.date:
@@ -26,36 +24,9 @@ def _clamp(date_val: dt.date, min_d: dt.date, max_d: dt.date) -> dt.date:
     return max(min_d, min(max_d, date_val))
 
 
-def render_weekly_study():
-    user = get_current_user()
-    if not user:
-        return
-
-    # -------------------- Config. de Pills (Opção B) --------------------
-    OPTIONS = ["TEMPO", "QUESTÕES"]
-    DEFAULT_PILL = "TEMPO"
-
-    # Garante um "último válido" desde o primeiro run
-    st.session_state.setdefault("_last_pill_semana", DEFAULT_PILL)
-
-    # Antes de renderizar qualquer coisa, clamp do valor atual para evitar None
-    current_sel = st.session_state.get("pill-semana", st.session_state["_last_pill_semana"])
-    if current_sel not in OPTIONS:
-        current_sel = st.session_state["_last_pill_semana"]
-        st.session_state["pill-semana"] = current_sel  # mantém consistência de estado
-    # -------------------------------------------------------------------
-
+def resolve_week_start(created: dt.date | None) -> dt.date:
+    """Semana (domingo) exibida, já limitada entre a criação da conta e hoje."""
     today = dt.date.today()
-
-    created = None
-    if user:
-        created_str = get_user_created_date(user["id"])
-        if created_str:
-            try:
-                created = dt.datetime.strptime(created_str, "%Y-%m-%d").date()
-            except Exception:
-                created = None
-
     min_week_start = _sunday_of_week(created or today)
     max_week_start = _sunday_of_week(today)
 
@@ -63,8 +34,160 @@ def render_weekly_study():
         st.session_state.week_start = max_week_start
 
     st.session_state.week_start = _clamp(st.session_state.week_start, min_week_start, max_week_start)
+    return st.session_state.week_start
+
+
+# ------------------------------------------------------------------------------
+# Gráfico: spec Vega-Lite montada uma vez por (usuário, semana, versão, compacto)
+# ------------------------------------------------------------------------------
+# As duas séries (horas e acertos/erros) vão juntas no spec; a troca TEMPO/QUESTÕES é
+# um parâmetro Vega ligado a um rádio, então alternar não passa pelo servidor.
+# Os dados ficam dentro da camada (e não no "data" do topo), assim o Streamlit manda
+# o spec como JSON, sem converter nada para DataFrame/Arrow.
+
+_SPEC_CACHE_MAX = 256
+_specs: "OrderedDict[tuple, dict]" = OrderedDict()
+_specs_lock = threading.Lock()
+
+_X = {
+    "field": "label", "type": "nominal", "sort": WEEKDAY_LABELS_PT,
+    "axis": {"title": None, "labelColor": "#EDEDED", "tickColor": "#1A1A1A", "labelAngle": 0},
+}
+_TOOLTIP_Q = [
+    {"field": "tipo", "type": "nominal", "title": "Tipo:"},
+    {"field": "valor", "type": "quantitative", "title": "Quantidade:", "format": "d"},
+]
+
+
+def _hover_opacity(param: str) -> dict:
+    return {"condition": {"param": param, "empty": False, "value": 1.0}, "value": 0.8}
+
+
+def build_weekly_chart_spec(week: list[dict], compact: bool) -> dict:
+    """Spec Vega-Lite da semana (7 dias a partir do domingo) com as duas visões."""
+    height = 180 if compact else 200
+    minutos = [d["minutes"] for d in week]
+    hits = [d["hits"] for d in week]
+    mistakes = [d["mistakes"] for d in week]
+
+    # topo DINÂMICO: horas (mínimo 1h; arredonda para 0.5h) e questões (múltiplo de 10)
+    max_h = max(minutos) / 60.0 if minutos else 0.0
+    top_hours = math.ceil(max(1.0, max_h * 1.10) * 2.0) / 2.0
+    max_total = max((h + m for h, m in zip(hits, mistakes)), default=0)
+    top_q = max(10, ((max_total + 9) // 10) * 10)
+
+    # número dentro do segmento só quando ele tiver altura para a fonte
+    font_size = 12
+    min_val_for_label = top_q * (font_size / height)
+
+    values = [
+        {"label": lbl, "tipo": "Tempo", "valor": m / 60.0, "tooltip": fmt_horas(m)}
+        for lbl, m in zip(WEEKDAY_LABELS_PT, minutos)
+    ]
+    values += [{"label": lbl, "tipo": "Acertos", "valor": h} for lbl, h in zip(WEEKDAY_LABELS_PT, hits)]
+    values += [{"label": lbl, "tipo": "Erros", "valor": m} for lbl, m in zip(WEEKDAY_LABELS_PT, mistakes)]
+
+    y_axis = {
+        "title": None, "grid": True, "gridColor": "#2a2a2a", "tickColor": "#2a2a2a",
+        "labelColor": "#EDEDED", "tickCount": 5,
+    }
+    y_scale = {"domainMin": 0, "domainMax": {"expr": f"modo === 'TEMPO' ? {top_hours} : {top_q}"}, "nice": False}
+    questoes = [
+        {"filter": "modo !== 'TEMPO' && datum.tipo !== 'Tempo'"},
+        # 0 = Acertos (embaixo), 1 = Erros (em cima)
+        {"calculate": "datum.tipo === 'Erros' ? 1 : 0", "as": "tipo_order"},
+    ]
+    bar = {"type": "bar", "cornerRadiusTopLeft": 8, "cornerRadiusTopRight": 8}
+
+    return {
+        "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+        "height": height,
+        "padding": {"left": 0, "right": 10, "top": 0, "bottom": 0},
+        "autosize": {"type": "fit", "contains": "padding"},
+        "params": [{"name": "modo", "value": "TEMPO", "bind": {"input": "radio", "options": MODOS}}],
+        "layer": [{
+            "data": {"values": values},
+            "layer": [
+                {   # TEMPO: horas por dia
+                    "transform": [{"filter": "modo === 'TEMPO' && datum.tipo === 'Tempo'"}],
+                    "params": [{"name": "hover_time", "select": {"type": "point", "on": "mouseover", "fields": ["label"]}}],
+                    "mark": bar,
+                    "encoding": {
+                        "x": _X,
+                        "y": {"field": "valor", "type": "quantitative", "scale": y_scale, "axis": y_axis},
+                        "color": {"value": "#51594E"},
+                        "opacity": _hover_opacity("hover_time"),
+                        "tooltip": [{"field": "tooltip", "type": "nominal", "title": "Tempo:"}],
+                    },
+                },
+                {   # QUESTÕES: acertos + erros empilhados (cores fixas)
+                    "transform": questoes,
+                    "params": [{"name": "hover_q", "select": {"type": "point", "on": "mouseover", "fields": ["label", "tipo"]}}],
+                    "mark": bar,
+                    "encoding": {
+                        "x": _X,
+                        "y": {"field": "valor", "type": "quantitative", "stack": "zero", "scale": y_scale, "axis": y_axis},
+                        "color": {
+                            "field": "tipo", "type": "nominal", "legend": None,
+                            "scale": {"domain": ["Acertos", "Erros"], "range": ["#51594E", "#733636"]},
+                        },
+                        "opacity": _hover_opacity("hover_q"),
+                        "order": {"field": "tipo_order", "type": "quantitative", "sort": "ascending"},
+                        "tooltip": _TOOLTIP_Q,
+                    },
+                },
+                {   # QUESTÕES: número no meio de cada segmento
+                    "transform": questoes + [
+                        {"stack": "valor", "groupby": ["label"], "sort": [{"field": "tipo_order", "order": "ascending"}],
+                         "as": ["y0", "y1"], "offset": "zero"},
+                        {"filter": "datum.valor > 0"},
+                        {"filter": f"datum.y1 - datum.y0 >= {min_val_for_label}"},
+                        {"calculate": "(datum.y0 + datum.y1) / 2", "as": "y_mid"},
+                    ],
+                    "mark": {"type": "text", "color": "white", "fontSize": font_size, "fontWeight": "bold"},
+                    "encoding": {
+                        "x": _X,
+                        "y": {"field": "y_mid", "type": "quantitative"},
+                        "text": {"field": "valor", "type": "quantitative"},
+                        "tooltip": _TOOLTIP_Q,
+                        "opacity": _hover_opacity("hover_q"),
+                    },
+                },
+            ],
+        }],
+        "config": {"background": "#1A1A1A", "view": {"stroke": None, "fill": "#1A1A1A"}},
+    }
+
+
+def weekly_chart_spec(user_id: int, week_start: dt.date, week: list[dict], compact: bool) -> dict:
+    """Spec da semana, montada só quando (usuário, semana, versão de dados, compacto) muda."""
+    key = (int(user_id), week_start, data_version(user_id), bool(compact))
+    with _specs_lock:
+        spec = _specs.get(key)
+        if spec is not None:
+            _specs.move_to_end(key)
+            return spec
+    spec = build_weekly_chart_spec(week, compact)
+    with _specs_lock:
+        _specs[key] = spec
+        while len(_specs) > _SPEC_CACHE_MAX:  # versões antigas saem por LRU
+            _specs.popitem(last=False)
+    return spec
+
+
+def render_weekly_study(snapshot: dict):
+    user = get_current_user()
+    if not user:
+        return
+
+    today = dt.date.today()
+    created_str = snapshot["created_date"]
+    created = dt.datetime.strptime(created_str, "%Y-%m-%d").date() if created_str else None
+
+    min_week_start = _sunday_of_week(created or today)
+    max_week_start = _sunday_of_week(today)
 
-    week_start = st.session_state.week_start
+    week_start = resolve_week_start(created)
     week_end = week_start + dt.timedelta(days=6)
 
     can_prev = week_start > min_week_start
@@ -98,10 +221,20 @@ def render_weekly_study():
                 width: 2rem;
             }
 
-            .st-key-pill-semana button { width: 100%;}
-
             div[data-testid="stElementToolbar"] { display: none; }
             div[data-testid="stVegaLiteChart"] details { display: none; }
+
+            /* rádio do parâmetro "modo" (Vega) com cara de pills */
+            .vega-bindings { display: flex; justify-content: flex-end; padding-top: 6px; }
+            .vega-bind-name { display: none; }
+            .vega-bind-radio { display: flex; gap: 6px; }
+            .vega-bind-radio label {
+                padding: 2px 12px; border: 1px solid #2a2a2a; border-radius: 999px;
+                color: #BEBEBE; font-size: 0.8rem; cursor: pointer;
+            }
+            /* o Vega põe o <input> dentro do <label>: some da tela, mas segue clicável */
+            .vega-bind-radio input { position: absolute; opacity: 0; width: 0; height: 0; margin: 0; }
+            .vega-bind-radio label:has(input:checked) { background: #51594E; color: #EDEDED; }
         }
         """
     ):
@@ -149,176 +282,6 @@ def render_weekly_study():
             }
             """
         ):
-            grafico, acoes = st.columns([3, 1])
-
-            with grafico:
-                sunday, saturday = week_range_starting_sunday(week_start)
-                week_dates = [sunday + timedelta(days=i) for i in range(7)]
-                week_keys = [d.strftime("%Y-%m-%d") for d in week_dates]
-
-                # Valor SEMPRE saneado (garantido acima)
-                sel = current_sel
-
-                # Altura usada nos dois gráficos (e na conversão px -> unidades do eixo Y)
-                CHART_HEIGHT = 180 if st.session_state.get("_compact") else 200
-
-                if sel == "TEMPO":
-                    totals_dict = get_total_minutes_by_date_range(user["id"], week_keys[0], week_keys[-1])
-                    minutos = [totals_dict.get(k, 0) for k in week_keys]
-                    horas = [m / 60.0 for m in minutos]
-                    tempo_fmt = [fmt_horas(m) for m in minutos]
-
-                    # topo DINÂMICO (mínimo 1h; arredonda para 0.5h)
-                    import math
-                    max_h = max(horas) if horas else 0.0
-                    raw_top = max(1.0, max_h * 1.10)
-                    top_hours = math.ceil(raw_top * 2.0) / 2.0
-
-                    df = pd.DataFrame({
-                        "label": WEEKDAY_LABELS_PT,
-                        "valor": horas,
-                        "tooltip": tempo_fmt,
-                    })
-
-                    # seleção de hover por dia
-                    hover_time = alt.selection_point(on="mouseover", empty="none", fields=["label"])
-
-                    chart = (
-                        alt.Chart(df)
-                        .mark_bar(cornerRadiusTopLeft=8, cornerRadiusTopRight=8)
-                        .encode(
-                            x=alt.X(
-                                "label:N",
-                                sort=WEEKDAY_LABELS_PT,
-                                axis=alt.Axis(
-                                    title=None, labelColor="#EDEDED", tickColor="#1A1A1A", labelAngle=0
-                                ),
-                            ),
-                            y=alt.Y(
-                                "valor:Q",
-                                scale=alt.Scale(domain=[0, top_hours], nice=False),
-                                axis=alt.Axis(
-                                    title=None,
-                                    grid=True, gridColor="#2a2a2a", tickColor="#2a2a2a",
-                                    labelColor="#EDEDED",
-                                    tickCount=5,
-                                ),
-                            ),
-                            color=alt.value("#51594E"),
-                            opacity=alt.condition(hover_time, alt.value(1.0), alt.value(0.8)),
-                            tooltip=[alt.Tooltip("tooltip:N", title="Tempo:")],
-                        )
-                        .add_params(hover_time)
-                        .properties(height=CHART_HEIGHT, padding={"left": 0, "right": 10, "top": 0, "bottom": 0})
-                        .configure_view(stroke=None, fill="#1A1A1A")
-                        .configure(background="#1A1A1A")
-                    )
-
-                else:
-                    brk = get_questions_breakdown_by_date_range(user["id"], week_keys[0], week_keys[-1])
-
-                    hits = [brk.get(k, {}).get("hits", 0) for k in week_keys]
-                    mistakes = [brk.get(k, {}).get("mistakes", 0) for k in week_keys]
-                    totals = [h + m for h, m in zip(hits, mistakes)]
-
-                    df = pd.DataFrame({
-                        "label": WEEKDAY_LABELS_PT * 2,
-                        "tipo": (["Acertos"] * 7) + (["Erros"] * 7),
-                        "valor": hits + mistakes,
-                    })
-
-                    max_total = max(totals) if totals else 0
-                    top = max(10, ((max_total + 9) // 10) * 10)
-
-                    common_tooltip = [
-                        alt.Tooltip("tipo:N", title="Tipo:"),
-                        alt.Tooltip("valor:Q", title="Quantidade:", format="d"),
-                    ]
-
-                    base = alt.Chart(df).transform_calculate(
-                        # 0 = Acertos (embaixo), 1 = Erros (em cima)
-                        tipo_order="datum.tipo === 'Erros' ? 1 : 0"
-                    )
-
-                    # seleção de hover por dia + tipo
-                    hover_q = alt.selection_point(on="mouseover", empty="none", fields=["label", "tipo"])
-
-                    # barras empilhadas (cores fixas) + hover por OPACIDADE
-                    bars = base.mark_bar(cornerRadiusTopLeft=8, cornerRadiusTopRight=8).encode(
-                        x=alt.X(
-                            "label:N",
-                            sort=WEEKDAY_LABELS_PT,
-                            axis=alt.Axis(title=None, labelColor="#EDEDED", tickColor="#1A1A1A", labelAngle=0),
-                        ),
-                        y=alt.Y(
-                            "valor:Q",
-                            stack="zero",
-                            scale=alt.Scale(domain=[0, top], nice=False),
-                            axis=alt.Axis(
-                                title=None, grid=True, gridColor="#2a2a2a", tickColor="#2a2a2a",
-                                labelColor="#EDEDED", tickCount=5
-                            ),
-                        ),
-                        color=alt.Color(
-                            "tipo:N",
-                            scale=alt.Scale(domain=["Acertos", "Erros"], range=["#51594E", "#733636"]),
-                            legend=None,
-                        ),
-                        opacity=alt.condition(hover_q, alt.value(1.0), alt.value(0.8)),
-                        order=alt.Order("tipo_order:Q", sort="ascending"),
-                        tooltip=common_tooltip,
-                    ).add_params(hover_q)
-
-                    # ===== Mostrar número só quando o segmento tiver altura suficiente =====
-                    FONT_SIZE = 12
-                    PX_NEEDED = FONT_SIZE
-                    min_val_for_label = top * (PX_NEEDED / CHART_HEIGHT)
-
-                    labels = (
-                        base
-                        .transform_stack(
-                            stack="valor",
-                            groupby=["label"],
-                            sort=[alt.SortField("tipo_order", order="ascending")],
-                            as_=["y0", "y1"],
-                            offset="zero",
-                        )
-                        .transform_filter("datum.valor > 0")
-                        .transform_filter(f"datum.y1 - datum.y0 >= {min_val_for_label}")
-                        .transform_calculate(y_mid="(datum.y0 + datum.y1) / 2")
-                        .mark_text(color="white", fontSize=FONT_SIZE, fontWeight="bold")
-                        .encode(
-                            x=alt.X("label:N", sort=WEEKDAY_LABELS_PT),
-                            y=alt.Y("y_mid:Q"),
-                            text=alt.Text("valor:Q"),
-                            order=alt.Order("tipo_order:Q", sort="ascending"),
-                            tooltip=common_tooltip,
-                            opacity=alt.condition(hover_q, alt.value(1.0), alt.value(0.8)),
-                        )
-                    )
-
-                    chart = (bars + labels).properties(
-                        height=CHART_HEIGHT, padding={"left": 0, "right": 10, "top": 0, "bottom": 0}
-                    ).configure_view(stroke=None, fill="#1A1A1A"
-                    ).configure(background="#1A1A1A")
-
-                st.altair_chart(chart, use_container_width=True)
-
-            with acoes:
-                # Função de validação do estado (Opção B)
-                def _ensure_pill_selected():
-                    cur = st.session_state.get("pill-semana")
-                    if cur not in OPTIONS:
-                        st.session_state["pill-semana"] = st.session_state["_last_pill_semana"]
-                    else:
-                        st.session_state["_last_pill_semana"] = cur
-
-                st.pills(
-                    label="Escolha um tipo de gráfico:",
-                    options=OPTIONS,
-                    selection_mode="single",
-                    default=st.session_state["_last_pill_semana"],
-                    label_visibility="collapsed",
-                    key="pill-semana",
-                    on_change=_ensure_pill_selected,
-                )
+            # 7 dias a partir de week_start (domingo), já agregados no snapshot
+            spec = weekly_chart_spec(user["id"], week_start, snapshot["week"], st.session_state.get("_compact"))
+            st.vega_lite_chart(spec, use_container_width=True)